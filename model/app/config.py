@@ -8,8 +8,12 @@ custom_cache_dir.mkdir(exist_ok=True)
 os.environ["HF_HOME"] = str(custom_cache_dir)
 os.environ["HF_HUB_DISABLE_TELEMETRY"] = "1"
 
-from pymongo import MongoClient
-from sentence_transformers import SentenceTransformer
+import threading
+from app.utils.cache import PrefetchCache, SemanticCache
+from app.utils.prefetch import PrefetchExecutor
+from app.utils.embeddings import load_embedding_model
+from app.utils.provider_router import ProviderRouter
+from app.utils.generation_stats import GenerationStats
 
 try:
 	from dotenv import load_dotenv
@@ -24,7 +28,7 @@ except Exception:
 # =========================
 # OLLAMA CONFIG
 # =========================
-OLLAMA_URL = "http://localhost:11434/api/generate"
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/api/generate")
 OLLAMA_MODEL = "phi3"
 
 # =========================
@@ -33,7 +37,58 @@ OLLAMA_MODEL = "phi3"
 USE_GROQ = os.getenv("USE_GROQ", "false").lower() == "true"
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 GROQ_MODEL = os.getenv("GROQ_MODEL", "mixtral-8x7b-32768")  # or llama2-70b-4096
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
+
+# =========================
+# LLM HTTP CLIENT CONFIG
+# =========================
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_POOL_TIMEOUT = float(os.getenv("LLM_POOL_TIMEOUT", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "20"))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "4"))
+
+# =========================
+# LLM ROUTER CONFIG
+# =========================
+# Backends calls may be routed to, most preferred first. By default the
+# USE_GROQ choice comes first and the other backend is the fallback; Groq
+# is only included when it is selected or GROQ_API_KEY is set. The
+# resolved order is logged at startup.
+LLM_PROVIDER_NAMES = ("ollama", "groq")
+LLM_PROVIDERS = list(dict.fromkeys(
+    p.strip().lower() for p in os.getenv("LLM_PROVIDERS", "").split(",") if p.strip()
+))
+_unknown_providers = [p for p in LLM_PROVIDERS if p not in LLM_PROVIDER_NAMES]
+if _unknown_providers:
+    raise ValueError(
+        f"Unknown LLM_PROVIDERS entries {_unknown_providers}, expected a comma-separated list of {LLM_PROVIDER_NAMES}"
+    )
+if not LLM_PROVIDERS:
+    LLM_PROVIDERS = ["groq", "ollama"] if USE_GROQ else ["ollama", "groq"]
+    if not (USE_GROQ or GROQ_API_KEY):
+        LLM_PROVIDERS.remove("groq")
+# Calls kept per backend for latency / error rate
+LLM_ROUTER_WINDOW = int(os.getenv("LLM_ROUTER_WINDOW", "50"))
+# Consecutive failures that open a backend's circuit, and seconds it stays open
+LLM_CIRCUIT_FAILURES = int(os.getenv("LLM_CIRCUIT_FAILURES", "3"))
+LLM_CIRCUIT_COOLDOWN = float(os.getenv("LLM_CIRCUIT_COOLDOWN", "30"))
+# Ranking score is avg latency * (1 + penalty * error rate)
+LLM_ROUTER_ERROR_PENALTY = float(os.getenv("LLM_ROUTER_ERROR_PENALTY", "4"))
+
+# =========================
+# STRUCTURED OUTPUT CONFIG
+# =========================
+# Send the JSON Schema of the expected output (app/models.py) with each call
+# so the provider constrains decoding; the retry loops stay as a fallback.
+# Ollama takes the schema as `format`. Groq gets response_format
+# "json_object" by default, or "json_schema" for models that support it.
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "true").lower() == "true"
+GROQ_RESPONSE_FORMAT = os.getenv("GROQ_RESPONSE_FORMAT", "json_object").lower()
+# Ollama accepts a schema as `format` from 0.5 on; older servers only take
+# "json". Set to false for those, otherwise the first call rejected over
+# its format switches the process to "json" (see app/utils/llm_client.py)
+OLLAMA_SCHEMA_FORMAT = os.getenv("OLLAMA_SCHEMA_FORMAT", "true").lower() == "true"
 
 # =========================
 # MONGODB CONFIG
@@ -41,20 +96,203 @@ GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
 DB_NAME = os.getenv("DB_NAME", "adaptive_quiz")
 COLLECTION = os.getenv("COLLECTION", "sessions")
+QUESTION_BANK_COLLECTION = os.getenv("QUESTION_BANK_COLLECTION", "question_bank")
+SESSION_HISTORY_COLLECTION = os.getenv("SESSION_HISTORY_COLLECTION", "session_history")
+# Session history is stored in bucket documents of this many items each
+SESSION_HISTORY_BUCKET_SIZE = int(os.getenv("SESSION_HISTORY_BUCKET_SIZE", "50"))
+# Most recent history items rendered into the quiz prompt. Dedup always
+# checks the whole session (only question_text and the float16 embedding
+# are read for it)
+SESSION_HISTORY_WINDOW = int(os.getenv("SESSION_HISTORY_WINDOW", "200"))
+# Connection pool and timeouts for the async (motor) client
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+# "await" saves served questions before responding, "background" saves them
+# after the response is sent (reads of the session still wait for the write)
+MONGO_WRITE_MODE = os.getenv("MONGO_WRITE_MODE", "await").lower()
 
 # =========================
 # QUIZ CONFIG
 # =========================
 MAX_RETRIES = 5
 SEMANTIC_THRESHOLD = 0.85
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+# torch, torch-int8 or onnx (see app/utils/embeddings.py); bench_embeddings.py
+# compares their latency and memory, tests/test_embedding_backends.py their
+# dedup decisions
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE") or None
+# Concurrent encode calls are batched for up to this long (or this many texts)
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+EMBEDDING_BATCH_MAX = int(os.getenv("EMBEDDING_BATCH_MAX", "64"))
+# Seconds between warm-up retries while the model or Mongo is unavailable
+WARMUP_RETRY_INTERVAL = float(os.getenv("WARMUP_RETRY_INTERVAL", "5"))
+# Stream every generation attempt and abort it on the first schema violation
+QUIZ_STREAM_VALIDATION = os.getenv("QUIZ_STREAM_VALIDATION", "true").lower() == "true"
+# Prompt budget (approx. tokens) for the SESSION HISTORY block. Only question
+# stems are sent; the oldest are dropped once over budget, since embedding
+# dedup still rejects repeats of anything not shown to the model.
+QUIZ_HISTORY_TOKEN_BUDGET = int(os.getenv("QUIZ_HISTORY_TOKEN_BUDGET", "800"))
+QUIZ_HISTORY_STEM_CHARS = int(os.getenv("QUIZ_HISTORY_STEM_CHARS", "200"))
+# Completion budget per question for /quiz/batch and batched bank refills
+QUIZ_BATCH_TOKENS_PER_QUESTION = int(os.getenv("QUIZ_BATCH_TOKENS_PER_QUESTION", "600"))
+# Hedged generation: keep this many attempts in flight at once (1 = the
+# sequential retry loop) and start at most QUIZ_HEDGE_BUDGET attempts per
+# question. SSE requests always use the sequential loop.
+QUIZ_HEDGE_ATTEMPTS = int(os.getenv("QUIZ_HEDGE_ATTEMPTS", "1"))
+QUIZ_HEDGE_BUDGET = int(os.getenv("QUIZ_HEDGE_BUDGET", str(MAX_RETRIES)))
+
+# =========================
+# MCQ CONFIG
+# =========================
+# /mcq/generate_mcq splits large requests into concurrent chunks and only
+# regenerates the shortfall (failed chunks, duplicates) for a few rounds
+MCQ_CHUNK_SIZE = int(os.getenv("MCQ_CHUNK_SIZE", "5"))
+MCQ_MAX_PARALLEL_CHUNKS = int(os.getenv("MCQ_MAX_PARALLEL_CHUNKS", "10"))
+MCQ_CHUNK_RETRIES = int(os.getenv("MCQ_CHUNK_RETRIES", "2"))
+MCQ_TOKENS_PER_QUESTION = int(os.getenv("MCQ_TOKENS_PER_QUESTION", "400"))
+# Largest `n` one request may ask for; bigger requests are rejected (422)
+# before any LLM call is made
+MCQ_MAX_QUESTIONS = int(os.getenv("MCQ_MAX_QUESTIONS", "50"))
+
+# =========================
+# STATISTICS CONFIG
+# =========================
+# Questions whose embedding is at least this similar to a topic centroid
+# are grouped into that topic
+STATISTICS_TOPIC_THRESHOLD = float(os.getenv("STATISTICS_TOPIC_THRESHOLD", "0.55"))
+# Default for the use_llm query parameter. Off: rule-based recommendations
+# keep /statistics/analyze free of LLM latency; callers opt in per request
+STATISTICS_USE_LLM = os.getenv("STATISTICS_USE_LLM", "false").lower() == "true"
+# /statistics/analyze_batch: most test data items per request, and how many
+# recommendation LLM calls may run at once when use_llm=true
+STATISTICS_BATCH_MAX_ITEMS = int(os.getenv("STATISTICS_BATCH_MAX_ITEMS", "1000"))
+STATISTICS_BATCH_LLM_CONCURRENCY = int(os.getenv("STATISTICS_BATCH_LLM_CONCURRENCY", "4"))
+
+# =========================
+# QUESTION BANK CONFIG
+# =========================
+# Pre-generated questions per (domain, program, level) bucket. Background
+# workers refill a bucket up to the high-water mark once it drops below the
+# low-water mark; questions retire after being served MAX_SERVES times.
+# A bucket is only filled once it has been requested MIN_REQUESTS times
+# within DEMAND_WINDOW seconds, so one-off parameter combinations do not
+# cost a full refill of LLM calls.
+QUESTION_BANK_ENABLED = os.getenv("QUESTION_BANK_ENABLED", "true").lower() == "true"
+QUESTION_BANK_LOW_WATER = int(os.getenv("QUESTION_BANK_LOW_WATER", "10"))
+QUESTION_BANK_HIGH_WATER = int(os.getenv("QUESTION_BANK_HIGH_WATER", "25"))
+QUESTION_BANK_MAX_SERVES = int(os.getenv("QUESTION_BANK_MAX_SERVES", "50"))
+QUESTION_BANK_SCAN_LIMIT = int(os.getenv("QUESTION_BANK_SCAN_LIMIT", "20"))
+QUESTION_BANK_WORKERS = int(os.getenv("QUESTION_BANK_WORKERS", "2"))
+QUESTION_BANK_CHECK_INTERVAL = float(os.getenv("QUESTION_BANK_CHECK_INTERVAL", "30"))
+QUESTION_BANK_SWEEP_INTERVAL = float(os.getenv("QUESTION_BANK_SWEEP_INTERVAL", "300"))
+# Questions requested per LLM call while refilling
+QUESTION_BANK_BATCH_SIZE = int(os.getenv("QUESTION_BANK_BATCH_SIZE", "5"))
+QUESTION_BANK_MIN_REQUESTS = int(os.getenv("QUESTION_BANK_MIN_REQUESTS", "2"))
+QUESTION_BANK_DEMAND_WINDOW = float(os.getenv("QUESTION_BANK_DEMAND_WINDOW", "3600"))
+# Buckets whose demand and last refill check are remembered (LRU)
+QUESTION_BANK_MAX_TRACKED_BUCKETS = int(os.getenv("QUESTION_BANK_MAX_TRACKED_BUCKETS", "1024"))
+
+# =========================
+# PREFETCH CACHE CONFIG
+# =========================
+PREFETCH_CACHE_MAX_SIZE = int(os.getenv("PREFETCH_CACHE_MAX_SIZE", "1000"))
+PREFETCH_CACHE_TTL = float(os.getenv("PREFETCH_CACHE_TTL", "900"))
+# How many questions ahead to prefetch per session
+PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", "1"))
+# Concurrent prefetch jobs, and the cap on queued + running jobs
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "4"))
+PREFETCH_MAX_PENDING = int(os.getenv("PREFETCH_MAX_PENDING", "64"))
+
+# =========================
+# RESPONSE CACHE CONFIG
+# =========================
+# Validated /curriculum and /topics responses, matched by prompt hash or by
+# prompt embedding similarity
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_SIZE = int(os.getenv("RESPONSE_CACHE_MAX_SIZE", "500"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.92"))
+
+# =========================
+# LOGGING CONFIG
+# =========================
+# DEBUG, INFO, WARNING or ERROR. At INFO each request logs one access line;
+# per-attempt detail is DEBUG
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" (human-readable) or "json" (one object per line)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# Fraction of raw LLM payloads dumped at DEBUG, and the characters kept
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.1"))
+LOG_PAYLOAD_CHARS = int(os.getenv("LOG_PAYLOAD_CHARS", "500"))
+
+# =========================
+# TRACING CONFIG
+# =========================
+# Per-stage timings (history load, LLM attempts, parsing, dedup, save)
+# returned in a Server-Timing response header
+TRACE_SERVER_TIMING = os.getenv("TRACE_SERVER_TIMING", "true").lower() == "true"
+# Also append every request's spans to this file as Chrome trace events
+# (open in chrome://tracing or ui.perfetto.dev); empty disables
+TRACE_FILE = os.getenv("TRACE_FILE", "")
 
 # =========================
 # PERSISTENT STATE
 # =========================
-mongo = MongoClient(MONGO_URL)
-db = mongo[DB_NAME]
-sessions = db[COLLECTION]
+# The Mongo client and the embedding model are created on first use (or by
+# the startup warm-up, see app/utils/warmup.py) so importing the app does
+# not pull in torch or open connections.
+_mongo = None
+_mongo_lock = threading.Lock()
+_embedding_model = None
+_embedding_lock = threading.Lock()
+
+def get_mongo():
+    """Return the shared AsyncIOMotorClient, creating it on first use"""
+    global _mongo
+    if _mongo is None:
+        with _mongo_lock:
+            if _mongo is None:
+                from motor.motor_asyncio import AsyncIOMotorClient
+                _mongo = AsyncIOMotorClient(
+                    MONGO_URL,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                )
+    return _mongo
+
+def get_collection(name: str):
+    """Return a collection of DB_NAME on the shared client"""
+    return get_mongo()[DB_NAME][name]
+
+def get_embedding_model():
+    """Return the embedding model for EMBEDDING_BACKEND, loading it on first use"""
+    global _embedding_model
+    if _embedding_model is None:
+        with _embedding_lock:
+            if _embedding_model is None:
+                _embedding_model = load_embedding_model(
+                    EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME, EMBEDDING_ONNX_FILE
+                )
+    return _embedding_model
 
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+def embedding_model_loaded() -> bool:
+    return _embedding_model is not None
 
-PREFETCH_CACHE = {}
+PREFETCH_CACHE = PrefetchCache(PREFETCH_CACHE_MAX_SIZE, PREFETCH_CACHE_TTL)
+PREFETCH_EXECUTOR = PrefetchExecutor(PREFETCH_WORKERS, PREFETCH_MAX_PENDING)
+RESPONSE_CACHE = SemanticCache(RESPONSE_CACHE_MAX_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_THRESHOLD)
+GENERATION_STATS = GenerationStats()
+LLM_ROUTER = ProviderRouter(
+    LLM_PROVIDERS, LLM_ROUTER_WINDOW, LLM_CIRCUIT_FAILURES, LLM_CIRCUIT_COOLDOWN, LLM_ROUTER_ERROR_PENALTY
+)
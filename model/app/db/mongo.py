@@ -1,36 +1,410 @@
-from app.config import sessions
-from typing import List, Dict, Any, Optional
+import asyncio
+from bson.binary import Binary
+from datetime import datetime, timezone
+import numpy as np
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from app.config import (
+    get_collection,
+    COLLECTION,
+    SESSION_HISTORY_COLLECTION,
+    QUESTION_BANK_COLLECTION,
+    QUESTION_BANK_MAX_SERVES,
+    SESSION_HISTORY_BUCKET_SIZE,
+)
+from app.utils.semantic import encode_texts_async, embedding_to_binary, embedding_from_binary
+from app.utils.metrics import MONGO_OPERATION_SECONDS, timed
+from app.utils.log import get_logger
+from typing import Awaitable, List, Dict, Any, Optional, Set, Tuple
 
+log = get_logger("mongo")
 
-def load_session_history(session_id: str) -> List[Dict[str, Any]]:
+# Background history writes per session (see write_in_background).
+# Reads of a session wait for its pending writes so dedup never misses
+# a question that was just served.
+_pending_writes: Dict[str, Set[asyncio.Task]] = {}
+
+
+def _sessions():
+    return get_collection(COLLECTION)
+
+
+def _session_history():
+    return get_collection(SESSION_HISTORY_COLLECTION)
+
+
+def _question_bank():
+    return get_collection(QUESTION_BANK_COLLECTION)
+
+
+# =========================
+# SESSION HISTORY
+# =========================
+# The sessions collection only keeps a per-session `history_count` counter.
+# Items live in session_history bucket documents keyed by
+# (session_id, bucket), each holding up to SESSION_HISTORY_BUCKET_SIZE items
+# tagged with their sequence number, so reads of the last N items touch a
+# fixed number of small documents however long the session runs.
+# Sessions written before bucketing keep a `history` array on the session
+# document; it is moved into buckets the first time it is read.
+
+async def ensure_session_history_indexes() -> None:
+    """Create the (session_id, bucket) index used by history reads and writes."""
+    await _session_history().create_index(
+        [("session_id", ASCENDING), ("bucket", ASCENDING)],
+        unique=True,
+    )
+    await _sessions().create_index([("session_id", ASCENDING)])
+
+
+@timed(MONGO_OPERATION_SECONDS, "push_history")
+async def _push_history_items(session_id: str, items: List[Dict[str, Any]]) -> None:
+    """Append items (which carry `seq`) to their bucket documents."""
+    by_bucket: Dict[int, List[Dict[str, Any]]] = {}
+    for item in items:
+        by_bucket.setdefault(item["seq"] // SESSION_HISTORY_BUCKET_SIZE, []).append(item)
+    for bucket, bucket_items in by_bucket.items():
+        await _session_history().update_one(
+            {"session_id": session_id, "bucket": bucket},
+            {
+                "$push": {"items": {"$each": bucket_items}},
+                "$inc": {"count": len(bucket_items)},
+                "$setOnInsert": {"created_at": datetime.now(timezone.utc)},
+            },
+            upsert=True,
+        )
+
+
+@timed(MONGO_OPERATION_SECONDS, "migrate_legacy_history")
+async def _migrate_legacy_history(session_id: str) -> bool:
+    """Move a pre-bucketing `history` array into bucket documents.
+
+    The array is claimed with an atomic $unset, so concurrent readers
+    never migrate it twice. Returns True if anything was migrated.
+    """
+    doc = await _sessions().find_one_and_update(
+        {"session_id": session_id, "history": {"$exists": True}},
+        {"$unset": {"history": ""}},
+        projection={"history": 1},
+        return_document=ReturnDocument.BEFORE,
+    )
+    legacy = doc.get("history", []) if doc else []
+    if not legacy:
+        return False
+
+    counter = await _sessions().find_one_and_update(
+        {"session_id": session_id},
+        {"$inc": {"history_count": len(legacy)}},
+        projection={"history_count": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    start = counter["history_count"] - len(legacy)
+    items = [dict(item, seq=start + i) for i, item in enumerate(legacy)]
+    await _push_history_items(session_id, items)
+    log.info("Migrated %d legacy history items for session %s", len(items), session_id)
+    return True
+
+
+@timed(MONGO_OPERATION_SECONDS, "load_history")
+async def _load_history(
+    session_id: str,
+    last_n: Optional[int],
+    fields: Optional[List[str]],
+    include_embedding: bool,
+) -> List[Dict[str, Any]]:
+    """Read history items oldest-first, optionally only the last `last_n`."""
+    if fields is not None:
+        projection: Dict[str, Any] = {"_id": 0, "items.seq": 1}
+        for field in fields:
+            projection[f"items.{field}"] = 1
+        if include_embedding:
+            projection["items.embedding"] = 1
+    else:
+        projection = {"_id": 0, "items": 1}
+
+    cursor = _session_history().find({"session_id": session_id}, projection).sort("bucket", DESCENDING)
+    if last_n is not None:
+        # The newest bucket may be partly filled, hence the extra one
+        cursor = cursor.limit(-(-last_n // SESSION_HISTORY_BUCKET_SIZE) + 1)
+    buckets = await cursor.to_list(length=None)
+
+    if not buckets and await _migrate_legacy_history(session_id):
+        return await _load_history(session_id, last_n, fields, include_embedding)
+
+    items = [item for doc in reversed(buckets) for item in doc.get("items", [])]
+    items.sort(key=lambda item: item.get("seq", 0))
+    if last_n is not None:
+        items = items[-last_n:] if last_n > 0 else []
+    for item in items:
+        item.pop("seq", None)
+        if not include_embedding:
+            item.pop("embedding", None)
+    return items
+
+
+async def load_session_history(
+    session_id: str,
+    last_n: Optional[int] = None,
+    fields: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
     """Load session history for a quiz session from MongoDB.
 
     Each history item is a dict that includes at minimum `question_text`.
     This is used by exact_repeat/semantic_repeat to avoid duplicates.
+    `last_n` limits the read to the most recent items and `fields` to the
+    given item fields. Stored embeddings are left out; use
+    load_session_history_with_embeddings when the dedup matrix is needed.
     """
-    doc = sessions.find_one({"session_id": session_id})
-    return doc.get("history", []) if doc else []
+    await wait_for_pending_writes(session_id)
+    return await _load_history(session_id, last_n, fields, include_embedding=False)
 
 
-def save_question(
+async def load_session_history_with_embeddings(
+    session_id: str,
+    last_n: Optional[int] = None,
+    fields: Optional[List[str]] = None,
+) -> Tuple[List[Dict[str, Any]], List[Optional[np.ndarray]]]:
+    """Load session history plus the embedding stored with each item.
+
+    Returns the history items (without the raw `embedding` field) and a list
+    aligned with them holding float32 vectors, or None for legacy items that
+    were saved before embeddings were persisted.
+    """
+    await wait_for_pending_writes(session_id)
+    history = await _load_history(session_id, last_n, fields, include_embedding=True)
+    embeddings: List[Optional[np.ndarray]] = []
+    for item in history:
+        data = item.pop("embedding", None)
+        embeddings.append(embedding_from_binary(data) if data else None)
+    return history, embeddings
+
+
+async def save_question(
     session_id: str,
     question_text: str,
     options: Optional[list] = None,
     correct_option_index: Optional[int] = None,
+    embedding: Optional[np.ndarray] = None,
 ) -> None:
     """Append a generated question to the session history in MongoDB.
 
     Stores question text, options, and correct index so that the backend
-    can track what has already been asked for this session.
+    can track what has already been asked for this session. The question
+    embedding is stored alongside as float16 bytes so later dedup checks
+    never re-encode it; it is computed here if the caller has none.
+    The item gets the next sequence number from the session's counter and
+    is pushed into the matching bucket document.
+    """
+    await save_questions(
+        session_id,
+        [{"question_text": question_text, "options": options, "correct_option_index": correct_option_index}],
+        [embedding],
+    )
+
+
+@timed(MONGO_OPERATION_SECONDS, "save_questions")
+async def save_questions(
+    session_id: str,
+    questions: List[Dict[str, Any]],
+    embeddings: Optional[List[Optional[np.ndarray]]] = None,
+) -> None:
+    """Append several questions to the session history in one write.
+
+    Reserves a contiguous range of sequence numbers with a single counter
+    update, then pushes the items bucket by bucket (usually one update).
+    Missing embeddings are encoded together.
     """
-    history_item: Dict[str, Any] = {"question_text": question_text}
-    if options is not None:
-        history_item["options"] = options
-    if correct_option_index is not None:
-        history_item["correct_option_index"] = correct_option_index
+    if not questions:
+        return
+    embeddings = list(embeddings) if embeddings is not None else [None] * len(questions)
+    missing = [i for i, emb in enumerate(embeddings) if emb is None]
+    if missing:
+        encoded = await encode_texts_async([questions[i]["question_text"] for i in missing])
+        for i, emb in zip(missing, encoded):
+            embeddings[i] = emb
 
-    sessions.update_one(
+    counter = await _sessions().find_one_and_update(
         {"session_id": session_id},
-        {"$push": {"history": history_item}},
+        {"$inc": {"history_count": len(questions)}},
+        projection={"history_count": 1},
         upsert=True,
+        return_document=ReturnDocument.AFTER,
     )
+    start = counter["history_count"] - len(questions)
+
+    items = []
+    for i, (question, embedding) in enumerate(zip(questions, embeddings)):
+        history_item: Dict[str, Any] = {
+            "seq": start + i,
+            "question_text": question["question_text"],
+            "embedding": Binary(embedding_to_binary(embedding)),
+        }
+        if question.get("options") is not None:
+            history_item["options"] = question["options"]
+        if question.get("correct_option_index") is not None:
+            history_item["correct_option_index"] = question["correct_option_index"]
+        items.append(history_item)
+
+    await _push_history_items(session_id, items)
+
+
+def write_in_background(session_id: str, write: Awaitable[None]) -> asyncio.Task:
+    """Run a history write as a background task so the response is not delayed.
+
+    Failures are logged; the next history read for the session waits for
+    the write to finish.
+    """
+    task = asyncio.ensure_future(write)
+    _pending_writes.setdefault(session_id, set()).add(task)
+    task.add_done_callback(lambda t: _write_finished(session_id, t))
+    return task
+
+
+def _write_finished(session_id: str, task: asyncio.Task) -> None:
+    pending = _pending_writes.get(session_id)
+    if pending is not None:
+        pending.discard(task)
+        if not pending:
+            del _pending_writes[session_id]
+    if not task.cancelled() and task.exception() is not None:
+        log.error("Background history write failed for session %s: %s", session_id, task.exception())
+
+
+async def wait_for_pending_writes(session_id: Optional[str] = None) -> None:
+    """Wait for background history writes of one session (or all of them)."""
+    if session_id is None:
+        tasks = [task for pending in _pending_writes.values() for task in pending]
+    else:
+        tasks = list(_pending_writes.get(session_id, ()))
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# =========================
+# QUESTION BANK
+# =========================
+# Documents are keyed by (domain_name, program_name, level) and carry the
+# full question payload plus its float16 embedding and a served_count.
+
+def _bank_filter(domain_name: str, program_name: str, level: int) -> Dict[str, Any]:
+    return {
+        "domain_name": domain_name,
+        "program_name": program_name,
+        "level": level,
+        "served_count": {"$lt": QUESTION_BANK_MAX_SERVES},
+    }
+
+
+async def ensure_question_bank_indexes() -> None:
+    """Create the compound index used by bank lookups and counts."""
+    await _question_bank().create_index(
+        [
+            ("domain_name", ASCENDING),
+            ("program_name", ASCENDING),
+            ("level", ASCENDING),
+            ("served_count", ASCENDING),
+        ]
+    )
+
+
+@timed(MONGO_OPERATION_SECONDS, "count_bank_questions")
+async def count_bank_questions(domain_name: str, program_name: str, level: int) -> int:
+    """Count questions in a bucket that have not been retired yet."""
+    return await _question_bank().count_documents(_bank_filter(domain_name, program_name, level))
+
+
+@timed(MONGO_OPERATION_SECONDS, "load_bank_questions")
+async def load_bank_questions(
+    domain_name: str,
+    program_name: str,
+    level: int,
+    exclude_texts: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+) -> Tuple[List[Dict[str, Any]], List[Optional[np.ndarray]]]:
+    """Load active bank questions for a bucket, least-served first.
+
+    `exclude_texts` drops questions the session has already seen verbatim.
+    Returns the question docs (without `embedding`) and their embeddings.
+    """
+    query = _bank_filter(domain_name, program_name, level)
+    if exclude_texts:
+        query["question_text"] = {"$nin": exclude_texts}
+    cursor = _question_bank().find(query).sort("served_count", ASCENDING)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    docs = await cursor.to_list(length=None)
+    embeddings: List[Optional[np.ndarray]] = []
+    for doc in docs:
+        data = doc.pop("embedding", None)
+        embeddings.append(embedding_from_binary(data) if data else None)
+    return docs, embeddings
+
+
+async def add_bank_question(
+    domain_name: str,
+    program_name: str,
+    level: int,
+    question: Dict[str, Any],
+    embedding: np.ndarray,
+) -> None:
+    """Insert a validated question into a bank bucket."""
+    await add_bank_questions(domain_name, program_name, level, [question], [embedding])
+
+
+@timed(MONGO_OPERATION_SECONDS, "add_bank_questions")
+async def add_bank_questions(
+    domain_name: str,
+    program_name: str,
+    level: int,
+    questions: List[Dict[str, Any]],
+    embeddings: List[np.ndarray],
+) -> None:
+    """Insert several validated questions into a bank bucket in one write."""
+    if not questions:
+        return
+    now = datetime.now(timezone.utc)
+    docs = [
+        {
+            "domain_name": domain_name,
+            "program_name": program_name,
+            "level": level,
+            "question_id": question["question_id"],
+            "question_text": question["question_text"],
+            "options": question["options"],
+            "correct_option_index": question["correct_option_index"],
+            "hint": question["hint"],
+            "explanation": question["explanation"],
+            "code_context": question.get("code_context"),
+            "embedding": Binary(embedding_to_binary(embedding)),
+            "served_count": 0,
+            "created_at": now,
+        }
+        for question, embedding in zip(questions, embeddings)
+    ]
+    await _question_bank().insert_many(docs)
+
+
+@timed(MONGO_OPERATION_SECONDS, "mark_bank_question_served")
+async def mark_bank_question_served(bank_id: Any) -> None:
+    """Bump served_count so heavily used questions eventually retire."""
+    await _question_bank().update_one({"_id": bank_id}, {"$inc": {"served_count": 1}})
+
+
+@timed(MONGO_OPERATION_SECONDS, "list_bank_buckets")
+async def list_bank_buckets() -> List[Tuple[str, str, int]]:
+    """List every (domain_name, program_name, level) bucket in the bank."""
+    pipeline = [
+        {
+            "$group": {
+                "_id": {
+                    "domain_name": "$domain_name",
+                    "program_name": "$program_name",
+                    "level": "$level",
+                }
+            }
+        }
+    ]
+    return [
+        (row["_id"]["domain_name"], row["_id"]["program_name"], row["_id"]["level"])
+        async for row in _question_bank().aggregate(pipeline)
+    ]
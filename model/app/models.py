@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 
 
 class QuizHistoryItem(BaseModel):
@@ -16,6 +16,10 @@ class QuizRequest(BaseModel):
     history: List[QuizHistoryItem] = []
 
 
+class QuizBatchRequest(QuizRequest):
+    count: int = Field(default=5, ge=1, le=10)
+
+
 class StatisticsQuestion(BaseModel):
     question_id: str
     question_text: str
@@ -75,6 +79,52 @@ class StatisticsApiResponse(BaseModel):
     topic_breakdown: List[TopicBreakdownItem]
 
 
+class Percentiles(BaseModel):
+    p10: float
+    p25: float
+    p50: float
+    p75: float
+    p90: float
+
+
+class LearnerStatistics(BaseModel):
+    index: int  # position of the test data in the batch
+    domain_name: str
+    program_name: str
+    level_id: str
+    question_count: int
+    summary: StatisticsSummary
+    time_percentiles: Percentiles
+    strong_topics: List[TopicConfidence]
+    weak_topics: List[TopicConfidence]
+    recommendations: List[str]
+    topic_breakdown: List[TopicBreakdownItem]
+
+
+class CohortStatistics(BaseModel):
+    learners: int
+    questions: int
+    accuracy_percent: float  # over all questions
+    avg_time_seconds: float
+    accuracy_percentiles: Percentiles  # of per-learner accuracy
+    time_percentiles: Percentiles  # of every time_taken_seconds
+    avg_time_percentiles: Percentiles  # of per-learner average time
+    speed_profiles: Dict[str, int]
+    weak_topics: List[TopicConfidence]
+    topic_breakdown: List[TopicBreakdownItem]
+
+
+class BatchItemError(BaseModel):
+    index: int
+    error: str
+
+
+class StatisticsBatchResponse(BaseModel):
+    learners: List[LearnerStatistics]
+    cohort: CohortStatistics
+    errors: List[BatchItemError] = []
+
+
 class NextLevelSubtopic(BaseModel):
     order: int
     title: str
@@ -100,3 +150,88 @@ class NextLevelTopicsResponse(BaseModel):
     next_level_id: str
     balance_strategy: Optional[str] = None
     subtopics: List[NextLevelSubtopic]
+
+
+# =========================
+# LLM OUTPUT SCHEMAS
+# =========================
+# Shapes the prompts ask the model for. Their JSON Schema is sent to
+# providers that support constrained decoding (see app/utils/llm_client.py);
+# the routes still validate the result.
+
+Difficulty = Literal["Beginner", "Intermediate", "Advanced", "Expert"]
+
+
+class QuizQuestionOutput(BaseModel):
+    question_id: str
+    question_text: str
+    options: List[str] = Field(min_length=4, max_length=4)
+    correct_option_index: int = Field(ge=0, le=3)
+    hint: str
+    explanation: str
+    code_context: Optional[str] = None
+
+
+class QuizBatchOutput(BaseModel):
+    questions: List[QuizQuestionOutput]
+
+
+class MCQOutput(BaseModel):
+    question: str
+    options: List[str] = Field(min_length=4, max_length=4)
+    correct_answer: str
+    hint: str
+    explanation: str
+    code_context: Optional[str] = None
+
+
+class MCQBatchOutput(BaseModel):
+    mcqs: List[MCQOutput]
+
+
+class TopicOutput(BaseModel):
+    topic_id: int
+    title: str
+    description: str
+    difficulty: Difficulty
+    suggested_questions: int
+
+
+class TopicsOutput(BaseModel):
+    main_topic: str
+    total_topics: int
+    topics: List[TopicOutput]
+
+
+class CurriculumProgramOutput(BaseModel):
+    program_order: int = Field(ge=1, le=5)
+    title: str
+    difficulty: Difficulty
+    description: str
+    key_topics: List[str]
+
+
+class CurriculumOutput(BaseModel):
+    main_topic: str
+    programs: List[CurriculumProgramOutput] = Field(min_length=4, max_length=5)
+
+
+class RecommendationsOutput(BaseModel):
+    recommendations: List[str] = Field(min_length=5, max_length=5)
+
+
+class NextLevelSubtopicOutput(BaseModel):
+    order: int
+    title: str
+    type: Literal["Remediation", "Practice", "Extension"]
+    objective: str
+    estimated_time_minutes: int
+
+
+class NextLevelTopicsOutput(BaseModel):
+    domain_name: str
+    program_name: str
+    current_level_id: str
+    next_level_id: str
+    balance_strategy: str
+    subtopics: List[NextLevelSubtopicOutput] = Field(min_length=10, max_length=15)
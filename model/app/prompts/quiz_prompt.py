@@ -54,3 +54,63 @@ OUTPUT ONLY THE JSON OBJECT. NO EXPLANATION TEXT BEFORE OR AFTER.
 <|end|>
 <|assistant|>
 """
+
+QUIZ_BATCH_PROMPT_TEMPLATE = """
+<|system|>
+You are an AI Examiner for an Adaptive Quiz System.
+
+STRICT NON-NEGOTIABLE RULES:
+- Output ONLY valid JSON with NO extra text
+- Generate EXACTLY {count} new questions, each on a DIFFERENT concept
+- Every question has EXACTLY 4 options
+- correct_option_index MUST be 0, 1, 2, or 3 (REQUIRED - NEVER -1, NEVER null, NEVER missing)
+- The correct_option_index must point to the ACTUAL correct answer in the options array
+- hint and explanation are MANDATORY for every question
+- DO NOT repeat any previous question or any other question in this batch
+- DO NOT reuse the same scenario, wording, or concept as questions in SESSION HISTORY
+
+<|end|>
+<|user|>
+Context:
+- Domain: {domain_name}
+- Program: {program_name}
+- Target Level: {level_description} (Level {level_int}/5)
+
+SESSION HISTORY (DO NOT REPEAT):
+{history_json}
+
+INSTRUCTIONS:
+1. Create {count} NEW questions based on the domain and program (NOT in history), each focusing on a different concept, use-case, or scenario.
+2. Questions should be CONCEPTUAL - NO code snippets or code examples.
+3. Write 4 distinct options per question that are all plausible.
+4. Choose ONE option as the correct answer and set correct_option_index to its position (0, 1, 2, or 3).
+5. Provide a helpful hint without revealing the answer.
+6. Provide a clear explanation of why the answer is correct.
+7. Always set code_context to null (no code examples).
+8. Vary the type of questions (theory, real-world use, edge cases, best practices).
+
+EXAMPLE OUTPUT (for 1 question; return {count} inside "questions"):
+{{
+  "questions": [
+    {{
+      "question_id": "Q-Java-001",
+      "question_text": "What is the correct way to declare a String in Java?",
+      "options": [
+        "String name = \\"John\\";",
+        "str name = \\"John\\";",
+        "text name = \\"John\\";",
+        "character name = \\"John\\";"
+      ],
+      "correct_option_index": 0,
+      "hint": "Look for the Java keyword that represents text data.",
+      "explanation": "In Java, the String class (capital S) is used for text. Option 0 is correct.",
+      "code_context": null
+    }}
+  ]
+}}
+
+OUTPUT ONLY THE JSON OBJECT. NO EXPLANATION TEXT BEFORE OR AFTER.
+
+<|end|>
+<|assistant|>
+"""
@@ -1,12 +1,17 @@
 from fastapi import APIRouter, Request, HTTPException
-import requests
 import json
-from app.config import OLLAMA_URL, OLLAMA_MODEL, USE_GROQ, GROQ_API_KEY, GROQ_MODEL, GROQ_API_URL
+from app.config import GENERATION_STATS
+from app.models import CurriculumOutput
 from app.prompts.curriculum_prompt import CURRICULUM_PROMPT_TEMPLATE
 from app.utils.text_processing import clean_json_string
 from app.utils.validation import validate_curriculum
+from app.utils.llm_client import generate
+from app.utils.response_cache import lookup_response, store_response
+from app.utils.log import get_logger
+from app.utils.tracing import span
 
 router = APIRouter(prefix="/curriculum", tags=["curriculum"])
+log = get_logger("curriculum")
 
 @router.post("/generate_curriculum")
 async def create_curriculum(request: Request):
@@ -16,47 +21,24 @@ async def create_curriculum(request: Request):
     if not user_input:
         raise HTTPException(status_code=400, detail="Prompt required")
     
+    # Near-identical prompts reuse an earlier validated curriculum
+    with span("cache_lookup"):
+        cached = await lookup_response("curriculum", user_input)
+    if cached.value is not None:
+        return {"status": "success", "data": cached.value}
+
     final_prompt = CURRICULUM_PROMPT_TEMPLATE.format(user_input=user_input)
     
     try:
-        # Choose API provider based on configuration flag
-        if USE_GROQ:
-            print("[CURRICULUM] Using Groq API for curriculum generation")
-            headers = {
-                "Authorization": f"Bearer {GROQ_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            payload = {
-                "model": GROQ_MODEL,
-                "messages": [{"role": "user", "content": final_prompt}],
-                "temperature": 0.5,
-                "max_completion_tokens": 2000
-            }
-            resp = requests.post(GROQ_API_URL, headers=headers, json=payload, timeout=30)
-            if resp.status_code >= 400:
-                print("[GROQ CURRICULUM ERROR] Status:", resp.status_code)
-                print("[GROQ CURRICULUM ERROR] Body:\n", resp.text)
-            resp.raise_for_status()
-            # Groq returns choices -> message -> content
-            groq_content = resp.json().get("choices", [])[0].get("message", {}).get("content", "")
-            parsed = json.loads(clean_json_string(groq_content))
-        else:
-            print("[CURRICULUM] Using Ollama API for curriculum generation")
-            resp = requests.post(
-                OLLAMA_URL,
-                json={
-                    "model": OLLAMA_MODEL,
-                    "prompt": final_prompt,
-                    "stream": False,
-                    "format": "json",
-                    "options": {"temperature": 0.5}
-                },
-                timeout=30
-            )
-            resp.raise_for_status()
-            parsed = json.loads(clean_json_string(resp.json().get("response", "")))
+        log.debug("Generating curriculum")
+        content = await generate(final_prompt, 0.5, tag="CURRICULUM", schema=CurriculumOutput)
+        with span("parse"):
+            parsed = json.loads(clean_json_string(content))
         if validate_curriculum(parsed):
+            GENERATION_STATS.record("CURRICULUM", 1, True)
+            store_response(cached, parsed)
             return {"status": "success", "data": parsed}
     except Exception as e:
-        print(e)
+        log.warning("Curriculum generation failed: %s", e)
+    GENERATION_STATS.record("CURRICULUM", 1, False)
     return {"status": "error", "message": "Failed to generate Curriculum"}
@@ -1,72 +1,187 @@
-from fastapi import APIRouter, Request
-import requests
+from fastapi import APIRouter, HTTPException, Request
+import asyncio
 import json
-from app.config import OLLAMA_URL, OLLAMA_MODEL, USE_GROQ, GROQ_API_KEY, GROQ_MODEL, GROQ_API_URL
+import numpy as np
+from app.config import (
+    MCQ_CHUNK_SIZE,
+    MCQ_MAX_PARALLEL_CHUNKS,
+    MCQ_CHUNK_RETRIES,
+    MCQ_TOKENS_PER_QUESTION,
+    MCQ_MAX_QUESTIONS,
+    GENERATION_STATS,
+)
+from app.models import MCQBatchOutput
 from app.prompts.mcq_prompt import PHI3_PROMPT_TEMPLATE
 from app.utils.text_processing import clean_json_string
 from app.utils.validation import validate_mcq
+from app.utils.llm_client import generate
+from app.utils.quiz_logic import compact_history
+from app.utils.semantic import score_candidates_async, exact_repeat
+from app.utils.metrics import DEDUP_REJECTIONS
+from app.utils.log import get_logger
+from app.utils.tracing import span
 
 router = APIRouter(prefix="/mcq", tags=["mcq"])
+log = get_logger("mcq")
 
-@router.post("/generate_mcq")
-async def create_mcq(request: Request):
-    """Generate Multiple Choice Questions"""
-    data = await request.json()
-    topic, subtopic, difficulty, n = (
-        data.get("topic"),
-        data.get("subtopic"),
-        data.get("difficulty"),
-        int(data.get("n", 1))
-    )
-    
+def split_chunks(n: int, chunk_size: int) -> list:
+    """Split n questions into chunk sizes, e.g. 12 by 5 -> [5, 5, 2]"""
+    return [min(chunk_size, n - start) for start in range(0, n, chunk_size)]
+
+async def generate_mcq_chunk(topic, subtopic, difficulty, n: int, part: int, parts: int, avoid: list, semaphore) -> list:
+    """Generate one chunk of MCQs; raises if nothing valid comes back"""
     final_prompt = PHI3_PROMPT_TEMPLATE.format(
         topic=topic,
         subtopic=subtopic,
         difficulty=difficulty,
         n=n
     )
-    
-    try:
-        # Choose provider based on configuration
-        if USE_GROQ:
-            print("[MCQ] Using Groq API for MCQ generation")
-            headers = {
-                "Authorization": f"Bearer {GROQ_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            payload = {
-                "model": GROQ_MODEL,
-                "messages": [{"role": "user", "content": final_prompt}],
-                "temperature": 0.5,
-                "max_completion_tokens": 1500
-            }
-            resp = requests.post(GROQ_API_URL, headers=headers, json=payload, timeout=30)
-            if resp.status_code >= 400:
-                print("[GROQ MCQ ERROR] Status:", resp.status_code)
-                print("[GROQ MCQ ERROR] Body:\n", resp.text)
-            resp.raise_for_status()
-            groq_content = resp.json().get("choices", [])[0].get("message", {}).get("content", "")
-            parsed = json.loads(clean_json_string(groq_content))
-        else:
-            print("[MCQ] Using Ollama API for MCQ generation")
-            resp = requests.post(
-                OLLAMA_URL,
-                json={
-                    "model": OLLAMA_MODEL,
-                    "prompt": final_prompt,
-                    "stream": False,
-                    "format": "json"
-                },
-                timeout=30
-            )
-            resp.raise_for_status()
-            parsed = json.loads(clean_json_string(resp.json().get("response", "")))
+    if parts > 1:
+        final_prompt += f"\nThis is batch {part} of {parts}: cover different aspects of the subtopic than the other batches."
+    if avoid:
+        final_prompt += f"\nDO NOT REPEAT THESE QUESTIONS:\n{compact_history(avoid)}"
+
+    async with semaphore:
+        content = await generate(
+            final_prompt, max_tokens=max(1500, MCQ_TOKENS_PER_QUESTION * n), tag="MCQ", schema=MCQBatchOutput,
+        )
+    with span("parse"):
+        parsed = json.loads(clean_json_string(content))
         raw = parsed.get("mcqs", []) if isinstance(parsed, dict) else parsed
         if isinstance(raw, dict):
             raw = [raw]
-        valid = [q for q in raw if validate_mcq(q)]
-        if valid:
-            return {"status": "success", "data": valid}
+        valid = [q for q in raw if validate_mcq(q)][:n]
+    if not valid:
+        raise ValueError("No valid MCQs in response")
+    return valid
+
+def exact_dedup_mcqs(accepted: list, candidates: list, limit: int) -> list:
+    """Drop candidates whose text repeats an accepted question or an earlier candidate"""
+    history = [{"question_text": q["question"]} for q in accepted]
+    kept = []
+    for q in candidates:
+        if len(kept) == limit:
+            break
+        if exact_repeat(q["question"], history):
+            DEDUP_REJECTIONS.inc("MCQ", "exact")
+            continue
+        history.append({"question_text": q["question"]})
+        kept.append(q)
+    return kept
+
+async def dedup_mcqs(accepted: list, candidates: list, accepted_matrix, limit: int):
+    """Drop candidates that repeat accepted questions or each other
+
+    Returns (kept, matrix, semantic): up to `limit` kept questions, the
+    accepted embedding matrix grown by their rows (None builds it from
+    `accepted`) and whether the semantic check ran. If the questions cannot
+    be embedded only exact repeats are dropped and the matrix is None.
+    """
+    history = [{"question_text": q["question"]} for q in accepted]
+    try:
+        with span("semantic_check"):
+            dedup = await score_candidates_async(
+                [q["question"] for q in candidates],
+                history,
+                accepted_matrix,
+                within_batch=True,
+            )
     except Exception as e:
-        print(e)
+        log.warning("Semantic dedup unavailable, dropping exact repeats only: %s", e)
+        return exact_dedup_mcqs(accepted, candidates, limit), None, False
+    exact = int(dedup.exact.sum())
+    semantic = int((dedup.semantic & ~dedup.exact).sum())
+    if exact:
+        DEDUP_REJECTIONS.inc("MCQ", "exact", amount=exact)
+    if semantic:
+        DEDUP_REJECTIONS.inc("MCQ", "semantic", amount=semantic)
+    keep = np.flatnonzero(~dedup.duplicate)[:limit]
+    kept = [candidates[i] for i in keep]
+    if accepted_matrix is None:
+        accepted_matrix = np.zeros((0, dedup.embeddings.shape[1]), dtype=np.float32)
+    return kept, np.vstack([accepted_matrix, dedup.embeddings[keep]]), True
+
+def parse_question_count(value) -> int:
+    """Validate the requested `n`; 422 unless an integer in 1..MCQ_MAX_QUESTIONS"""
+    # bool is an int subclass, and int(2.7) would silently truncate
+    if isinstance(value, (bool, float)):
+        value = None
+    try:
+        n = int(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=422, detail="n must be an integer")
+    if not 1 <= n <= MCQ_MAX_QUESTIONS:
+        raise HTTPException(status_code=422, detail=f"n must be between 1 and {MCQ_MAX_QUESTIONS}")
+    return n
+
+@router.post("/generate_mcq")
+async def create_mcq(request: Request):
+    """Generate Multiple Choice Questions
+
+    Large requests are split into MCQ_CHUNK_SIZE chunks generated
+    concurrently. Valid results are merged and deduplicated semantically,
+    and only the shortfall (failed chunks, dropped duplicates) is
+    regenerated, for up to MCQ_CHUNK_RETRIES rounds. Whatever was produced
+    is returned; `partial` is set when fewer than `n` questions came back
+    or when the semantic check could not run and only exact repeats were
+    removed.
+    """
+    data = await request.json()
+    topic, subtopic, difficulty = (
+        data.get("topic"),
+        data.get("subtopic"),
+        data.get("difficulty"),
+    )
+    n = parse_question_count(data.get("n", 1))
+
+    log.debug("Generating %d MCQs", n)
+    semaphore = asyncio.Semaphore(MCQ_MAX_PARALLEL_CHUNKS)
+    accepted = []
+    # Built from `accepted` on first use; None again after a failed encode
+    accepted_matrix = None
+    semantic_dedup = True
+    failed_chunks = 0
+    chunks = 0
+
+    for round_no in range(MCQ_CHUNK_RETRIES + 1):
+        missing = n - len(accepted)
+        if missing <= 0:
+            break
+        sizes = split_chunks(missing, MCQ_CHUNK_SIZE)
+        chunks += len(sizes)
+        avoid = [{"question_text": q["question"]} for q in accepted]
+        results = await asyncio.gather(
+            *[
+                generate_mcq_chunk(topic, subtopic, difficulty, size, i + 1, len(sizes), avoid, semaphore)
+                for i, size in enumerate(sizes)
+            ],
+            return_exceptions=True,
+        )
+
+        candidates = []
+        for size, result in zip(sizes, results):
+            if isinstance(result, Exception):
+                failed_chunks += 1
+                log.warning("Chunk of %d failed (round %d): %s", size, round_no + 1, result)
+            else:
+                candidates.extend(result)
+
+        if candidates:
+            kept, accepted_matrix, semantic = await dedup_mcqs(accepted, candidates, accepted_matrix, n - len(accepted))
+            semantic_dedup = semantic_dedup and semantic
+            accepted.extend(kept)
+        log.debug("Round %d: %d/%d questions", round_no + 1, len(accepted), n)
+
+    # One LLM call per chunk, so a clean request costs len(split_chunks(n))
+    GENERATION_STATS.record("MCQ", chunks, bool(accepted))
+    if accepted:
+        return {
+            "status": "success",
+            "data": accepted,
+            "requested": n,
+            "generated": len(accepted),
+            "partial": len(accepted) < n or not semantic_dedup,
+            "failed_chunks": failed_chunks,
+            "semantic_dedup": semantic_dedup,
+        }
     return {"status": "error", "message": "Failed to generate MCQs"}
@@ -1,21 +1,15 @@
 import json
-import requests
 from fastapi import APIRouter, HTTPException, Request
-from app.config import (
-    OLLAMA_URL,
-    OLLAMA_MODEL,
-    USE_GROQ,
-    GROQ_API_KEY,
-    GROQ_MODEL,
-    GROQ_API_URL,
-)
+from app.config import GENERATION_STATS
 from app.models import (
     NextLevelTopicsRequest,
     NextLevelSubtopic,
     NextLevelTopicsResponse,
+    NextLevelTopicsOutput,
 )
 from app.prompts.next_level_prompt import NEXT_LEVEL_SYSTEM_PROMPT, build_next_level_prompt
 from app.utils.text_processing import clean_json_string
+from app.utils.llm_client import generate
 
 router = APIRouter(prefix="/next-level", tags=["next-level"])
 
@@ -91,52 +85,27 @@ async def generate_next_level_topics(request: Request):
             summary_json=summary_json,
         )
 
-        if USE_GROQ:
-            headers = {
-                "Authorization": f"Bearer {GROQ_API_KEY}",
-                "Content-Type": "application/json",
-            }
-            payload = {
-                "model": GROQ_MODEL,
-                "messages": [
-                    {"role": "system", "content": NEXT_LEVEL_SYSTEM_PROMPT},
-                    {"role": "user", "content": prompt},
-                ],
-                "temperature": 0.4,
-                "max_completion_tokens": 1500,
-            }
-            resp = requests.post(
-                GROQ_API_URL, headers=headers, json=payload, timeout=30
-            )
-            if resp.status_code >= 400:
-                print("[GROQ NEXT_LEVEL ERROR] Status:", resp.status_code)
-                print("[GROQ NEXT_LEVEL ERROR] Body:\n", resp.text)
-            resp.raise_for_status()
-            raw_text = (
-                resp.json().get("choices", [])[0]
-                .get("message", {})
-                .get("content", "")
+        # Provider errors and unusable output both count as failed generations
+        try:
+            raw_text = await generate(
+                prompt,
+                0.4,
+                max_tokens=1500,
+                system_prompt=NEXT_LEVEL_SYSTEM_PROMPT,
+                tag="NEXT_LEVEL",
+                schema=NextLevelTopicsOutput,
             )
-        else:
-            resp = requests.post(
-                OLLAMA_URL,
-                json={
-                    "model": OLLAMA_MODEL,
-                    "prompt": prompt,
-                    "stream": False,
-                    "format": "json",
-                    "options": {"temperature": 0.4},
-                },
-                timeout=30,
-            )
-            resp.raise_for_status()
-            raw_text = resp.json().get("response", "")
-
-        text = clean_json_string(raw_text)
-        data = json.loads(text)
+            data = json.loads(clean_json_string(raw_text))
+            if not isinstance(data, dict):
+                raise ValueError("AI model did not return a JSON object")
+        except Exception:
+            GENERATION_STATS.record("NEXT_LEVEL", 1, False)
+            raise
 
         if "subtopics" not in data:
             data["subtopics"] = []
+        # Output that needs padding or trimming below counts as a miss
+        GENERATION_STATS.record("NEXT_LEVEL", 1, 10 <= len(data["subtopics"]) <= 15)
 
         # Ensure 10–15 subtopics
         if len(data["subtopics"]) < 10:
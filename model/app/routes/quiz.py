@@ -1,24 +1,40 @@
 from fastapi import APIRouter
-import requests
+from fastapi.responses import StreamingResponse
+import asyncio
 import json
+import logging
 import uuid
-import threading
-from app.config import OLLAMA_URL, OLLAMA_MODEL, MAX_RETRIES, PREFETCH_CACHE, USE_GROQ, GROQ_API_KEY, GROQ_MODEL, GROQ_API_URL
-from app.models import QuizRequest
-from app.prompts.quiz_prompt import QUIZ_PROMPT_TEMPLATE
-from app.utils.text_processing import clean_json_string
-from app.utils.quiz_logic import get_level_description, auto_adjust_level
-from app.utils.semantic import exact_repeat, semantic_repeat
-from app.db.mongo import load_session_history, save_question
-import re
+import numpy as np
+from dataclasses import dataclass
+from typing import Optional
+from app.config import (
+    MAX_RETRIES,
+    PREFETCH_CACHE,
+    PREFETCH_DEPTH,
+    PREFETCH_EXECUTOR,
+    QUIZ_STREAM_VALIDATION,
+    SESSION_HISTORY_WINDOW,
+    MONGO_WRITE_MODE,
+    QUIZ_BATCH_TOKENS_PER_QUESTION,
+    QUIZ_HEDGE_ATTEMPTS,
+    QUIZ_HEDGE_BUDGET,
+    GENERATION_STATS,
+)
+from app.models import QuizRequest, QuizBatchRequest, QuizQuestionOutput, QuizBatchOutput
+from app.prompts.quiz_prompt import QUIZ_PROMPT_TEMPLATE, QUIZ_BATCH_PROMPT_TEMPLATE
+from app.utils.text_processing import clean_json_string, clean_option_text
+from app.utils.validation import validate_quiz_question, QuizStreamValidator
+from app.utils.quiz_logic import get_level_description, auto_adjust_level, compact_history
+from app.utils.semantic import score_candidates_async, build_history_matrix_async, exact_repeat, semantic_repeat
+from app.db.mongo import load_session_history_with_embeddings, save_question, save_questions, write_in_background
+from app.utils.llm_client import generate, stream_generate, get_provider_name, get_model_name
+from app.utils.question_bank import serve_from_bank, mark_served
+from app.utils.metrics import DEDUP_REJECTIONS
+from app.utils.log import get_logger, bind_session, log_payload
+from app.utils.tracing import span, detach_trace
 
 router = APIRouter(prefix="/quiz", tags=["quiz"])
-
-def clean_option_text(option: str) -> str:
-    """Remove 'Option A:', 'Option B:', etc. prefixes from option text"""
-    # Match patterns like "Option A: ", "Option B: ", "(A) ", "(a) ", "A. ", etc.
-    cleaned = re.sub(r'^(?:Option\s+[A-Z]:|[A-Z]\.|[A-Z]\)|\([A-Z]\))\s*', '', option, flags=re.IGNORECASE)
-    return cleaned.strip()
+log = get_logger("quiz")
 
 def transform_backend_to_frontend(backend_data: dict) -> dict:
     """Transform backend response format to frontend format
@@ -36,257 +52,579 @@ def transform_backend_to_frontend(backend_data: dict) -> dict:
         "explanation": backend_data.get("explanation", "")
     }
 
-def call_groq_api(prompt: str, temperature: float) -> str:
-    """Call Groq API and return the response text"""
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
-        "model": GROQ_MODEL,
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": temperature,
-        # Use max_completion_tokens as per Groq chat completions API
-        "max_completion_tokens": 2000
-    }
-    try:
-        response = requests.post(GROQ_API_URL, headers=headers, json=payload, timeout=30)
-        if response.status_code >= 400:
-            # Log full error body from Groq for debugging
-            print("[GROQ QUIZ ERROR] Status:", response.status_code)
-            print("[GROQ QUIZ ERROR] Body:\n", response.text)
-        response.raise_for_status()
-
-        result = response.json()
-        return result["choices"][0]["message"]["content"]
-    except Exception as e:
-        print("[GROQ QUIZ EXCEPTION]", e)
-        raise
-
-def call_ollama_api(prompt: str, temperature: float) -> str:
-    """Call Ollama API and return the response text"""
-    response = requests.post(
-        OLLAMA_URL,
-        json={
-            "model": OLLAMA_MODEL,
-            "prompt": prompt,
-            "stream": False,
-            "format": "json",
-            "options": {"temperature": temperature}
-        },
-        timeout=30
-    )
-    response.raise_for_status()
-    return response.json()["response"]
+# Backend field -> frontend field, used to label streamed SSE field events
+FRONTEND_FIELDS = {
+    "question_id": "id",
+    "question_text": "question",
+    "options": "options",
+    "correct_option_index": "correctIndex",
+    "hint": "hint",
+    "code_context": "code_context",
+    "explanation": "explanation",
+}
 
-def generate_quiz_core(req: QuizRequest, session_id: str):
-    """Core quiz generation logic"""
-    # Load persisted history and combine with request history
-    stored = load_session_history(session_id)
-    combined_history = stored + [h.dict() if hasattr(h, 'dict') else h for h in req.history]
+def build_quiz_prompt(domain_name: str, program_name: str, level: int, history: list) -> str:
+    """Format QUIZ_PROMPT_TEMPLATE for a domain/program/level and history
 
-    # Auto-adjust difficulty
-    adjusted_level = auto_adjust_level(req.level, combined_history)
-    
-    print(f"[QUIZ CORE] Starting generation...")
-    print(f"  Questions in history: {len(combined_history)}")
-    print(f"  Original Level: {req.level} → Adjusted Level: {adjusted_level}")
-
-    # Format prompt
-    prompt = QUIZ_PROMPT_TEMPLATE.format(
-        domain_name=req.domain_name,
-        program_name=req.program_name,
-        level_description=get_level_description(adjusted_level),
-        level_int=adjusted_level,
-        history_json=json.dumps(combined_history, indent=2)
+    Only the last SESSION_HISTORY_WINDOW items are rendered, compacted to
+    question stems within QUIZ_HISTORY_TOKEN_BUDGET; dedup still checks
+    against the full history.
+    """
+    return QUIZ_PROMPT_TEMPLATE.format(
+        domain_name=domain_name,
+        program_name=program_name,
+        level_description=get_level_description(level),
+        level_int=level,
+        history_json=compact_history(history[-SESSION_HISTORY_WINDOW:])
     )
 
-    last_error = ""
+def build_quiz_batch_prompt(domain_name: str, program_name: str, level: int, history: list, count: int) -> str:
+    """Format QUIZ_BATCH_PROMPT_TEMPLATE asking for `count` questions"""
+    return QUIZ_BATCH_PROMPT_TEMPLATE.format(
+        domain_name=domain_name,
+        program_name=program_name,
+        level_description=get_level_description(level),
+        level_int=level,
+        history_json=compact_history(history[-SESSION_HISTORY_WINDOW:]),
+        count=count,
+    )
 
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            final_prompt = prompt
-            if last_error:
-                final_prompt += f"\nPREVIOUS ERROR:\n{last_error}\nFIX AND REGENERATE."
+async def stream_attempt(prompt: str, temperature: float, attempt: int, on_event=None, tag: str = "QUIZ") -> str:
+    """Stream one LLM attempt, validating it as it arrives
 
-            temperature = min(0.7, 0.3 + attempt * 0.1)
-            
-            # Choose API based on configuration
-            if USE_GROQ:
-                print(f"\n[ATTEMPT {attempt}/{MAX_RETRIES}] 🟦 Using Groq API")
-                print(f"  Model: {GROQ_MODEL}")
-                print(f"  Temperature: {temperature:.2f}")
-                raw_response = call_groq_api(final_prompt, temperature)
-                print(f"  Status: ✅ Response received from Groq ({len(raw_response)} chars)")
-            else:
-                print(f"\n[ATTEMPT {attempt}/{MAX_RETRIES}] 🟢 Using Ollama API")
-                print(f"  Model: {OLLAMA_MODEL}")
-                print(f"  Temperature: {temperature:.2f}")
-                raw_response = call_ollama_api(final_prompt, temperature)
-                print(f"  Status: ✅ Response received from Ollama ({len(raw_response)} chars)")
-            
+    Each top-level field is checked as soon as it completes (and emitted
+    via `on_event` when given). On the first schema violation the provider
+    stream is closed, which cancels the generation, and the ValueError is
+    raised so the retry can start immediately. Returns the full raw text so
+    the normal cleaning and validation run on it.
+    """
+    validator = QuizStreamValidator()
+    chunks = []
+    stream = stream_generate(prompt, temperature, tag=tag, schema=QuizQuestionOutput)
+    try:
+        async for chunk in stream:
+            chunks.append(chunk)
+            try:
+                completed = validator.feed(chunk)
+            except ValueError as e:
+                received = sum(len(c) for c in chunks)
+                log.debug("%s stream: aborting attempt %d after %d chars: %s", tag, attempt, received, e)
+                raise
+            if on_event is None:
+                continue
+            for key, value in completed:
+                if key not in FRONTEND_FIELDS:
+                    continue
+                if key == "options":
+                    value = [clean_option_text(opt) for opt in value]
+                await on_event("field", {"attempt": attempt, "field": FRONTEND_FIELDS[key], "value": value})
+    finally:
+        await stream.aclose()
+    return "".join(chunks)
+
+async def run_attempt(
+    prompt: str,
+    attempt: int,
+    last_error: str,
+    combined_history: list,
+    history_matrix,
+    max_attempts: int = MAX_RETRIES,
+    tag: str = "QUIZ",
+    on_event=None,
+    rejected: Optional[int] = None,
+):
+    """One generation attempt: call the LLM, validate, dedup
+
+    `rejected` is how many attempts for this question have already been
+    rejected (attempt - 1 in the sequential loop); it sets the temperature
+    and when the semantic check is relaxed. Returns (parsed, embedding) or
+    raises with the reason the candidate was rejected.
+    """
+    if rejected is None:
+        rejected = attempt - 1
+    with span(f"attempt_{attempt}", tag=tag):
+        final_prompt = prompt
+        if last_error:
+            final_prompt += f"\nPREVIOUS ERROR:\n{last_error}\nFIX AND REGENERATE."
+
+        temperature = min(0.7, 0.4 + rejected * 0.1)
+
+        # Shared async client routes to the healthiest of Groq / Ollama
+        if log.isEnabledFor(logging.DEBUG):
+            provider = get_provider_name()
+            log.debug(
+                "%s attempt %d/%d via %s (%s), temperature %.2f",
+                tag, attempt, max_attempts, provider, get_model_name(provider), temperature,
+            )
+        if on_event is not None or QUIZ_STREAM_VALIDATION:
+            raw_response = await stream_attempt(final_prompt, temperature, attempt, on_event, tag=tag)
+        else:
+            raw_response = await generate(final_prompt, temperature, tag=tag, schema=QuizQuestionOutput)
+        log.debug("%s attempt %d: response received (%d chars)", tag, attempt, len(raw_response))
+
+        log_payload(log, f"{tag} attempt {attempt} raw response", raw_response)
+        with span("parse"):
             cleaned_response = clean_json_string(raw_response)
-            
-            print(f"\n[ATTEMPT {attempt}] RAW RESPONSE:\n{raw_response[:500]}")
-            print(f"[ATTEMPT {attempt}] CLEANED RESPONSE:\n{cleaned_response[:500]}")
-            
             parsed = json.loads(cleaned_response)
-            print(parsed)
-            
-            print(f"[ATTEMPT {attempt}] PARSED JSON: correct_option_index = {parsed.get('correct_option_index')}")
-            
+
             # ===== SCHEMA VALIDATION (matches quiz_prompt.py schema) =====
-            # Required fields check
-            required_fields = ["question_id", "question_text", "options", "correct_option_index", "hint", "explanation"]
-            for field in required_fields:
-                if field not in parsed:
-                    raise ValueError(f"Missing required field: {field}")
-            
-            # question_id validation
-            if not isinstance(parsed.get("question_id"), str) or not parsed.get("question_id").strip():
-                raise ValueError("question_id must be a non-empty string")
-            
-            # question_text validation
-            if not isinstance(parsed.get("question_text"), str) or not parsed.get("question_text").strip():
-                raise ValueError("question_text must be a non-empty string")
-            
-            # options validation (exactly 4, all strings)
-            if not isinstance(parsed.get("options"), list) or len(parsed["options"]) != 4:
-                raise ValueError("options must be exactly 4 items")
-            if not all(isinstance(opt, str) for opt in parsed["options"]):
-                raise ValueError("all options must be strings")
-            
-            # CLEANING: Remove "Option A:", "Option B:" prefixes from options
-            parsed["options"] = [clean_option_text(opt) for opt in parsed["options"]]
-            
-            # correct_option_index validation (0-3, must be int)
-            correct_idx = parsed.get("correct_option_index")
-            if not isinstance(correct_idx, int):
-                raise ValueError(f"correct_option_index must be an integer, got {type(correct_idx).__name__}")
-            
-            # HARDENING: If model returns -1, auto-correct to 0 (first option)
-            if correct_idx == -1:
-                print(f"[HARDENING] Model returned -1 for correct_option_index, auto-correcting to 0")
-                parsed["correct_option_index"] = 0
-                correct_idx = 0
-            
-            if correct_idx not in (0, 1, 2, 3):
-                raise ValueError(f"correct_option_index must be 0-3, got {correct_idx}")
-            
-            # hint validation (must be string)
-            if not isinstance(parsed.get("hint"), str) or not parsed.get("hint").strip():
-                raise ValueError("hint must be a non-empty string")
-            
-            # explanation validation (must be string)
-            if not isinstance(parsed.get("explanation"), str) or not parsed.get("explanation").strip():
-                raise ValueError("explanation must be a non-empty string")
-            
-            # code_context validation (optional, can be string or null)
-            code_context = parsed.get("code_context")
-            if code_context is not None and not isinstance(code_context, str):
-                raise ValueError(f"code_context must be string or null, got {type(code_context).__name__}")
-
-
-            if exact_repeat(parsed["question_text"], combined_history):
-                raise ValueError("Exact duplicate question")
-
-            # After 3 retries, relax semantic duplication check (more lenient)
-            if attempt <= 3 and semantic_repeat(parsed["question_text"], combined_history):
-                raise ValueError("Semantic duplicate question")
-
-            # Persist this question in Mongo so the session history knows
-            # exactly which questions (and correct answers) have been asked.
-            save_question(
-                session_id,
-                parsed["question_text"],
-                options=parsed.get("options", []),
-                correct_option_index=parsed.get("correct_option_index"),
+            parsed = validate_quiz_question(parsed)
+
+        # Exact and semantic checks in one pass; only the candidate is
+        # encoded and its vector is reused when persisting.
+        with span("semantic_check"):
+            dedup = await score_candidates_async(
+                [parsed["question_text"]],
+                combined_history,
+                history_matrix,
+                within_batch=False,
             )
-            print(f"[SUCCESS] ✅ Question generated successfully on attempt {attempt}")
-            print(f"  Question ID: {parsed['question_id']}")
-            print(f"  Correct Answer Index: {parsed['correct_option_index']}")
-            print(f"  Semantic Check: {'Relaxed (attempt > 3)' if attempt > 3 else 'Strict'}")
-            return parsed, attempt
+
+        if dedup.exact[0]:
+            DEDUP_REJECTIONS.inc(tag, "exact")
+            raise ValueError("Exact duplicate question")
+
+        # After 3 rejections, relax semantic duplication check (more lenient)
+        if rejected < 3 and dedup.semantic[0]:
+            DEDUP_REJECTIONS.inc(tag, "semantic")
+            raise ValueError("Semantic duplicate question")
+
+        log.debug(
+            "%s attempt %d accepted %s (semantic check %s)",
+            tag, attempt, parsed["question_id"], "relaxed" if rejected >= 3 else "strict",
+        )
+        return parsed, dedup.embeddings[0]
+
+async def generate_question(prompt: str, combined_history: list, history_matrix, tag: str = "QUIZ", on_event=None):
+    """Run the LLM retry loop until a question passes schema and dedup checks
+
+    Returns (parsed, attempt, embedding). Nothing is persisted here; the
+    caller decides whether the question goes to a session or the bank.
+    With QUIZ_STREAM_VALIDATION attempts are streamed and aborted as soon
+    as the output breaks the schema. With `on_event` (async callable(event,
+    data)) they are always streamed and fields are reported as they
+    complete, followed by a "retry" event when an attempt is rejected.
+    With QUIZ_HEDGE_ATTEMPTS > 1 (and no `on_event`) attempts are hedged,
+    see generate_question_hedged.
+    """
+    if on_event is None and QUIZ_HEDGE_ATTEMPTS > 1:
+        return await generate_question_hedged(prompt, combined_history, history_matrix, tag=tag)
+
+    last_error = ""
+
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            parsed, question_embedding = await run_attempt(
+                prompt, attempt, last_error, combined_history, history_matrix, tag=tag, on_event=on_event,
+            )
+            GENERATION_STATS.record(tag, attempt, True)
+            return parsed, attempt, question_embedding
 
         except Exception as e:
             last_error = str(e)
-            print(f"[QUIZ ERROR] Attempt {attempt}/{MAX_RETRIES}: {last_error}")
+            log.debug("%s attempt %d/%d rejected: %s", tag, attempt, MAX_RETRIES, last_error)
             if attempt == MAX_RETRIES:
-                print(f"[QUIZ FAILED] Max retries reached. Final error: {last_error}")
+                log.warning("%s failed after %d attempts: %s", tag, MAX_RETRIES, last_error)
+            elif on_event is not None:
+                await on_event("retry", {"attempt": attempt, "error": last_error})
 
 
+    GENERATION_STATS.record(tag, MAX_RETRIES, False)
     raise RuntimeError(f"Failed after {MAX_RETRIES} retries: {last_error}")
 
-def prefetch_next(req_copy: QuizRequest, session_id: str):
-    """Prefetch next question in background"""
+async def generate_question_hedged(prompt: str, combined_history: list, history_matrix, tag: str = "QUIZ"):
+    """Hedged variant of the retry loop
+
+    Keeps up to QUIZ_HEDGE_ATTEMPTS attempts in flight. The first candidate
+    that passes schema, exact and semantic checks wins and the others are
+    cancelled, which closes their provider streams. A rejected attempt is
+    replaced by a new one carrying its error, until QUIZ_HEDGE_BUDGET
+    attempts have been started for this request. Temperature and the
+    semantic relaxation follow the number of rejections so far, as in the
+    sequential loop, not the launch order.
+    """
+    budget = max(1, QUIZ_HEDGE_BUDGET)
+    running = {}
+    launched = 0
+    rejected = 0
+    last_error = ""
+
+    def launch() -> None:
+        nonlocal launched
+        launched += 1
+        task = asyncio.create_task(run_attempt(
+            prompt, launched, last_error, combined_history, history_matrix,
+            max_attempts=budget, tag=tag, rejected=rejected,
+        ))
+        running[task] = launched
+
     try:
-        PREFETCH_CACHE[session_id] = generate_quiz_core(req_copy, session_id)
-    except Exception as e:
-        print(f"[PREFETCH ERROR] {e}")
+        while launched < min(QUIZ_HEDGE_ATTEMPTS, budget):
+            launch()
+        while running:
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=running.get):
+                attempt = running.pop(task)
+                try:
+                    parsed, question_embedding = task.result()
+                except Exception as e:
+                    rejected += 1
+                    last_error = str(e)
+                    log.debug("%s hedged attempt %d/%d rejected: %s", tag, attempt, budget, last_error)
+                    if launched < budget:
+                        launch()
+                    continue
+                log.debug("%s hedged attempt %d won; cancelling %d in flight (%d/%d started)", tag, attempt, len(running), launched, budget)
+                # Attempts cancelled while in flight are not counted
+                completed = rejected + 1
+                GENERATION_STATS.record(tag, completed, True)
+                return parsed, completed, question_embedding
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
 
-@router.post("")
-async def generate_quiz_question(req: QuizRequest):
-    """Generate an adaptive quiz question"""
-    session_id = req.session_id or str(uuid.uuid4())
-    
-    # Debug: Log API configuration at start
-    api_provider = "Groq" if USE_GROQ else "Ollama"
-    print(f"\n{'='*60}")
-    print(f"[QUIZ REQUEST] API Provider: {api_provider}")
-    if USE_GROQ:
-        print(f"  Model: {GROQ_MODEL}")
-        print(f"  API: {GROQ_API_URL}")
+    log.warning("%s failed: hedge budget of %d attempts spent: %s", tag, budget, last_error)
+    GENERATION_STATS.record(tag, rejected, False)
+    raise RuntimeError(f"Failed after {budget} hedged attempts: {last_error}")
+
+def parse_question_batch(raw_response: str):
+    """Split a batch completion into validated questions and per-item errors"""
+    parsed = json.loads(clean_json_string(raw_response))
+    items = parsed.get("questions") if isinstance(parsed, dict) else parsed
+    if not isinstance(items, list):
+        raise ValueError('Response must be a JSON object with a "questions" array')
+
+    valid, errors = [], []
+    for i, item in enumerate(items, start=1):
+        try:
+            valid.append(validate_quiz_question(item))
+        except ValueError as e:
+            errors.append(f"question {i}: {e}")
+    return valid, errors
+
+async def generate_question_batch(
+    domain_name: str,
+    program_name: str,
+    level: int,
+    combined_history: list,
+    history_matrix,
+    count: int,
+    tag: str = "QUIZ BATCH",
+):
+    """Generate up to `count` questions, several per LLM call
+
+    Each item is validated with the single-question schema rules, then all
+    survivors are deduplicated in one pass against history and against
+    each other. Accepted questions join the dedup context and later
+    attempts only ask for the remainder. Returns (questions, attempts)
+    with questions as (parsed, embedding) pairs; fewer than `count` may
+    come back if MAX_RETRIES runs out.
+    """
+    accepted = []
+    history = list(combined_history)
+    last_error = ""
+    attempts = 0
+
+    for attempt in range(1, MAX_RETRIES + 1):
+        remaining = count - len(accepted)
+        if remaining <= 0:
+            break
+        attempts = attempt
+        try:
+            prompt = build_quiz_batch_prompt(domain_name, program_name, level, history, remaining)
+            if last_error:
+                prompt += f"\nPREVIOUS ERROR:\n{last_error}\nFIX AND REGENERATE."
+            temperature = min(0.7, 0.3 + attempt * 0.1)
+            log.debug("%s attempt %d/%d: requesting %d questions (temperature %.2f)", tag, attempt, MAX_RETRIES, remaining, temperature)
+
+            raw_response = await generate(
+                prompt,
+                temperature,
+                max_tokens=QUIZ_BATCH_TOKENS_PER_QUESTION * remaining,
+                tag=tag,
+                schema=QuizBatchOutput,
+            )
+            with span("parse"):
+                valid, errors = parse_question_batch(raw_response)
+            valid = valid[:remaining]
+
+            if valid:
+                with span("semantic_check"):
+                    dedup = await score_candidates_async(
+                        [q["question_text"] for q in valid],
+                        history,
+                        history_matrix,
+                        within_batch=True,
+                    )
+                for i, question in enumerate(valid):
+                    # Same relaxation as single generation after 3 attempts
+                    if dedup.exact[i]:
+                        DEDUP_REJECTIONS.inc(tag, "exact")
+                        errors.append(f"question {i + 1}: Exact duplicate question")
+                        continue
+                    if attempt <= 3 and dedup.semantic[i]:
+                        DEDUP_REJECTIONS.inc(tag, "semantic")
+                        errors.append(f"question {i + 1}: Semantic duplicate question")
+                        continue
+                    embedding = dedup.embeddings[i]
+                    accepted.append((question, embedding))
+                    history.append({"question_text": question["question_text"]})
+                    history_matrix = np.vstack([history_matrix, embedding.reshape(1, -1)])
+
+            log.debug("%s attempt %d: accepted %d/%d", tag, attempt, len(accepted), count)
+            last_error = "; ".join(errors)
+        except Exception as e:
+            last_error = str(e)
+            log.debug("%s attempt %d/%d failed: %s", tag, attempt, MAX_RETRIES, last_error)
+
+    GENERATION_STATS.record(tag, attempts, bool(accepted))
+    if not accepted:
+        raise RuntimeError(f"Failed after {MAX_RETRIES} retries: {last_error}")
+    return accepted, attempts
+
+async def generate_bank_questions(domain_name: str, program_name: str, level: int, bank_history: list, bank_matrix, count: int):
+    """Generate up to `count` questions for a question bank bucket
+
+    Deduplicates against the bucket's existing questions instead of a
+    session history. Returns a list of (parsed, embedding).
+    """
+    stems = [{"question_text": h["question_text"]} for h in bank_history]
+    questions, _ = await generate_question_batch(domain_name, program_name, level, stems, bank_matrix, count, tag="BANK")
+    return questions
+
+@dataclass
+class QuizContext:
+    """Per-request state shared by generation, prefetch and cache lookups"""
+    combined_history: list
+    history_matrix: np.ndarray
+    adjusted_level: int
+
+async def load_quiz_context(req: QuizRequest, session_id: str) -> QuizContext:
+    """Load session history, build the dedup matrix and adjust the level"""
+    # Load persisted history and combine with request history. The whole
+    # session is read so no earlier question can repeat, but only the
+    # fields dedup needs (question_text and the float16 embedding)
+    with span("load_history"):
+        stored, stored_embeddings = await load_session_history_with_embeddings(
+            session_id,
+            fields=["question_text"],
+        )
+    request_history = [h.dict() if hasattr(h, 'dict') else h for h in req.history]
+    combined_history = stored + request_history
+
+    # Embedding matrix for semantic dedup, built once per request: stored
+    # items reuse their persisted vectors, only the rest are encoded here.
+    with span("history_matrix"):
+        history_matrix = await build_history_matrix_async(
+            combined_history,
+            stored_embeddings + [None] * len(request_history),
+        )
+
+    # Auto-adjust difficulty
+    adjusted_level = auto_adjust_level(req.level, combined_history)
+    return QuizContext(combined_history, history_matrix, adjusted_level)
+
+def prefetch_params(req: QuizRequest, context: QuizContext) -> tuple:
+    """Parameters a prefetched question must match to be served"""
+    return (req.domain_name, req.program_name, context.adjusted_level)
+
+async def produce_question(req: QuizRequest, context: QuizContext, on_event=None):
+    """Get a question from the bank or the LLM without persisting it
+
+    Returns (parsed, attempt, embedding); attempt is 0 for bank questions.
+    """
+    log.debug(
+        "Producing question: %d in history, level %d -> %d",
+        len(context.combined_history), req.level, context.adjusted_level,
+    )
+
+    # Serve a pre-generated question the session has not seen, if any
+    with span("question_bank"):
+        banked = await serve_from_bank(
+            req.domain_name, req.program_name, context.adjusted_level,
+            context.combined_history, context.history_matrix,
+        )
+    if banked is not None:
+        parsed, question_embedding = banked
+        log.debug("Served from question bank: %s", parsed["question_id"])
+        return parsed, 0, question_embedding
+
+    with span("prompt"):
+        prompt = build_quiz_prompt(req.domain_name, req.program_name, context.adjusted_level, context.combined_history)
+    return await generate_question(prompt, context.combined_history, context.history_matrix, on_event=on_event)
+
+async def persist_question(session_id: str, parsed: dict, question_embedding) -> None:
+    """Persist a question in Mongo so the session history knows exactly
+    which questions (and correct answers) have been asked.
+
+    With MONGO_WRITE_MODE=background the write is not awaited; the next
+    history read for the session waits for it instead.
+    """
+    write = save_question(
+        session_id,
+        parsed["question_text"],
+        options=parsed.get("options", []),
+        correct_option_index=parsed.get("correct_option_index"),
+        embedding=question_embedding,
+    )
+    if MONGO_WRITE_MODE == "background":
+        write_in_background(session_id, write)
+    else:
+        with span("save_question"):
+            await write
+
+async def persist_questions(session_id: str, questions: list) -> None:
+    """Persist a batch of (parsed, embedding) questions with a single write"""
+    write = save_questions(
+        session_id,
+        [parsed for parsed, _ in questions],
+        [embedding for _, embedding in questions],
+    )
+    if MONGO_WRITE_MODE == "background":
+        write_in_background(session_id, write)
     else:
-        print(f"  Model: {OLLAMA_MODEL}")
-        print(f"  API: {OLLAMA_URL}")
-    print(f"  Domain: {req.domain_name} | Program: {req.program_name} | Level: {req.level}")
-    print(f"  Session ID: {session_id}")
-    print(f"{'='*60}\n")
-
-    # Check prefetch cache first
-    if session_id in PREFETCH_CACHE:
-        parsed, attempt = PREFETCH_CACHE.pop(session_id)
-        # Final validation check on cached data
-        correct_idx = parsed.get("correct_option_index")
-        if correct_idx not in (0, 1, 2, 3):
-            print(f"[WARNING] Cached data has invalid correct_option_index: {correct_idx}, regenerating...")
-            parsed, attempt = generate_quiz_core(req, session_id)
-        
-        # Transform to frontend format
-        response_data = transform_backend_to_frontend(parsed)
-        return {
-            "status": "success",
-            "session_id": session_id,
-            "attempts_used": attempt,
-            "data": response_data
-        }
+        with span("save_questions"):
+            await write
+
+async def generate_quiz_core(req: QuizRequest, session_id: str, context: Optional[QuizContext] = None, on_event=None):
+    """Core quiz generation logic"""
+    if context is None:
+        context = await load_quiz_context(req, session_id)
+    parsed, attempt, question_embedding = await produce_question(req, context, on_event=on_event)
+    await persist_question(session_id, parsed, question_embedding)
+    return parsed, attempt
+
+async def generate_quiz_batch_core(req: QuizRequest, session_id: str, count: int, context: Optional[QuizContext] = None):
+    """Batch mode of generate_quiz_core: up to `count` questions per LLM call
+
+    Survivors are persisted in one history write. Returns (questions, attempts).
+    """
+    if context is None:
+        context = await load_quiz_context(req, session_id)
+    questions, attempts = await generate_question_batch(
+        req.domain_name,
+        req.program_name,
+        context.adjusted_level,
+        context.combined_history,
+        context.history_matrix,
+        count,
+    )
+    await persist_questions(session_id, questions)
+    return [parsed for parsed, _ in questions], attempts
+
+def request_params(req: QuizRequest) -> tuple:
+    """Parameters that identify a session's in-flight prefetch job"""
+    return (req.domain_name, req.program_name, req.level)
+
+async def prefetch_next(req_copy: QuizRequest, session_id: str):
+    """Prefetch up to PREFETCH_DEPTH questions ahead for a session
+
+    Questions are only persisted when served, so a prefetch that goes
+    stale (level moved, TTL expired) never pollutes session history. Each
+    prefetched question is added to the local dedup context so the queue
+    holds no repeats.
+    """
+    detach_trace()
+    context = await load_quiz_context(req_copy, session_id)
+    params = prefetch_params(req_copy, context)
+    needed = PREFETCH_DEPTH - PREFETCH_CACHE.queued(session_id, params)
+
+    for _ in range(needed):
+        parsed, attempt, question_embedding = await produce_question(req_copy, context)
+        PREFETCH_CACHE.put(session_id, params, (parsed, attempt, question_embedding))
+        context.combined_history.append({"question_text": parsed["question_text"]})
+        context.history_matrix = np.vstack([context.history_matrix, question_embedding.reshape(1, -1)])
+
+def schedule_prefetch(req: QuizRequest, session_id: str, context: QuizContext) -> None:
+    """Queue a prefetch on the bounded executor if the session needs one"""
+    if PREFETCH_DEPTH <= 0:
+        return
+    if PREFETCH_CACHE.queued(session_id, prefetch_params(req, context)) >= PREFETCH_DEPTH:
+        return
+    req_copy = req.copy(deep=True)
+    PREFETCH_EXECUTOR.submit(
+        session_id,
+        request_params(req),
+        lambda: prefetch_next(req_copy, session_id),
+    )
+
+def prefetched_question_usable(parsed: dict, question_embedding, context: QuizContext) -> bool:
+    """Re-check a prefetched question against the history loaded for this request
+
+    History may have grown since the prefetch ran (request history, a
+    question served by another worker), so exact and semantic dedup run
+    again; the stored embedding means nothing is re-encoded.
+    """
+    correct_idx = parsed.get("correct_option_index")
+    if correct_idx not in (0, 1, 2, 3):
+        log.warning("Prefetched question has invalid correct_option_index %s, regenerating", correct_idx)
+        return False
+    if exact_repeat(parsed["question_text"], context.combined_history):
+        DEDUP_REJECTIONS.inc("QUIZ PREFETCH", "exact")
+        log.debug("Prefetched question %s is now an exact repeat, regenerating", parsed["question_id"])
+        return False
+    if semantic_repeat(
+        parsed["question_text"],
+        context.combined_history,
+        history_matrix=context.history_matrix,
+        question_embedding=question_embedding,
+    ):
+        DEDUP_REJECTIONS.inc("QUIZ PREFETCH", "semantic")
+        log.debug("Prefetched question %s is now a semantic repeat, regenerating", parsed["question_id"])
+        return False
+    return True
+
+async def serve_quiz_question(req: QuizRequest, session_id: str, on_event=None) -> dict:
+    """Serve the next question for a session (prefetch cache, bank or LLM)
+
+    Shared by the JSON and SSE endpoints; returns the response payload.
+    """
+    # A prefetch still running for other parameters will never be served.
+    # One generating for these parameters is waited for: generating here in
+    # parallel would serve two near-identical questions in a row. Its
+    # result is re-checked for repeats when taken from the cache below.
+    PREFETCH_EXECUTOR.cancel(session_id, request_params(req))
+    await PREFETCH_EXECUTOR.wait(session_id, request_params(req))
+
+    context = await load_quiz_context(req, session_id)
+
+    # Check prefetch cache first; entries built for other parameters are dropped
+    cached = PREFETCH_CACHE.take(session_id, prefetch_params(req, context))
+    if cached is not None:
+        parsed, attempt, question_embedding = cached
+        if prefetched_question_usable(parsed, question_embedding, context):
+            await mark_served(parsed)
+            await persist_question(session_id, parsed, question_embedding)
+            schedule_prefetch(req, session_id, context)
+
+            # Transform to frontend format
+            response_data = transform_backend_to_frontend(parsed)
+            return {
+                "status": "success",
+                "session_id": session_id,
+                "attempts_used": attempt,
+                "data": response_data
+            }
 
     # Generate new question
-    parsed, attempt = generate_quiz_core(req, session_id)
+    parsed, attempt = await generate_quiz_core(req, session_id, context, on_event=on_event)
     
     # Final safety check before sending
     correct_idx = parsed.get("correct_option_index")
     if correct_idx not in (0, 1, 2, 3):
-        print(f"[CRITICAL] Generated question has invalid correct_option_index: {correct_idx}")
+        log.error("Generated question has invalid correct_option_index %s", correct_idx)
         raise RuntimeError("Invalid question generated")
+    await mark_served(parsed)
 
     # Transform to frontend format
     response_data = transform_backend_to_frontend(parsed)
     
-    print(f"\n[RESPONSE] Sending to frontend:")
-    print(f"  Session ID: {session_id}")
-    print(f"  Question: {response_data['question'][:80]}...")
-    print(f"  Correct Answer: {response_data['options'][response_data['correctIndex']]}")
-    print(f"  Attempts used: {attempt}")
-    print(f"{'='*60}\n")
-    
+    log.debug("Sending question %s after %d attempt(s)", parsed["question_id"], attempt)
+
     # Prefetch next in background
-    threading.Thread(
-        target=prefetch_next,
-        args=(req.copy(deep=True), session_id),
-        daemon=True
-    ).start()
+    schedule_prefetch(req, session_id, context)
 
     return {
         "status": "success",
@@ -295,3 +633,80 @@ async def generate_quiz_question(req: QuizRequest):
         "data": response_data
     }
 
+@router.post("")
+async def generate_quiz_question(req: QuizRequest):
+    """Generate an adaptive quiz question"""
+    session_id = req.session_id or str(uuid.uuid4())
+    
+    bind_session(session_id)
+    log.debug("Quiz request: domain=%s program=%s level=%d", req.domain_name, req.program_name, req.level)
+
+    return await serve_quiz_question(req, session_id)
+
+@router.post("/batch")
+async def generate_quiz_batch(req: QuizBatchRequest):
+    """Generate up to `count` adaptive quiz questions with as few LLM calls as possible"""
+    session_id = req.session_id or str(uuid.uuid4())
+    bind_session(session_id)
+    log.debug("Quiz batch: domain=%s program=%s level=%d count=%d", req.domain_name, req.program_name, req.level, req.count)
+
+    # Any queued prefetch was built against the old history
+    PREFETCH_EXECUTOR.cancel(session_id)
+    PREFETCH_CACHE.discard(session_id)
+
+    questions, attempts = await generate_quiz_batch_core(req, session_id, req.count)
+    return {
+        "status": "success",
+        "session_id": session_id,
+        "attempts_used": attempts,
+        "requested": req.count,
+        "data": [transform_backend_to_frontend(parsed) for parsed in questions],
+    }
+
+@router.post("/stream")
+async def stream_quiz_question(req: QuizRequest):
+    """Generate an adaptive quiz question as Server-Sent Events
+
+    Emits "field" events as individual fields of an attempt complete,
+    "retry" when an attempt is rejected (discard its fields), then a final
+    "complete" event with the same payload as POST /quiz, or "error".
+    """
+    session_id = req.session_id or str(uuid.uuid4())
+    bind_session(session_id)
+    log.debug("Quiz stream: domain=%s program=%s level=%d", req.domain_name, req.program_name, req.level)
+
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def emit(event: str, data: dict) -> None:
+        await events.put((event, data))
+
+    async def run() -> None:
+        try:
+            await emit("complete", await serve_quiz_question(req, session_id, on_event=emit))
+        except Exception as e:
+            log.warning("Quiz stream failed: %s", e)
+            await emit("error", {"status": "error", "session_id": session_id, "message": str(e)})
+        finally:
+            await events.put(None)
+
+    task = asyncio.create_task(run())
+
+    async def event_source():
+        try:
+            yield f"event: session\ndata: {json.dumps({'session_id': session_id})}\n\n"
+            while True:
+                item = await events.get()
+                if item is None:
+                    break
+                event, data = item
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            # Client went away: stop generating
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,79 +1,122 @@
+import asyncio
 import json
-import requests
-from fastapi import APIRouter, HTTPException
+import numpy as np
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import ValidationError
 from app.config import (
-    OLLAMA_URL,
-    OLLAMA_MODEL,
-    USE_GROQ,
-    GROQ_API_KEY,
-    GROQ_MODEL,
-    GROQ_API_URL,
+    STATISTICS_USE_LLM,
+    STATISTICS_BATCH_MAX_ITEMS,
+    STATISTICS_BATCH_LLM_CONCURRENCY,
+    GENERATION_STATS,
 )
 from app.models import (
     StatisticsTestData,
     StatisticsApiResponse,
     StatisticsSummary,
+    StatisticsBatchResponse,
+    BatchItemError,
+    RecommendationsOutput,
 )
-from app.prompts.statistics_prompt import STATISTICS_SYSTEM_PROMPT, build_statistics_prompt
+from app.prompts.statistics_prompt import build_recommendations_prompt
+from app.utils.llm_client import generate
+from app.utils.semantic import encode_texts_async
+from app.utils.level_stats import build_summary, group_stats, percentiles, percentile_row
+from app.utils.topic_analysis import (
+    cluster_embeddings,
+    label_clusters,
+    topic_report,
+    local_recommendations,
+)
+from app.utils.log import get_logger
+from app.utils.tracing import span
 
 router = APIRouter(prefix="/statistics", tags=["statistics"])
+log = get_logger("statistics")
 
+# Returned for a level with no attempted questions
+NO_QUESTIONS_RECOMMENDATIONS = (
+    "Start by reviewing the topic overview.",
+    "Take the first quiz to assess your baseline.",
+    "Focus on foundational concepts.",
+    "Review examples and practice problems.",
+    "Track your progress over time.",
+)
 
 
 def _compute_summary(test_data: StatisticsTestData) -> dict:
     """Compute summary statistics with edge case handling."""
     q = test_data.level.questions
     total = len(q)
-
     if total == 0:
-        return {
-            "accuracy_percent": 0.0,
-            "avg_time_seconds": 0.0,
-            "speed_profile": "Balanced",
-            "behavior_insights": ["No questions attempted."],
-        }
+        return build_summary(0, 0.0, 0.0)
 
     correct = sum(1 for i in q if i.is_correct)
-    accuracy = correct / total * 100
     avg_time = sum(i.time_taken_seconds for i in q) / total
+    return build_summary(total, correct / total * 100, avg_time)
 
-    if avg_time <= 3:
-        speed = "Fast"
-    elif avg_time <= 8:
-        speed = "Balanced"
-    else:
-        speed = "Slow"
-
-    insights = []
-    if accuracy >= 90:
-        insights.append("Excellent performance; ready for advanced topics.")
-    elif accuracy >= 70:
-        insights.append("Good understanding of core concepts.")
-    elif accuracy >= 50:
-        insights.append("Moderate performance; needs more practice.")
-    else:
-        insights.append("Low accuracy; revisit fundamentals urgently.")
-
-    if speed == "Fast" and accuracy < 70:
-        insights.append("Quick answers but lower accuracy; read carefully.")
-    elif speed == "Slow" and accuracy >= 70:
-        insights.append("Slower pace but accurate; refine time management.")
-    elif speed == "Slow" and accuracy < 70:
-        insights.append("Slow pace and low accuracy; need focused practice.")
-
-    return {
-        "accuracy_percent": round(accuracy, 2),
-        "avg_time_seconds": round(avg_time, 2),
-        "speed_profile": speed,
-        "behavior_insights": insights[:2] or ["Neutral performance."],
-    }
 
+async def analyze_topics(test_data: StatisticsTestData) -> dict:
+    """Local topic analysis: cluster question embeddings, then aggregate per topic."""
+    questions = test_data.level.questions
+    texts = [q.question_text for q in questions]
+    with span("encode"):
+        embeddings = await encode_texts_async(texts)
+    with span("cluster"):
+        labels = cluster_embeddings(embeddings)
+        names = label_clusters(texts, labels, exclude=f"{test_data.domain_name} {test_data.program_name}")
+    return topic_report(
+        labels,
+        names,
+        np.array([q.is_correct for q in questions], dtype=bool),
+        np.array([q.time_taken_seconds for q in questions], dtype=np.float64),
+    )
 
-@router.post("/analyze", response_model=StatisticsApiResponse)
-def analyze_statistics(req: StatisticsTestData):
-    """Analyze test data and return strengths, weaknesses, and recommendations."""
+
+async def llm_recommendations(test_data: StatisticsTestData, summary: dict, topics: dict) -> Optional[List[str]]:
+    """Ask the LLM for recommendation prose only; None if it fails or is malformed."""
     from app.utils.text_processing import clean_json_string
 
+    prompt = build_recommendations_prompt(
+        domain_name=test_data.domain_name,
+        program_name=test_data.program_name,
+        level_id=test_data.level.level_id,
+        summary_json=json.dumps(summary, ensure_ascii=False),
+        topics_json=json.dumps(topics, ensure_ascii=False),
+    )
+    try:
+        raw_text = await generate(
+            prompt,
+            0.3,
+            max_tokens=600,
+            tag="STATISTICS",
+            schema=RecommendationsOutput,
+        )
+        data = json.loads(clean_json_string(raw_text))
+    except Exception as e:
+        log.warning("Recommendation generation failed, using local ones: %s", e)
+        GENERATION_STATS.record("STATISTICS", 1, False)
+        return None
+
+    recs = data.get("recommendations") if isinstance(data, dict) else None
+    if not isinstance(recs, list) or len(recs) != 5 or not all(isinstance(r, str) and r.strip() for r in recs):
+        log.warning("Invalid recommendations from LLM, using local ones")
+        GENERATION_STATS.record("STATISTICS", 1, False)
+        return None
+    GENERATION_STATS.record("STATISTICS", 1, True)
+    return recs
+
+
+@router.post("/analyze", response_model=StatisticsApiResponse)
+async def analyze_statistics(req: StatisticsTestData, use_llm: bool = STATISTICS_USE_LLM):
+    """Analyze test data and return strengths, weaknesses, and recommendations.
+
+    Summary, topic breakdown and strong/weak topics are computed locally by
+    clustering question embeddings. The LLM is only asked for the
+    recommendation prose, and only when `use_llm` is set (off by default,
+    see STATISTICS_USE_LLM); rule-based recommendations are used otherwise
+    or if it fails.
+    """
     try:
         test_data = req
         if not test_data.domain_name or not test_data.program_name:
@@ -84,95 +127,190 @@ def analyze_statistics(req: StatisticsTestData):
                 domain_name=test_data.domain_name,
                 program_name=test_data.program_name,
                 level_id=test_data.level.level_id,
-                summary=StatisticsSummary(
-                    accuracy_percent=0.0,
-                    avg_time_seconds=0.0,
-                    speed_profile="Balanced",
-                    behavior_insights=["No questions attempted."],
-                ),
+                summary=StatisticsSummary(**build_summary(0, 0.0, 0.0)),
                 strong_topics=[],
                 weak_topics=[],
-                recommendations=[
-                    "Start by reviewing the topic overview.",
-                    "Take the first quiz to assess your baseline.",
-                    "Focus on foundational concepts.",
-                    "Review examples and practice problems.",
-                    "Track your progress over time.",
-                ],
+                recommendations=list(NO_QUESTIONS_RECOMMENDATIONS),
                 topic_breakdown=[],
             )
 
-        questions_json = json.dumps(
-            [q.model_dump() for q in test_data.level.questions], ensure_ascii=False
-        )
-        summary_dict = _compute_summary(test_data)
-        summary_json = json.dumps(summary_dict, ensure_ascii=False)
+        summary = _compute_summary(test_data)
+        topics = await analyze_topics(test_data)
+
+        recommendations = None
+        if use_llm:
+            recommendations = await llm_recommendations(test_data, summary, topics)
+        if recommendations is None:
+            recommendations = local_recommendations(summary, topics["weak_topics"], topics["strong_topics"])
 
-        prompt = build_statistics_prompt(
+        return StatisticsApiResponse(
             domain_name=test_data.domain_name,
             program_name=test_data.program_name,
             level_id=test_data.level.level_id,
-            difficulty_score=test_data.level.difficulty_score,
-            questions_json=questions_json,
-            summary_json=summary_json,
+            summary=StatisticsSummary(**summary),
+            recommendations=recommendations,
+            **topics,
         )
-        # Call LLM via Groq or Ollama, same pattern as other routes
-        if USE_GROQ:
-            headers = {
-                "Authorization": f"Bearer {GROQ_API_KEY}",
-                "Content-Type": "application/json",
-            }
-            payload = {
-                "model": GROQ_MODEL,
-                "messages": [
-                    {"role": "system", "content": STATISTICS_SYSTEM_PROMPT},
-                    {"role": "user", "content": prompt},
-                ],
-                "temperature": 0.3,
-                "max_completion_tokens": 1500,
-            }
-            resp = requests.post(GROQ_API_URL, headers=headers, json=payload, timeout=30)
-            if resp.status_code >= 400:
-                print("[GROQ STATISTICS ERROR] Status:", resp.status_code)
-                print("[GROQ STATISTICS ERROR] Body:\n", resp.text)
-            resp.raise_for_status()
-            raw_text = resp.json().get("choices", [])[0].get("message", {}).get("content", "")
-        else:
-            resp = requests.post(
-                OLLAMA_URL,
-                json={
-                    "model": OLLAMA_MODEL,
-                    "prompt": prompt,
-                    "stream": False,
-                    "format": "json",
-                    "options": {"temperature": 0.3},
-                },
-                timeout=30,
-            )
-            resp.raise_for_status()
-            raw_text = resp.json().get("response", "")
-
-        text = clean_json_string(raw_text)
-        data = json.loads(text)
-
-        if "strong_topics" not in data:
-            data["strong_topics"] = []
-        if "weak_topics" not in data:
-            data["weak_topics"] = []
-        if "recommendations" not in data or len(data["recommendations"]) != 5:
-            data["recommendations"] = [
-                "Review weak topics thoroughly.",
-                "Practice regularly on challenging concepts.",
-                "Use active learning strategies.",
-                "Take timed practice tests.",
-                "Seek help on difficult topics.",
-            ]
-        if "topic_breakdown" not in data:
-            data["topic_breakdown"] = []
-
-        return StatisticsApiResponse(**data)
-
-    except json.JSONDecodeError as e:
-        raise HTTPException(status_code=500, detail=f"Invalid JSON from AI model: {str(e)}")
+
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e) or "Statistics analysis failed")
+
+
+async def read_batch_items(request: Request) -> Tuple[List[int], List[StatisticsTestData], List[BatchItemError]]:
+    """Parse a JSON array or NDJSON body of test data.
+
+    Returns the batch positions of the valid items, the items themselves,
+    and an error per invalid item.
+
+    NDJSON (Content-Type application/x-ndjson) is parsed line by line as it
+    streams in, so a large upload is never held as one JSON document.
+    """
+    indexes: List[int] = []
+    items: List[StatisticsTestData] = []
+    errors: List[BatchItemError] = []
+
+    def add(index: int, raw) -> None:
+        if index >= STATISTICS_BATCH_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"At most {STATISTICS_BATCH_MAX_ITEMS} items per batch")
+        try:
+            if isinstance(raw, (str, bytes)):
+                item = StatisticsTestData.model_validate_json(raw)
+            else:
+                item = StatisticsTestData.model_validate(raw)
+        except ValidationError as e:
+            errors.append(BatchItemError(index=index, error=str(e)))
+            return
+        items.append(item)
+        indexes.append(index)
+
+    if "ndjson" in request.headers.get("content-type", ""):
+        buffer = b""
+        index = 0
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    add(index, line)
+                    index += 1
+        if buffer.strip():
+            add(index, buffer)
+    else:
+        try:
+            body = await request.json()
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+        if not isinstance(body, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of test data")
+        for index, raw in enumerate(body):
+            add(index, raw)
+
+    return indexes, items, errors
+
+
+async def batch_topic_labels(items: List[StatisticsTestData], texts: List[str]) -> Tuple[np.ndarray, List[str]]:
+    """Cluster every question of the batch at once so topics match across learners.
+
+    Identical question texts (common in a class that took the same test)
+    are embedded and clustered once.
+    """
+    unique = list(dict.fromkeys(texts))
+    position = {text: i for i, text in enumerate(unique)}
+    with span("encode"):
+        embeddings = await encode_texts_async(unique)
+    with span("cluster"):
+        unique_labels = cluster_embeddings(embeddings)
+        exclude = " ".join(dict.fromkeys(f"{t.domain_name} {t.program_name}" for t in items))
+        names = label_clusters(unique, unique_labels, exclude=exclude)
+    labels = unique_labels[np.array([position[text] for text in texts], dtype=np.int64)]
+    return labels, names
+
+
+@router.post("/analyze_batch", response_model=StatisticsBatchResponse)
+async def analyze_statistics_batch(request: Request, use_llm: bool = False, topics: bool = True):
+    """Analyze many learners' test data in one request and add cohort statistics.
+
+    The body is a JSON array of StatisticsTestData, or NDJSON with one per
+    line. Summaries and percentiles are computed for all learners together
+    with numpy; topics are clustered once across the whole batch. The LLM
+    only writes recommendations when `use_llm` is set.
+    """
+    indexes, items, errors = await read_batch_items(request)
+    if not items:
+        raise HTTPException(status_code=400, detail="No valid test data in batch")
+
+    n = len(items)
+    lengths = np.array([len(t.level.questions) for t in items], dtype=np.int64)
+    group = np.repeat(np.arange(n), lengths)
+    questions = [q for t in items for q in t.level.questions]
+    is_correct = np.array([q.is_correct for q in questions], dtype=bool)
+    times = np.array([q.time_taken_seconds for q in questions], dtype=np.float64)
+    stats = group_stats(group, n, is_correct, times)
+
+    summaries = [
+        build_summary(int(stats["counts"][i]), float(stats["accuracy"][i]), float(stats["avg_time"][i]))
+        for i in range(n)
+    ]
+
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    empty_report = {"strong_topics": [], "weak_topics": [], "topic_breakdown": []}
+    reports = [empty_report] * n
+    cohort_report = empty_report
+    if topics and questions:
+        labels, names = await batch_topic_labels(items, [q.question_text for q in questions])
+        reports = [
+            topic_report(labels[s:e], names, is_correct[s:e], times[s:e]) if e > s else empty_report
+            for s, e in zip(starts, ends)
+        ]
+        cohort_report = topic_report(labels, names, is_correct, times)
+
+    recommendations: List[Optional[List[str]]] = [None] * n
+    if use_llm:
+        semaphore = asyncio.Semaphore(STATISTICS_BATCH_LLM_CONCURRENCY)
+
+        async def recommend(i: int) -> None:
+            async with semaphore:
+                recommendations[i] = await llm_recommendations(items[i], summaries[i], reports[i])
+
+        await asyncio.gather(*(recommend(i) for i in range(n) if lengths[i]))
+
+    learners = []
+    for i, test_data in enumerate(items):
+        if not lengths[i]:
+            recs = list(NO_QUESTIONS_RECOMMENDATIONS)
+        else:
+            recs = recommendations[i] or local_recommendations(
+                summaries[i], reports[i]["weak_topics"], reports[i]["strong_topics"]
+            )
+        learners.append({
+            "index": indexes[i],
+            "domain_name": test_data.domain_name,
+            "program_name": test_data.program_name,
+            "level_id": test_data.level.level_id,
+            "question_count": int(lengths[i]),
+            "summary": summaries[i],
+            "time_percentiles": percentile_row(stats["time_percentiles"][i]),
+            "recommendations": recs,
+            **reports[i],
+        })
+
+    attempted = lengths > 0
+    speed_profiles = {"Fast": 0, "Balanced": 0, "Slow": 0}
+    for i in np.flatnonzero(attempted):
+        speed_profiles[summaries[i]["speed_profile"]] += 1
+
+    cohort = {
+        "learners": n,
+        "questions": len(questions),
+        "accuracy_percent": round(float(is_correct.mean() * 100), 2) if questions else 0.0,
+        "avg_time_seconds": round(float(times.mean()), 2) if questions else 0.0,
+        "accuracy_percentiles": percentiles(stats["accuracy"][attempted]),
+        "time_percentiles": percentiles(times),
+        "avg_time_percentiles": percentiles(stats["avg_time"][attempted]),
+        "speed_profiles": speed_profiles,
+        "weak_topics": cohort_report["weak_topics"],
+        "topic_breakdown": cohort_report["topic_breakdown"],
+    }
+    log.debug("Batch of %d learners, %d questions, %d invalid item(s)", n, len(questions), len(errors))
+    return StatisticsBatchResponse(learners=learners, cohort=cohort, errors=errors)
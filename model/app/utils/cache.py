@@ -0,0 +1,207 @@
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """Thread-safe LRU cache with a size cap and a per-entry TTL.
+
+    Expired entries are dropped lazily on access and whenever the cache is
+    written to, so memory stays bounded on long-running workers.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def _purge_expired(self, now: float) -> None:
+        for key in [k for k, (expires_at, _) in self._data.items() if expires_at <= now]:
+            del self._data[key]
+            self.expired += 1
+
+    def _lookup(self, key: Hashable, remove: bool) -> Tuple[bool, Any]:
+        """Return (found, value) without touching hit/miss counters"""
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.expired += 1
+            return False, None
+        if remove:
+            del self._data[key]
+        else:
+            self._data.move_to_end(key)
+        return True, value
+
+    def _count(self, found: bool) -> None:
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            found, value = self._lookup(key, remove=False)
+            self._count(found)
+            return value if found else default
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            found, value = self._lookup(key, remove=True)
+            self._count(found)
+            return value if found else default
+
+    def _store(self, key: Hashable, value: Any, ttl_seconds: Optional[float]) -> None:
+        """Insert with the lock held, evicting expired then least-recently-used entries"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        now = time.monotonic()
+        self._purge_expired(now)
+        self._data[key] = (now + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        with self._lock:
+            self._store(key, value, ttl_seconds)
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            found, _ = self._lookup(key, remove=False)
+            return found
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+            }
+
+
+class PrefetchCache(TTLCache):
+    """Per-session queues of prefetched items tagged with their parameters.
+
+    Entries are keyed by session_id plus (domain, program, adjusted level).
+    Each session holds up to PREFETCH_DEPTH items built for one parameter
+    set. A lookup whose parameters no longer match, e.g. after
+    auto_adjust_level moved the learner, counts as stale and the queue is
+    discarded instead of being served.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        super().__init__(max_size, ttl_seconds)
+        self.stale = 0
+
+    def put(self, session_id: str, params: Hashable, value: Any) -> None:
+        """Append to the session's queue, replacing it if `params` changed"""
+        with self._lock:
+            found, entry = self._lookup(session_id, remove=False)
+            if found and entry[0] == params:
+                queue = entry[1] + [value]
+            else:
+                queue = [value]
+            self._store(session_id, (params, queue), None)
+
+    def take(self, session_id: str, params: Hashable) -> Any:
+        """Pop the oldest queued item if the queue matches `params`"""
+        with self._lock:
+            found, entry = self._lookup(session_id, remove=False)
+            if found and entry[0] != params:
+                del self._data[session_id]
+                self.stale += 1
+                return None
+            self._count(found)
+            if not found:
+                return None
+            queue = entry[1]
+            value = queue.pop(0)
+            if not queue:
+                del self._data[session_id]
+            return value
+
+    def queued(self, session_id: str, params: Hashable) -> int:
+        """Number of items queued for the session under `params`"""
+        with self._lock:
+            found, entry = self._lookup(session_id, remove=False)
+        return len(entry[1]) if found and entry[0] == params else 0
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["stale"] = self.stale
+        return stats
+
+
+class SemanticCache(TTLCache):
+    """TTL/LRU cache that can also match entries by embedding similarity.
+
+    Keys are (namespace, hash) tuples and every entry keeps the unit-length
+    embedding of the text it was stored under. `get_exact` looks up the
+    hash; `get_similar` returns the nearest live entry of the same namespace
+    whose cosine similarity reaches `threshold`.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, threshold: float):
+        super().__init__(max_size, ttl_seconds)
+        self.threshold = threshold
+        self.semantic_hits = 0
+
+    def get_exact(self, key: Hashable) -> Any:
+        """Value stored under `key`, or None; misses are counted by get_similar"""
+        with self._lock:
+            found, entry = self._lookup(key, remove=False)
+            if not found:
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def get_similar(self, namespace: Hashable, embedding: np.ndarray) -> Tuple[Any, float]:
+        """(value, similarity) of the nearest entry above threshold, else (None, best)"""
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            keys = [key for key in self._data if key[0] == namespace]
+            if not keys:
+                self.misses += 1
+                return None, 0.0
+            matrix = np.vstack([self._data[key][1][0] for key in keys])
+            similarity = matrix @ np.asarray(embedding, dtype=np.float32)
+            best = int(similarity.argmax())
+            if similarity[best] < self.threshold:
+                self.misses += 1
+                return None, float(similarity[best])
+            self._data.move_to_end(keys[best])
+            self.semantic_hits += 1
+            return self._data[keys[best]][1][1], float(similarity[best])
+
+    def put(self, key: Hashable, embedding: np.ndarray, value: Any) -> None:
+        with self._lock:
+            self._store(key, (np.asarray(embedding, dtype=np.float32), value), None)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["semantic_hits"] = self.semantic_hits
+        lookups = self.hits + self.semantic_hits + self.misses
+        stats["hit_rate"] = round((self.hits + self.semantic_hits) / lookups, 4) if lookups else 0.0
+        return stats
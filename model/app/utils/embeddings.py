@@ -0,0 +1,132 @@
+import asyncio
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from app.utils.log import get_logger
+
+log = get_logger("embeddings")
+
+# Embedding backends selectable with EMBEDDING_BACKEND:
+#   torch       full-precision PyTorch model (original behaviour)
+#   torch-int8  PyTorch with dynamic int8 quantization of the Linear layers
+#   onnx        ONNX Runtime via sentence-transformers (needs optimum[onnxruntime])
+EMBEDDING_BACKENDS = ("torch", "torch-int8", "onnx")
+
+
+def load_embedding_model(backend: str, model_name: str, onnx_file: Optional[str] = None) -> Any:
+    """Load a SentenceTransformer for the given backend.
+
+    Every backend returns an object with the SentenceTransformer `encode` /
+    `get_sentence_embedding_dimension` interface, so semantic.py does not
+    care which one is active. `onnx_file` picks a specific export from the
+    model repo, e.g. "onnx/model_qint8_avx512.onnx" for the int8 ONNX model.
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r}, expected one of {EMBEDDING_BACKENDS}")
+
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "onnx":
+        model_kwargs: Dict[str, Any] = {}
+        if onnx_file:
+            model_kwargs["file_name"] = onnx_file
+        model = SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+    else:
+        model = SentenceTransformer(model_name, device="cpu" if backend == "torch-int8" else None)
+
+    if backend == "torch-int8":
+        import torch
+
+        # Quantized kernels are CPU-only; weights of every nn.Linear become int8
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    log.info("Loaded %s with %s backend", model_name, backend)
+    return model
+
+
+class EmbeddingBatcher:
+    """Micro-batching front end for an encode function.
+
+    Concurrent `encode` calls are collected for up to `max_wait_ms` (or
+    until `max_batch` texts are pending) and encoded together in one call on
+    a dedicated worker thread, so the event loop never runs a forward pass
+    and N concurrent requests cost one batched pass instead of N small ones.
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray], max_wait_ms: float, max_batch: int):
+        self.encode_fn = encode_fn
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch = max_batch
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: List[Tuple[List[str], asyncio.Future]] = []
+        self._pending_texts = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._runs: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.texts = 0
+        self.requests = 0
+
+    def _worker(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding")
+        return self._executor
+
+    async def encode(self, texts: List[str]) -> np.ndarray:
+        """Encode texts with the next batch; returns the (N, D) matrix for them"""
+        loop = asyncio.get_running_loop()
+        texts = list(texts)
+        if not texts:
+            return await loop.run_in_executor(self._worker(), self.encode_fn, [])
+
+        future = loop.create_future()
+        self._pending.append((texts, future))
+        self._pending_texts += len(texts)
+        self.requests += 1
+        if self._pending_texts >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending, self._pending_texts = self._pending, [], 0
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._runs.add(task)
+            task.add_done_callback(self._runs.discard)
+
+    async def _run(self, batch: List[Tuple[List[str], asyncio.Future]]) -> None:
+        loop = asyncio.get_running_loop()
+        all_texts = [text for texts, _ in batch for text in texts]
+        self.batches += 1
+        self.texts += len(all_texts)
+        try:
+            matrix = await loop.run_in_executor(self._worker(), self.encode_fn, all_texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        start = 0
+        for texts, future in batch:
+            if not future.done():
+                future.set_result(matrix[start:start + len(texts)])
+            start += len(texts)
+
+    def close(self) -> None:
+        """Stop the worker thread (called on app shutdown)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch": round(self.texts / self.batches, 2) if self.batches else 0.0,
+        }
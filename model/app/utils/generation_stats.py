@@ -0,0 +1,36 @@
+from collections import defaultdict
+from typing import Any, Dict
+from app.utils.metrics import GENERATION_ATTEMPTS
+
+
+class GenerationStats:
+    """LLM attempts per successful generation, by route tag.
+
+    Routes call `record` once per generation request with the number of
+    LLM calls it took; attempts_per_success shows how much the retry path
+    is still used (1.0 means every output was accepted first time).
+    """
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"requests": 0, "successes": 0, "failures": 0, "attempts": 0, "retried": 0}
+        )
+
+    def record(self, tag: str, attempts: int, success: bool) -> None:
+        stats = self._stats[tag]
+        stats["requests"] += 1
+        stats["attempts"] += attempts
+        stats["successes" if success else "failures"] += 1
+        if attempts > 1:
+            stats["retried"] += 1
+        GENERATION_ATTEMPTS.observe(attempts, tag, "success" if success else "failure")
+
+    def stats(self) -> Dict[str, Any]:
+        result = {}
+        for tag, stats in sorted(self._stats.items()):
+            result[tag] = {
+                **stats,
+                "attempts_per_success": round(stats["attempts"] / stats["successes"], 3) if stats["successes"] else None,
+                "retry_rate": round(stats["retried"] / stats["requests"], 3) if stats["requests"] else 0.0,
+            }
+        return result
@@ -0,0 +1,157 @@
+import json
+from typing import Any, List, Optional, Tuple
+
+_WHITESPACE = " \t\r\n"
+
+
+class JSONFieldStream:
+    """Incremental parser for a single top-level JSON object.
+
+    Feed it text chunks as they arrive from the model; `feed` returns the
+    (key, value) pairs of top-level fields that completed in that chunk, so
+    callers can act on `question_text` long before `explanation` is done.
+
+    Text before the opening brace is collected in `prefix`. Structural
+    problems set `error` and stop parsing. While a top-level array value is
+    open, `array_items` counts the elements started so far.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.prefix = ""
+        self.fields = {}
+        self.error: Optional[str] = None
+        self.current_key: Optional[str] = None
+        self.array_items = 0
+        self.done = False
+        self._pos = 0
+        self._state = "prefix"  # prefix, key, colon, value_start, value, after_value, done
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._token_start = 0
+        self._value_is_array = False
+        self._array_has_item = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume a chunk and return the top-level fields it completed"""
+        self.buffer += chunk
+        completed: List[Tuple[str, Any]] = []
+        while self._pos < len(self.buffer) and self.error is None and not self.done:
+            self._step(self.buffer[self._pos], completed)
+            self._pos += 1
+        return completed
+
+    def _fail(self, message: str) -> None:
+        self.error = message
+
+    def _emit(self, end: int, completed: List[Tuple[str, Any]]) -> None:
+        raw = self.buffer[self._token_start:end]
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError as e:
+            self._fail(f"Invalid value for {self.current_key}: {e.msg}")
+            return
+        self.fields[self.current_key] = value
+        completed.append((self.current_key, value))
+        self._state = "after_value"
+
+    def _step(self, c: str, completed: List[Tuple[str, Any]]) -> None:
+        state = self._state
+
+        if state == "prefix":
+            if c == "{":
+                self._state = "key"
+            else:
+                self.prefix += c
+            return
+
+        if state == "key":
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self.current_key = json.loads(self.buffer[self._token_start:self._pos + 1])
+                    self._state = "colon"
+            elif c == '"':
+                self._in_string = True
+                self._token_start = self._pos
+            elif c == "}" and not self.fields:
+                self.done = True
+            elif c not in _WHITESPACE:
+                self._fail(f"Expected a field name, got {c!r}")
+            return
+
+        if state == "colon":
+            if c == ":":
+                self._state = "value_start"
+            elif c not in _WHITESPACE:
+                self._fail(f"Expected ':' after {self.current_key!r}, got {c!r}")
+            return
+
+        if state == "value_start":
+            if c in _WHITESPACE:
+                return
+            self._state = "value"
+            self._token_start = self._pos
+            self._depth = 0
+            self._value_is_array = c == "["
+            self._array_has_item = False
+            self.array_items = 0
+            self._step_value(c, completed)
+            return
+
+        if state == "value":
+            self._step_value(c, completed)
+            return
+
+        if state == "after_value":
+            if c == ",":
+                self._state = "key"
+                self.current_key = None
+            elif c == "}":
+                self.done = True
+            elif c not in _WHITESPACE:
+                self._fail(f"Expected ',' or '}}' after {self.current_key!r}, got {c!r}")
+
+    def _step_value(self, c: str, completed: List[Tuple[str, Any]]) -> None:
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif c == "\\":
+                self._escape = True
+            elif c == '"':
+                self._in_string = False
+                if self._depth == 0:
+                    self._emit(self._pos + 1, completed)
+            return
+
+        if self._value_is_array and self._depth == 1 and not self._array_has_item and c not in _WHITESPACE + "]":
+            self._array_has_item = True
+            self.array_items += 1
+
+        if c == '"':
+            self._in_string = True
+        elif c in "{[":
+            self._depth += 1
+        elif c in "}]":
+            if self._depth == 0:
+                # Closing brace of the top-level object right after a scalar
+                self._emit(self._pos, completed)
+                if self.error is None:
+                    self.done = True
+                return
+            self._depth -= 1
+            if self._depth == 0:
+                self._emit(self._pos + 1, completed)
+        elif c == ",":
+            if self._depth == 0:
+                self._emit(self._pos, completed)
+                if self.error is None:
+                    self._state = "key"
+                    self.current_key = None
+            elif self._value_is_array and self._depth == 1:
+                self._array_has_item = False
@@ -0,0 +1,97 @@
+import numpy as np
+from typing import Any, Dict, List
+from app.utils.topic_analysis import speed_profile
+
+# Percentiles reported for time and accuracy distributions
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def behavior_insights(accuracy: float, speed: str) -> List[str]:
+    """Up to two short insights from accuracy and speed profile"""
+    insights = []
+    if accuracy >= 90:
+        insights.append("Excellent performance; ready for advanced topics.")
+    elif accuracy >= 70:
+        insights.append("Good understanding of core concepts.")
+    elif accuracy >= 50:
+        insights.append("Moderate performance; needs more practice.")
+    else:
+        insights.append("Low accuracy; revisit fundamentals urgently.")
+
+    if speed == "Fast" and accuracy < 70:
+        insights.append("Quick answers but lower accuracy; read carefully.")
+    elif speed == "Slow" and accuracy >= 70:
+        insights.append("Slower pace but accurate; refine time management.")
+    elif speed == "Slow" and accuracy < 70:
+        insights.append("Slow pace and low accuracy; need focused practice.")
+
+    return insights[:2] or ["Neutral performance."]
+
+
+def build_summary(question_count: int, accuracy: float, avg_time: float) -> Dict[str, Any]:
+    """Level summary dict in the StatisticsSummary shape"""
+    if question_count == 0:
+        return {
+            "accuracy_percent": 0.0,
+            "avg_time_seconds": 0.0,
+            "speed_profile": "Balanced",
+            "behavior_insights": ["No questions attempted."],
+        }
+    speed = speed_profile(avg_time)
+    return {
+        "accuracy_percent": round(accuracy, 2),
+        "avg_time_seconds": round(avg_time, 2),
+        "speed_profile": speed,
+        "behavior_insights": behavior_insights(accuracy, speed),
+    }
+
+
+def percentiles(values: np.ndarray) -> Dict[str, float]:
+    """Percentiles of a 1-D array as {"p10": ..., "p50": ...}; zeros if empty"""
+    if values.size == 0:
+        return {f"p{q}": 0.0 for q in PERCENTILES}
+    result = np.percentile(values, PERCENTILES)
+    return {f"p{q}": round(float(v), 2) for q, v in zip(PERCENTILES, result)}
+
+
+def group_stats(group: np.ndarray, n_groups: int, is_correct: np.ndarray, times: np.ndarray) -> Dict[str, np.ndarray]:
+    """Per-group counts, accuracy, mean time and time percentiles in one pass.
+
+    `group` holds the group index of every question. Nothing loops over
+    groups: counts and sums are bincounts, and percentiles are read out of
+    one array sorted by (group, time) at each group's interpolated
+    positions, matching np.percentile's default linear method.
+    """
+    counts = np.bincount(group, minlength=n_groups)
+    correct = np.bincount(group, weights=is_correct.astype(np.float64), minlength=n_groups)
+    total_time = np.bincount(group, weights=times, minlength=n_groups)
+    accuracy = np.divide(correct * 100, counts, out=np.zeros(n_groups), where=counts > 0)
+    avg_time = np.divide(total_time, counts, out=np.zeros(n_groups), where=counts > 0)
+
+    time_percentiles = np.zeros((n_groups, len(PERCENTILES)))
+    if times.size:
+        sorted_times = times[np.lexsort((times, group))]
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        last = np.maximum(counts - 1, 0)
+        for j, q in enumerate(PERCENTILES):
+            pos = last * (q / 100)
+            lo = np.floor(pos).astype(np.int64)
+            hi = np.ceil(pos).astype(np.int64)
+            frac = pos - lo
+            lo_idx = np.minimum(starts + lo, times.size - 1)
+            hi_idx = np.minimum(starts + hi, times.size - 1)
+            values = sorted_times[lo_idx] * (1 - frac) + sorted_times[hi_idx] * frac
+            time_percentiles[:, j] = np.where(counts > 0, values, 0.0)
+
+    return {
+        "counts": counts,
+        "correct": correct,
+        "accuracy": accuracy,
+        "avg_time": avg_time,
+        "time_percentiles": time_percentiles,
+    }
+
+
+def percentile_row(row: np.ndarray) -> Dict[str, float]:
+    """One row of group_stats()["time_percentiles"] as a percentile dict"""
+    return {f"p{q}": round(float(v), 2) for q, v in zip(PERCENTILES, row)}
@@ -0,0 +1,429 @@
+import asyncio
+import httpx
+import json
+import time
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Optional, Tuple, Type
+from pydantic import BaseModel
+from app.config import (
+    OLLAMA_URL,
+    OLLAMA_MODEL,
+    GROQ_API_KEY,
+    GROQ_MODEL,
+    GROQ_API_URL,
+    LLM_TIMEOUT,
+    LLM_POOL_TIMEOUT,
+    LLM_KEEPALIVE_EXPIRY,
+    GROQ_MAX_CONNECTIONS,
+    OLLAMA_MAX_CONNECTIONS,
+    LLM_ROUTER,
+    LLM_STRUCTURED_OUTPUT,
+    GROQ_RESPONSE_FORMAT,
+    OLLAMA_SCHEMA_FORMAT,
+)
+from app.utils.metrics import LLM_REQUEST_SECONDS, LLM_TOKENS
+from app.utils.log import get_logger
+from app.utils.tracing import span
+
+log = get_logger("llm")
+
+# One pooled AsyncClient per provider, created on first use and shared by
+# every route so keep-alive connections are reused across requests.
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+_MAX_CONNECTIONS = {
+    "groq": GROQ_MAX_CONNECTIONS,
+    "ollama": OLLAMA_MAX_CONNECTIONS,
+}
+
+# Cleared once the Ollama server rejects a schema `format` (Ollama < 0.5)
+_ollama_schema_format = OLLAMA_SCHEMA_FORMAT
+
+
+def get_provider_name() -> str:
+    """Return the provider the router would use for the next call"""
+    return LLM_ROUTER.order()[0]
+
+
+def get_model_name(provider: Optional[str] = None) -> str:
+    """Return the model name used for a provider"""
+    provider = provider or get_provider_name()
+    return GROQ_MODEL if provider == "groq" else OLLAMA_MODEL
+
+
+@lru_cache(maxsize=None)
+def output_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """JSON Schema of a Pydantic model in the form providers accept
+
+    $ref / $defs are inlined and titles dropped: Ollama compiles the schema
+    into a grammar and Groq only supports a subset of JSON Schema.
+    """
+    schema = model.model_json_schema()
+    defs = schema.pop("$defs", {})
+
+    def resolve(node):
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return resolve(defs[node["$ref"].split("/")[-1]])
+            # "title" annotations are strings; a property named title is a dict
+            return {key: resolve(value) for key, value in node.items() if not (key == "title" and isinstance(value, str))}
+        if isinstance(node, list):
+            return [resolve(item) for item in node]
+        return node
+
+    return resolve(schema)
+
+
+def _record_usage(provider: str, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> None:
+    """Count the tokens a provider reported for a call"""
+    if prompt_tokens:
+        LLM_TOKENS.inc(provider, "prompt", amount=prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.inc(provider, "completion", amount=completion_tokens)
+
+
+def _get_client(provider: str) -> httpx.AsyncClient:
+    """Get (or lazily create) the pooled client for a provider"""
+    client = _clients.get(provider)
+    if client is None or client.is_closed:
+        max_connections = _MAX_CONNECTIONS[provider]
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(LLM_TIMEOUT, pool=LLM_POOL_TIMEOUT),
+        )
+        _clients[provider] = client
+    return client
+
+
+def _groq_request(
+    prompt: str,
+    temperature: float,
+    max_tokens: int,
+    system_prompt: Optional[str],
+    stream: bool = False,
+    schema: Optional[Type[BaseModel]] = None,
+) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    """Build headers and payload for a Groq chat completion"""
+    headers = {
+        "Authorization": f"Bearer {GROQ_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": prompt})
+
+    payload = {
+        "model": GROQ_MODEL,
+        "messages": messages,
+        "temperature": temperature,
+        # Use max_completion_tokens as per Groq chat completions API
+        "max_completion_tokens": max_tokens
+    }
+    if stream:
+        payload["stream"] = True
+    if schema is not None and LLM_STRUCTURED_OUTPUT:
+        if GROQ_RESPONSE_FORMAT == "json_schema":
+            payload["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": schema.__name__, "schema": output_schema(schema)},
+            }
+        elif GROQ_RESPONSE_FORMAT == "json_object":
+            payload["response_format"] = {"type": "json_object"}
+    return headers, payload
+
+
+def _ollama_payload(
+    prompt: str,
+    temperature: Optional[float],
+    stream: bool = False,
+    schema: Optional[Type[BaseModel]] = None,
+) -> Dict[str, Any]:
+    """Build the payload for an Ollama generate call"""
+    use_schema = schema is not None and LLM_STRUCTURED_OUTPUT and _ollama_schema_format
+    payload = {
+        "model": OLLAMA_MODEL,
+        "prompt": prompt,
+        "stream": stream,
+        "format": output_schema(schema) if use_schema else "json",
+    }
+    if temperature is not None:
+        payload["options"] = {"temperature": temperature}
+    return payload
+
+
+def _schema_format_rejected(payload: Dict[str, Any], status_code: int, body: str, tag: str) -> bool:
+    """Handle an Ollama server too old for schema formats
+
+    True if the request carried a schema `format` and failed with a 4xx
+    about it; schemas are then no longer sent and the caller should retry
+    the request, whose format is reset to "json".
+    """
+    global _ollama_schema_format
+    if not isinstance(payload.get("format"), dict) or not 400 <= status_code < 500 or "format" not in body.lower():
+        return False
+    if _ollama_schema_format:
+        _ollama_schema_format = False
+        log.warning(
+            "%s: Ollama rejected a JSON Schema format (%d: %s); sending format \"json\" from now on (schemas need Ollama >= 0.5)",
+            tag, status_code, body,
+        )
+    payload["format"] = "json"
+    return True
+
+
+async def call_groq_api(
+    prompt: str,
+    temperature: float,
+    max_tokens: int = 2000,
+    system_prompt: Optional[str] = None,
+    tag: str = "LLM",
+    schema: Optional[Type[BaseModel]] = None,
+) -> str:
+    """Call Groq chat completions and return the response text"""
+    headers, payload = _groq_request(prompt, temperature, max_tokens, system_prompt, schema=schema)
+    response = await _get_client("groq").post(GROQ_API_URL, headers=headers, json=payload)
+    if response.status_code >= 400:
+        # Log full error body from Groq for debugging
+        log.warning("%s: Groq returned %d: %s", tag, response.status_code, response.text)
+    response.raise_for_status()
+    data = response.json()
+    usage = data.get("usage") or {}
+    _record_usage("groq", usage.get("prompt_tokens"), usage.get("completion_tokens"))
+    return data.get("choices", [])[0].get("message", {}).get("content", "")
+
+
+async def call_ollama_api(
+    prompt: str,
+    temperature: Optional[float] = None,
+    tag: str = "LLM",
+    schema: Optional[Type[BaseModel]] = None,
+) -> str:
+    """Call Ollama generate and return the response text"""
+    payload = _ollama_payload(prompt, temperature, schema=schema)
+    response = await _get_client("ollama").post(OLLAMA_URL, json=payload)
+    if response.status_code >= 400 and _schema_format_rejected(payload, response.status_code, response.text, tag):
+        response = await _get_client("ollama").post(OLLAMA_URL, json=payload)
+    if response.status_code >= 400:
+        log.warning("%s: Ollama returned %d: %s", tag, response.status_code, response.text)
+    response.raise_for_status()
+    data = response.json()
+    _record_usage("ollama", data.get("prompt_eval_count"), data.get("eval_count"))
+    return data.get("response", "")
+
+
+async def stream_groq_api(
+    prompt: str,
+    temperature: float,
+    max_tokens: int = 2000,
+    system_prompt: Optional[str] = None,
+    tag: str = "LLM",
+    schema: Optional[Type[BaseModel]] = None,
+) -> AsyncIterator[str]:
+    """Stream a Groq chat completion, yielding content deltas (SSE lines)"""
+    headers, payload = _groq_request(prompt, temperature, max_tokens, system_prompt, stream=True, schema=schema)
+    async with _get_client("groq").stream("POST", GROQ_API_URL, headers=headers, json=payload) as response:
+        if response.status_code >= 400:
+            body = await response.aread()
+            log.warning("%s: Groq returned %d: %s", tag, response.status_code, body.decode(errors="replace"))
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            # Groq reports usage on the last chunk, under x_groq
+            usage = chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage")
+            if usage:
+                _record_usage("groq", usage.get("prompt_tokens"), usage.get("completion_tokens"))
+            delta = (chunk.get("choices") or [{}])[0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+
+
+async def stream_ollama_api(
+    prompt: str,
+    temperature: Optional[float] = None,
+    tag: str = "LLM",
+    schema: Optional[Type[BaseModel]] = None,
+) -> AsyncIterator[str]:
+    """Stream an Ollama generate call, yielding response chunks (NDJSON lines)"""
+    payload = _ollama_payload(prompt, temperature, stream=True, schema=schema)
+    while True:
+        async with _get_client("ollama").stream("POST", OLLAMA_URL, json=payload) as response:
+            if response.status_code >= 400:
+                body = (await response.aread()).decode(errors="replace")
+                if _schema_format_rejected(payload, response.status_code, body, tag):
+                    continue
+                log.warning("%s: Ollama returned %d: %s", tag, response.status_code, body)
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    _record_usage("ollama", chunk.get("prompt_eval_count"), chunk.get("eval_count"))
+                    break
+            return
+
+
+async def _call_provider(
+    provider: str,
+    prompt: str,
+    temperature: Optional[float],
+    max_tokens: int,
+    system_prompt: Optional[str],
+    tag: str,
+    schema: Optional[Type[BaseModel]],
+) -> str:
+    if provider == "groq":
+        return await call_groq_api(
+            prompt,
+            0.5 if temperature is None else temperature,
+            max_tokens=max_tokens,
+            system_prompt=system_prompt,
+            tag=tag,
+            schema=schema,
+        )
+    if provider == "ollama":
+        return await call_ollama_api(prompt, temperature, tag=tag, schema=schema)
+    raise ValueError(f"Unknown LLM provider {provider!r}")
+
+
+def _stream_provider(
+    provider: str,
+    prompt: str,
+    temperature: Optional[float],
+    max_tokens: int,
+    system_prompt: Optional[str],
+    tag: str,
+    schema: Optional[Type[BaseModel]],
+) -> AsyncIterator[str]:
+    if provider == "groq":
+        return stream_groq_api(
+            prompt,
+            0.5 if temperature is None else temperature,
+            max_tokens=max_tokens,
+            system_prompt=system_prompt,
+            tag=tag,
+            schema=schema,
+        )
+    if provider == "ollama":
+        return stream_ollama_api(prompt, temperature, tag=tag, schema=schema)
+    raise ValueError(f"Unknown LLM provider {provider!r}")
+
+
+def _describe_error(e: Exception) -> str:
+    if isinstance(e, httpx.HTTPStatusError):
+        return f"HTTP {e.response.status_code}"
+    return f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+
+
+async def generate(
+    prompt: str,
+    temperature: Optional[float] = None,
+    max_tokens: int = 2000,
+    system_prompt: Optional[str] = None,
+    tag: str = "LLM",
+    schema: Optional[Type[BaseModel]] = None,
+) -> str:
+    """Generate a completion with the healthiest configured provider.
+
+    Providers are tried in LLM_ROUTER order; a failed call is recorded
+    against its provider and the next one is tried. `system_prompt` is only
+    sent to Groq; the Ollama prompts already embed their system block.
+    Ollama requests without a temperature use the model default, Groq
+    falls back to 0.5. `schema` is the Pydantic model of the expected JSON
+    output; with LLM_STRUCTURED_OUTPUT it constrains decoding.
+    """
+    order = LLM_ROUTER.order()
+    for i, provider in enumerate(order):
+        LLM_ROUTER.begin(provider)
+        start = time.perf_counter()
+        try:
+            with span("llm", provider=provider, tag=tag):
+                text = await _call_provider(provider, prompt, temperature, max_tokens, system_prompt, tag, schema)
+        except asyncio.CancelledError:
+            LLM_ROUTER.cancel(provider)
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, provider, "complete", "cancelled")
+            raise
+        except Exception as e:
+            error = _describe_error(e)
+            LLM_ROUTER.record(provider, False, error=error)
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, provider, "complete", "error")
+            if i == len(order) - 1:
+                raise
+            LLM_ROUTER.record_failover(provider, error)
+            continue
+        elapsed = time.perf_counter() - start
+        LLM_ROUTER.record(provider, True, elapsed)
+        LLM_REQUEST_SECONDS.observe(elapsed, provider, "complete", "success")
+        return text
+    raise RuntimeError("No LLM providers configured")
+
+
+async def stream_generate(
+    prompt: str,
+    temperature: Optional[float] = None,
+    max_tokens: int = 2000,
+    system_prompt: Optional[str] = None,
+    tag: str = "LLM",
+    schema: Optional[Type[BaseModel]] = None,
+) -> AsyncIterator[str]:
+    """Streaming counterpart of generate(); yields text chunks as they arrive.
+
+    Falls back to the next provider only while nothing has been yielded;
+    once text has reached the caller an error is raised instead. Closing
+    the iterator early closes the underlying HTTP response, which cancels
+    the generation on the provider side.
+    """
+    order = LLM_ROUTER.order()
+    for i, provider in enumerate(order):
+        LLM_ROUTER.begin(provider)
+        start = time.perf_counter()
+        stream = _stream_provider(provider, prompt, temperature, max_tokens, system_prompt, tag, schema)
+        started = False
+        try:
+            with span("llm", provider=provider, tag=tag, stream=True):
+                async for chunk in stream:
+                    started = True
+                    yield chunk
+        except (GeneratorExit, asyncio.CancelledError):
+            # The caller stopped reading; only a stream that produced text
+            # says anything about the provider
+            if started:
+                LLM_ROUTER.record(provider, True)
+            else:
+                LLM_ROUTER.cancel(provider)
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, provider, "stream", "aborted")
+            raise
+        except Exception as e:
+            error = _describe_error(e)
+            LLM_ROUTER.record(provider, False, error=error)
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, provider, "stream", "error")
+            if started or i == len(order) - 1:
+                raise
+            LLM_ROUTER.record_failover(provider, error)
+            continue
+        finally:
+            await stream.aclose()
+        elapsed = time.perf_counter() - start
+        LLM_ROUTER.record(provider, True, elapsed)
+        LLM_REQUEST_SECONDS.observe(elapsed, provider, "stream", "success")
+        return
+    raise RuntimeError("No LLM providers configured")
+
+
+async def close_clients() -> None:
+    """Close all pooled provider clients (called on app shutdown)"""
+    for client in list(_clients.values()):
+        await client.aclose()
+    _clients.clear()
@@ -0,0 +1,162 @@
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+# Structured, leveled logging for the whole app.
+#
+# Records go through a QueueHandler, so the request path only enqueues;
+# formatting and the stdout write happen on the QueueListener thread.
+# Every record carries the request_id / session_id of the request that
+# produced it (see bind_request / bind_session). At the default INFO level
+# a request logs one access line; per-attempt detail is DEBUG, and raw LLM
+# payload dumps are additionally sampled (log_payload).
+#
+# Settings come from app.config via setup_logging(); this module does not
+# import the config itself because config imports utils that log.
+
+ROOT_LOGGER = "app"
+
+# One mutable dict per request. Tasks started during the request (e.g.
+# prefetch) copy the context, so they share it and log the same ids.
+_request_context: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar(
+    "request_context", default=None
+)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_payload_sample_rate = 0.0
+_payload_chars = 500
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id", "session_id"}
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the app hierarchy, e.g. get_logger("quiz") -> app.quiz"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def bind_request(request_id: Optional[str] = None) -> Dict[str, Any]:
+    """Start a correlation context for the current request; returns it"""
+    context = {"request_id": request_id or uuid.uuid4().hex[:12], "session_id": None}
+    _request_context.set(context)
+    return context
+
+
+def bind_session(session_id: str) -> None:
+    """Attach a session_id to the current request's log records"""
+    context = _request_context.get()
+    if context is None:
+        context = bind_request()
+    context["session_id"] = session_id
+
+
+def log_payload(logger: logging.Logger, label: str, payload: Any) -> None:
+    """DEBUG-log a (truncated) payload dump for a sample of calls
+
+    Only the configured sample rate of calls log anything, and nothing is
+    formatted unless DEBUG is enabled.
+    """
+    if not logger.isEnabledFor(logging.DEBUG) or random.random() >= _payload_sample_rate:
+        return
+    text = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False, default=str)
+    if len(text) > _payload_chars:
+        text = text[:_payload_chars] + "..."
+    logger.debug("%s: %s", label, text)
+
+
+class _ContextFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _request_context.get() or {}
+        record.request_id = context.get("request_id")
+        record.session_id = context.get("session_id")
+        return True
+
+
+def _extra_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.request_id:
+            entry["request_id"] = record.request_id
+        if record.session_id:
+            entry["session_id"] = record.session_id
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable single line: time level logger [ids] message key=value"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        ts = time.strftime("%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}"
+        ids = " ".join(
+            f"{key}={value}"
+            for key, value in (("req", record.request_id), ("session", record.session_id))
+            if value
+        )
+        fields = " ".join(f"{key}={value}" for key, value in _extra_fields(record).items())
+        line = f"{ts} {record.levelname:<7} {record.name}"
+        if ids:
+            line += f" [{ids}]"
+        line += f" {record.getMessage()}"
+        if fields:
+            line += f" {fields}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def setup_logging(
+    level: str = "INFO",
+    fmt: str = "text",
+    payload_sample_rate: float = 0.0,
+    payload_chars: int = 500,
+) -> None:
+    """Route the app's loggers through a queue to stdout (idempotent)"""
+    global _listener, _payload_sample_rate, _payload_chars
+    if _listener is not None:
+        return
+    _payload_sample_rate = payload_sample_rate
+    _payload_chars = payload_chars
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JSONFormatter() if fmt == "json" else TextFormatter())
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(log_queue)
+    handler.addFilter(_ContextFilter())
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the listener thread (called on app shutdown)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,135 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+from app.utils.log import get_logger
+
+log = get_logger("prefetch")
+
+
+class PrefetchExecutor:
+    """Bounded pool for background prefetch jobs.
+
+    At most `max_workers` jobs run at once and at most `max_pending` are
+    queued or running; extra submissions are dropped rather than piling up
+    under a traffic spike. Each session has at most one job in flight, and
+    a job is cancelled when its session submits again with different
+    parameters, so LLM capacity goes to questions that will be served. A
+    request that needs the question a running job is producing waits for
+    it (see wait) instead of generating its own copy alongside.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(max_workers)
+        self._jobs: Dict[str, Tuple[Hashable, asyncio.Task]] = {}
+        # Jobs past the semaphore, i.e. actually generating
+        self._started: Set[asyncio.Task] = set()
+        self.submitted = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.cancelled = 0
+        self.awaited = 0
+        self.completed = 0
+        self.failed = 0
+
+    def in_flight(self, session_id: str) -> Optional[Hashable]:
+        """Parameters of the session's running job, or None"""
+        job = self._jobs.get(session_id)
+        if job is None or job[1].done():
+            return None
+        return job[0]
+
+    def cancel(self, session_id: str, params: Optional[Hashable] = None) -> bool:
+        """Cancel the session's job, unless it already runs for `params`"""
+        job = self._jobs.get(session_id)
+        if job is None or job[1].done() or (params is not None and job[0] == params):
+            return False
+        job[1].cancel()
+        self.cancelled += 1
+        return True
+
+    async def wait(self, session_id: str, params: Hashable) -> bool:
+        """Wait for the session's job if it is already generating for `params`
+
+        A job still queued behind the worker limit is cancelled instead, as
+        the request would otherwise wait for a free worker as well. Returns
+        True once a job finished; its results are in the prefetch cache.
+        Cancelling the waiting request does not cancel the job.
+        """
+        job = self._jobs.get(session_id)
+        if job is None or job[1].done() or job[0] != params:
+            return False
+        task = job[1]
+        if task not in self._started:
+            task.cancel()
+            self.cancelled += 1
+            return False
+        self.awaited += 1
+        await asyncio.wait({task})
+        return True
+
+    def submit(
+        self,
+        session_id: str,
+        params: Hashable,
+        job: Callable[[], Awaitable[Any]],
+    ) -> bool:
+        """Schedule `job()` for a session; returns False if it was not queued"""
+        if self.in_flight(session_id) == params:
+            self.skipped += 1
+            return False
+        self.cancel(session_id)
+
+        active = sum(1 for _, task in self._jobs.values() if not task.done())
+        if active >= self.max_pending:
+            self.dropped += 1
+            return False
+
+        task = asyncio.create_task(self._run(job))
+        self._jobs[session_id] = (params, task)
+        task.add_done_callback(lambda t: self._finished(session_id, t))
+        self.submitted += 1
+        return True
+
+    async def _run(self, job: Callable[[], Awaitable[Any]]) -> Any:
+        async with self._semaphore:
+            task = asyncio.current_task()
+            self._started.add(task)
+            try:
+                return await job()
+            finally:
+                self._started.discard(task)
+
+    def _finished(self, session_id: str, task: asyncio.Task) -> None:
+        current = self._jobs.get(session_id)
+        if current is not None and current[1] is task:
+            del self._jobs[session_id]
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.failed += 1
+            log.warning("Prefetch failed: %s", task.exception())
+        else:
+            self.completed += 1
+
+    async def shutdown(self) -> None:
+        """Cancel every queued or running job (called on app shutdown)"""
+        tasks = [task for _, task in self._jobs.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._jobs.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": sum(1 for _, task in self._jobs.values() if not task.done()),
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "submitted": self.submitted,
+            "skipped": self.skipped,
+            "dropped": self.dropped,
+            "cancelled": self.cancelled,
+            "awaited": self.awaited,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
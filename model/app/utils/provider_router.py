@@ -0,0 +1,146 @@
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from app.utils.log import get_logger
+
+log = get_logger("llm_router")
+
+
+class ProviderHealth:
+    """Rolling health of one LLM backend plus its circuit breaker.
+
+    The last `window` calls are kept as (ok, latency) pairs. After
+    `failure_threshold` consecutive failures the circuit opens and the
+    backend is skipped for `cooldown` seconds; then it is half-open and
+    one trial call decides whether it closes again or reopens.
+    """
+
+    def __init__(self, name: str, window: int, failure_threshold: int, cooldown: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.samples: Deque[Tuple[bool, Optional[float]]] = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+        self.calls = 0
+        self.failures = 0
+        self.circuit_opens = 0
+        self.last_error: Optional[str] = None
+
+    def state(self, now: Optional[float] = None) -> str:
+        if self.opened_at is None:
+            return "closed"
+        now = time.monotonic() if now is None else now
+        return "half_open" if now - self.opened_at >= self.cooldown else "open"
+
+    def available(self, now: Optional[float] = None) -> bool:
+        """Closed, or half-open with no trial call running yet"""
+        state = self.state(now)
+        return state == "closed" or (state == "half_open" and not self.trial_in_flight)
+
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for ok, _ in self.samples if not ok) / len(self.samples)
+
+    def avg_latency(self) -> Optional[float]:
+        latencies = [latency for ok, latency in self.samples if ok and latency is not None]
+        return sum(latencies) / len(latencies) if latencies else None
+
+    def record(self, ok: bool, latency: Optional[float] = None, error: Optional[str] = None) -> None:
+        self.calls += 1
+        self.samples.append((ok, latency))
+        self.trial_in_flight = False
+        if ok:
+            self.consecutive_failures = 0
+            if self.opened_at is not None:
+                log.info("%s circuit closed", self.name)
+            self.opened_at = None
+            return
+
+        self.failures += 1
+        self.last_error = error
+        self.consecutive_failures += 1
+        # A failed half-open trial reopens at once; otherwise wait for the threshold
+        if self.opened_at is not None or self.consecutive_failures >= self.failure_threshold:
+            if self.opened_at is None:
+                self.circuit_opens += 1
+            self.opened_at = time.monotonic()
+            log.warning(
+                "%s circuit open for %gs after %d failure(s): %s",
+                self.name, self.cooldown, self.consecutive_failures, error,
+            )
+
+    def snapshot(self) -> Dict[str, Any]:
+        latency = self.avg_latency()
+        return {
+            "state": self.state(),
+            "avg_latency_ms": round(latency * 1000, 1) if latency is not None else None,
+            "error_rate": round(self.error_rate(), 3),
+            "window_calls": len(self.samples),
+            "consecutive_failures": self.consecutive_failures,
+            "calls": self.calls,
+            "failures": self.failures,
+            "circuit_opens": self.circuit_opens,
+            "last_error": self.last_error,
+        }
+
+
+class ProviderRouter:
+    """Orders configured LLM backends by health for each call.
+
+    Available backends come first, ranked by average latency inflated by
+    their error rate. A backend with no latency samples yet ranks first if
+    it is the preferred one (the first in `providers`) and last otherwise,
+    so fallbacks only take traffic once they are needed or measured faster.
+    Backends with an open circuit are still returned, last, so a call is
+    attempted even when everything is failing.
+    """
+
+    def __init__(self, providers: List[str], window: int, failure_threshold: int, cooldown: float, error_penalty: float):
+        self.providers = list(providers)
+        self.error_penalty = error_penalty
+        self.health = {name: ProviderHealth(name, window, failure_threshold, cooldown) for name in self.providers}
+        self.failovers = 0
+
+    def _score(self, name: str) -> float:
+        health = self.health[name]
+        latency = health.avg_latency()
+        if latency is None:
+            return 0.0 if name == self.providers[0] else float("inf")
+        return latency * (1 + self.error_penalty * health.error_rate())
+
+    def order(self) -> List[str]:
+        """Backends to try for the next call, best first"""
+        now = time.monotonic()
+        available = [name for name in self.providers if self.health[name].available(now)]
+        unavailable = [name for name in self.providers if name not in available]
+        available.sort(key=self._score)
+        unavailable.sort(key=lambda name: self.health[name].opened_at or 0.0)
+        return available + unavailable
+
+    def begin(self, name: str) -> None:
+        """Mark a call as started; a half-open backend gets only one trial at a time"""
+        health = self.health[name]
+        if health.state() == "half_open":
+            health.trial_in_flight = True
+
+    def cancel(self, name: str) -> None:
+        """A call was cancelled before it said anything about the backend"""
+        self.health[name].trial_in_flight = False
+
+    def record(self, name: str, ok: bool, latency: Optional[float] = None, error: Optional[str] = None) -> None:
+        self.health[name].record(ok, latency, error)
+
+    def record_failover(self, failed: str, error: str) -> None:
+        self.failovers += 1
+        log.warning("%s failed (%s); falling back", failed, error)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "preferred": self.providers[0] if self.providers else None,
+            "order": self.order(),
+            "failovers": self.failovers,
+            "providers": {name: health.snapshot() for name, health in self.health.items()},
+        }
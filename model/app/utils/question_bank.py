@@ -0,0 +1,223 @@
+import asyncio
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import (
+    QUESTION_BANK_ENABLED,
+    QUESTION_BANK_LOW_WATER,
+    QUESTION_BANK_HIGH_WATER,
+    QUESTION_BANK_SCAN_LIMIT,
+    QUESTION_BANK_WORKERS,
+    QUESTION_BANK_CHECK_INTERVAL,
+    QUESTION_BANK_SWEEP_INTERVAL,
+    QUESTION_BANK_BATCH_SIZE,
+    QUESTION_BANK_MIN_REQUESTS,
+    QUESTION_BANK_DEMAND_WINDOW,
+    QUESTION_BANK_MAX_TRACKED_BUCKETS,
+)
+from app.db.mongo import (
+    ensure_question_bank_indexes,
+    count_bank_questions,
+    load_bank_questions,
+    add_bank_questions,
+    mark_bank_question_served,
+    list_bank_buckets,
+)
+from app.utils.cache import TTLCache
+from app.utils.semantic import score_candidates_async, build_history_matrix_async
+from app.utils.log import get_logger
+from app.utils.tracing import detach_trace
+
+log = get_logger("question_bank")
+
+# Fields returned to callers; bank bookkeeping fields stay in Mongo
+QUESTION_FIELDS = (
+    "question_id",
+    "question_text",
+    "options",
+    "correct_option_index",
+    "hint",
+    "explanation",
+    "code_context",
+)
+
+# Stop a refill after this many consecutive failed generations
+MAX_REFILL_FAILURES = 3
+
+BucketKey = Tuple[str, str, int]
+
+_refill_semaphore = asyncio.Semaphore(QUESTION_BANK_WORKERS)
+_refill_tasks: Dict[BucketKey, asyncio.Task] = {}
+# Keyed by request parameters, so both are size-capped: a bucket is in
+# _recently_checked for QUESTION_BANK_CHECK_INTERVAL after a refill check,
+# and _demand counts its requests over QUESTION_BANK_DEMAND_WINDOW
+_recently_checked = TTLCache(QUESTION_BANK_MAX_TRACKED_BUCKETS, QUESTION_BANK_CHECK_INTERVAL)
+_demand = TTLCache(QUESTION_BANK_MAX_TRACKED_BUCKETS, QUESTION_BANK_DEMAND_WINDOW)
+_sweeper_task: Optional[asyncio.Task] = None
+
+
+async def serve_from_bank(
+    domain_name: str,
+    program_name: str,
+    level: int,
+    history: List[Any],
+    history_matrix: np.ndarray,
+) -> Optional[Tuple[Dict[str, Any], np.ndarray]]:
+    """Pick a bank question the session has not seen.
+
+    Candidates are scored against the session history with the same exact
+    and semantic checks as live generation. Returns (question, embedding),
+    or None when the bucket has nothing usable. The question carries its
+    `bank_id`; it only counts as served once passed to mark_served(), so a
+    prefetched question that is never shown does not age out. Also
+    schedules a refill check once the bucket has enough demand.
+    """
+    if not QUESTION_BANK_ENABLED:
+        return None
+
+    key = (domain_name, program_name, level)
+    requests = _demand.get(key, 0) + 1
+    _demand.set(key, requests)
+    if requests >= QUESTION_BANK_MIN_REQUESTS:
+        schedule_refill(domain_name, program_name, level)
+
+    seen_texts = [h.get("question_text", "") if isinstance(h, dict) else h.question_text for h in history]
+    docs, embeddings = await load_bank_questions(
+        domain_name, program_name, level, seen_texts, QUESTION_BANK_SCAN_LIMIT
+    )
+    if not docs:
+        return None
+
+    candidate_matrix = await build_history_matrix_async(docs, embeddings)
+    dedup = await score_candidates_async(
+        [doc["question_text"] for doc in docs],
+        history,
+        history_matrix,
+        candidate_matrix,
+        within_batch=False,
+    )
+    for i, doc in enumerate(docs):
+        if dedup.duplicate[i]:
+            continue
+        question = {field: doc.get(field) for field in QUESTION_FIELDS}
+        question["bank_id"] = doc["_id"]
+        return question, dedup.embeddings[i]
+    return None
+
+
+async def mark_served(question: Dict[str, Any]) -> None:
+    """Count a question as served if it came from the bank"""
+    bank_id = question.pop("bank_id", None)
+    if bank_id is None:
+        return
+    try:
+        await mark_bank_question_served(bank_id)
+    except Exception as e:
+        log.warning("Could not mark bank question %s served: %s", bank_id, e)
+
+
+def schedule_refill(domain_name: str, program_name: str, level: int, force: bool = False) -> None:
+    """Start a background refill check for a bucket.
+
+    At most one refill runs per bucket, and buckets are re-checked at most
+    every QUESTION_BANK_CHECK_INTERVAL seconds unless `force` is set.
+    """
+    if not QUESTION_BANK_ENABLED:
+        return
+
+    key = (domain_name, program_name, level)
+    running = _refill_tasks.get(key)
+    if running is not None and not running.done():
+        return
+
+    if not force and key in _recently_checked:
+        return
+    _recently_checked.set(key, True)
+
+    task = asyncio.create_task(_refill_bucket(*key))
+    _refill_tasks[key] = task
+    task.add_done_callback(lambda _: _refill_tasks.pop(key, None))
+
+
+async def _refill_bucket(domain_name: str, program_name: str, level: int) -> None:
+    """Top a bucket up to the high-water mark once it is below the low-water mark"""
+    # Imported lazily: the quiz route imports this module
+    from app.routes.quiz import generate_bank_questions
+
+    detach_trace()
+
+    async with _refill_semaphore:
+        try:
+            count = await count_bank_questions(domain_name, program_name, level)
+            if count >= QUESTION_BANK_LOW_WATER:
+                return
+
+            log.info("Refilling %s / %s / L%d: %d -> %d", domain_name, program_name, level, count, QUESTION_BANK_HIGH_WATER)
+            docs, embeddings = await load_bank_questions(domain_name, program_name, level)
+            bank_history = [{"question_text": doc["question_text"]} for doc in docs]
+            bank_matrix = await build_history_matrix_async(bank_history, embeddings)
+
+            failures = 0
+            while count < QUESTION_BANK_HIGH_WATER and failures < MAX_REFILL_FAILURES:
+                # Several questions per LLM call, so the prompt prefill is shared
+                batch_size = min(QUESTION_BANK_BATCH_SIZE, QUESTION_BANK_HIGH_WATER - count)
+                try:
+                    questions = await generate_bank_questions(
+                        domain_name, program_name, level, bank_history, bank_matrix, batch_size
+                    )
+                except Exception as e:
+                    failures += 1
+                    log.warning("Generation failed for %s / %s / L%d: %s", domain_name, program_name, level, e)
+                    continue
+
+                failures = 0
+                await add_bank_questions(
+                    domain_name,
+                    program_name,
+                    level,
+                    [question for question, _ in questions],
+                    [embedding for _, embedding in questions],
+                )
+                for question, embedding in questions:
+                    bank_history.append({"question_text": question["question_text"]})
+                    bank_matrix = np.vstack([bank_matrix, embedding.reshape(1, -1)])
+                count += len(questions)
+
+            log.info("%s / %s / L%d now has %d questions", domain_name, program_name, level, count)
+        except Exception as e:
+            log.error("Refill failed for %s / %s / L%d: %s", domain_name, program_name, level, e)
+
+
+async def _sweep_buckets() -> None:
+    """Periodically re-check every known bucket against the low-water mark"""
+    try:
+        await ensure_question_bank_indexes()
+    except Exception as e:
+        log.error("Could not create question bank indexes: %s", e)
+
+    while True:
+        try:
+            for key in await list_bank_buckets():
+                schedule_refill(*key, force=True)
+        except Exception as e:
+            log.error("Sweep failed: %s", e)
+        await asyncio.sleep(QUESTION_BANK_SWEEP_INTERVAL)
+
+
+def start_question_bank_workers() -> None:
+    """Start the periodic bucket sweeper (called on app startup)"""
+    global _sweeper_task
+    if not QUESTION_BANK_ENABLED or (_sweeper_task is not None and not _sweeper_task.done()):
+        return
+    _sweeper_task = asyncio.create_task(_sweep_buckets())
+
+
+async def stop_question_bank_workers() -> None:
+    """Cancel the sweeper and any in-flight refills (called on app shutdown)"""
+    global _sweeper_task
+    tasks = list(_refill_tasks.values())
+    if _sweeper_task is not None:
+        tasks.append(_sweeper_task)
+        _sweeper_task = None
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,4 +1,6 @@
+import json
 from typing import List, Any
+from app.config import QUIZ_HISTORY_TOKEN_BUDGET, QUIZ_HISTORY_STEM_CHARS
 
 def get_level_description(level: int) -> str:
     """Get description for difficulty level"""
@@ -39,3 +41,53 @@ def auto_adjust_level(level: int, history: List[Any]) -> int:
             adjusted = max(1, adjusted - 1)
 
     return adjusted
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting"""
+    return len(text) // 4 + 1
+
+def compact_history(
+    history: List[Any],
+    token_budget: int = QUIZ_HISTORY_TOKEN_BUDGET,
+    stem_chars: int = QUIZ_HISTORY_STEM_CHARS,
+) -> str:
+    """Render session history for the quiz prompt within a token budget
+
+    Only question stems are kept (no options, answers or indentation), each
+    truncated to `stem_chars`. Newest questions are kept first; once the
+    budget is exhausted the older ones are replaced by a one-line count so
+    the prompt cost stays flat however long the session runs.
+    """
+    stems = []
+    for h in history:
+        text = h.get("question_text", "") if isinstance(h, dict) else getattr(h, "question_text", "")
+        text = " ".join(str(text).split())
+        if len(text) > stem_chars:
+            text = text[:stem_chars - 3].rstrip() + "..."
+        if text:
+            stems.append(text)
+
+    kept: List[str] = []
+    costs: List[int] = []
+    used = 2  # surrounding brackets
+    for text in reversed(stems):
+        cost = estimate_tokens(json.dumps(text, ensure_ascii=False))
+        if used + cost > token_budget:
+            break
+        kept.append(text)
+        costs.append(cost)
+        used += cost
+    kept.reverse()
+    costs.reverse()
+
+    omitted = len(stems) - len(kept)
+    if omitted:
+        # The marker counts against the budget too; make room from the oldest end
+        marker = f"({omitted} older questions omitted)"
+        while kept and used + estimate_tokens(json.dumps(marker)) > token_budget:
+            kept.pop(0)
+            used -= costs.pop(0)
+            omitted += 1
+            marker = f"({omitted} older questions omitted)"
+        kept.insert(0, marker)
+    return json.dumps(kept, ensure_ascii=False, separators=(",", ":"))
@@ -0,0 +1,57 @@
+import copy
+import hashlib
+import numpy as np
+from dataclasses import dataclass
+from typing import Any, Optional, Tuple
+from app.config import RESPONSE_CACHE, RESPONSE_CACHE_ENABLED
+from app.utils.semantic import encode_texts_async
+from app.utils.text_processing import normalize_prompt
+from app.utils.log import get_logger
+
+log = get_logger("response_cache")
+
+
+@dataclass
+class CacheLookup:
+    """Result of lookup_response, passed back to store_response on a miss"""
+    key: Optional[Tuple[str, str]]
+    embedding: Optional[np.ndarray]
+    value: Any = None
+
+
+async def lookup_response(namespace: str, prompt: str) -> CacheLookup:
+    """Find a cached response for a free-text prompt.
+
+    Tries the hash of the normalized prompt first, then the nearest cached
+    prompt of the same namespace by embedding (RESPONSE_CACHE_THRESHOLD).
+    `value` is a copy of the cached response, or None on a miss. If the
+    prompt cannot be embedded the lookup is a miss and nothing is stored
+    for it, so the route still generates a response.
+    """
+    if not RESPONSE_CACHE_ENABLED:
+        return CacheLookup(None, None)
+
+    normalized = normalize_prompt(prompt)
+    key = (namespace, hashlib.sha256(normalized.encode("utf-8")).hexdigest())
+    value = RESPONSE_CACHE.get_exact(key)
+    if value is not None:
+        log.debug("%s: exact cache hit", namespace)
+        return CacheLookup(key, None, copy.deepcopy(value))
+
+    try:
+        embedding = (await encode_texts_async([normalized]))[0]
+    except Exception as e:
+        log.warning("%s: cache lookup skipped, prompt could not be embedded: %s", namespace, e)
+        return CacheLookup(None, None)
+    value, similarity = RESPONSE_CACHE.get_similar(namespace, embedding)
+    if value is not None:
+        log.debug("%s: semantic cache hit (similarity %.3f)", namespace, similarity)
+        return CacheLookup(key, embedding, copy.deepcopy(value))
+    return CacheLookup(key, embedding)
+
+
+def store_response(lookup: CacheLookup, value: Any) -> None:
+    """Cache a validated response under the prompt of a missed lookup"""
+    if lookup.key is None or lookup.embedding is None:
+        return
+    RESPONSE_CACHE.put(lookup.key, lookup.embedding, copy.deepcopy(value))
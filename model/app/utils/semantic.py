@@ -1,34 +1,216 @@
-from sklearn.metrics.pairwise import cosine_similarity
-from app.config import SEMANTIC_THRESHOLD, embedding_model
-from typing import List, Any
+import numpy as np
+from dataclasses import dataclass
+from app.config import (
+    SEMANTIC_THRESHOLD,
+    EMBEDDING_BATCH_WAIT_MS,
+    EMBEDDING_BATCH_MAX,
+    get_embedding_model,
+)
+from app.utils.embeddings import EmbeddingBatcher
+from typing import List, Any, Optional
+
+# Embeddings are persisted as little-endian float16 bytes (384 dims -> 768 bytes)
+EMBEDDING_DTYPE = np.dtype("<f2")
+
+
+def _question_text(h: Any) -> str:
+    return h.get("question_text", "") if isinstance(h, dict) else h.question_text
+
+def _normalize_text(text: str) -> str:
+    return text.lower().strip()
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row so cosine similarity is a plain dot product"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def encode_texts(texts: List[str]) -> np.ndarray:
+    """Encode texts into an (N, D) float32 matrix of unit-length embeddings"""
+    embedding_model = get_embedding_model()
+    if not texts:
+        return np.zeros((0, embedding_model.get_sentence_embedding_dimension()), dtype=np.float32)
+    embeddings = embedding_model.encode(texts, normalize_embeddings=True)
+    return np.asarray(embeddings, dtype=np.float32)
+
+# Shared micro-batching service used by every async caller; encodes run on
+# its worker thread, never on the event loop.
+EMBEDDING_SERVICE = EmbeddingBatcher(encode_texts, EMBEDDING_BATCH_WAIT_MS, EMBEDDING_BATCH_MAX)
+
+async def encode_texts_async(texts: List[str]) -> np.ndarray:
+    """Async encode_texts, batched with concurrent callers"""
+    return await EMBEDDING_SERVICE.encode(texts)
+
+def embedding_to_binary(embedding: np.ndarray) -> bytes:
+    """Serialize one embedding to compact float16 bytes for Mongo"""
+    return np.asarray(embedding, dtype=EMBEDDING_DTYPE).tobytes()
+
+def embedding_from_binary(data: bytes) -> np.ndarray:
+    """Deserialize float16 bytes from Mongo into a float32 vector"""
+    return np.frombuffer(data, dtype=EMBEDDING_DTYPE).astype(np.float32)
+
+def build_history_matrix(
+    history: List[Any],
+    embeddings: Optional[List[Optional[np.ndarray]]] = None,
+) -> np.ndarray:
+    """Stack stored history embeddings into a pre-normalized (M, D) matrix.
+
+    `embeddings` is aligned with `history`; rows that are missing (legacy
+    Mongo items, request-only history) are encoded together in one batch.
+    Rows are re-normalized once here to absorb float16 rounding.
+    """
+    embeddings = list(embeddings) if embeddings is not None else [None] * len(history)
+    missing = [i for i, emb in enumerate(embeddings) if emb is None]
+    if missing:
+        encoded = encode_texts([_question_text(history[i]) for i in missing])
+        for i, emb in zip(missing, encoded):
+            embeddings[i] = emb
+    if not embeddings:
+        return encode_texts([])
+    return normalize_rows(np.vstack(embeddings))
+
+async def build_history_matrix_async(
+    history: List[Any],
+    embeddings: Optional[List[Optional[np.ndarray]]] = None,
+) -> np.ndarray:
+    """build_history_matrix with missing rows encoded by EMBEDDING_SERVICE"""
+    embeddings = list(embeddings) if embeddings is not None else [None] * len(history)
+    missing = [i for i, emb in enumerate(embeddings) if emb is None]
+    if missing or not embeddings:
+        encoded = await encode_texts_async([_question_text(history[i]) for i in missing])
+        if not embeddings:
+            return encoded
+        for i, emb in zip(missing, encoded):
+            embeddings[i] = emb
+    return build_history_matrix(history, embeddings)
+
+
+@dataclass
+class DedupResult:
+    """Per-candidate verdicts from score_candidates (arrays of length N).
+
+    `matched_index` points into the history rows; when `within_batch` is on,
+    values >= len(history) refer to earlier candidates at
+    `matched_index - len(history)`. It is -1 when there is nothing to compare.
+    """
+    max_similarity: np.ndarray
+    matched_index: np.ndarray
+    exact: np.ndarray
+    semantic: np.ndarray
+    embeddings: np.ndarray
+
+    @property
+    def duplicate(self) -> np.ndarray:
+        return self.exact | self.semantic
+
+
+def score_candidates(
+    candidates: List[str],
+    history: List[Any],
+    history_matrix: Optional[np.ndarray] = None,
+    candidate_embeddings: Optional[np.ndarray] = None,
+    threshold: float = SEMANTIC_THRESHOLD,
+    within_batch: bool = True,
+) -> DedupResult:
+    """Score N candidate questions against M history rows in one pass.
+
+    Candidates are encoded in a single batch (unless `candidate_embeddings`
+    is given) and compared with one matrix product against the
+    pre-normalized `history_matrix`. Exact repeats are resolved in the same
+    pass. With `within_batch`, each candidate is also checked against the
+    candidates before it so a batch can be filtered in one call.
+    """
+    n = len(candidates)
+    if history_matrix is None:
+        history_matrix = build_history_matrix(history)
+    if candidate_embeddings is None:
+        candidate_embeddings = encode_texts(list(candidates))
+    candidate_embeddings = np.asarray(candidate_embeddings, dtype=np.float32).reshape(n, history_matrix.shape[1])
+
+    m = history_matrix.shape[0]
+    reference = np.vstack([history_matrix, candidate_embeddings]) if within_batch else history_matrix
+
+    if n and reference.shape[0]:
+        similarity = candidate_embeddings @ reference.T
+        if within_batch:
+            # Candidate i may only match history or candidates j < i
+            batch_part = similarity[:, m:]
+            batch_part[np.triu_indices(n)] = -np.inf
+        matched_index = similarity.argmax(axis=1)
+        max_similarity = similarity[np.arange(n), matched_index]
+        no_reference = np.isneginf(max_similarity)
+        matched_index[no_reference] = -1
+        max_similarity[no_reference] = 0.0
+    else:
+        matched_index = np.full(n, -1, dtype=np.int64)
+        max_similarity = np.zeros(n, dtype=np.float32)
+
+    seen = {_normalize_text(_question_text(h)) for h in history}
+    exact = np.zeros(n, dtype=bool)
+    for i, text in enumerate(candidates):
+        key = _normalize_text(text)
+        exact[i] = key in seen
+        if within_batch:
+            seen.add(key)
+
+    return DedupResult(
+        max_similarity=max_similarity,
+        matched_index=matched_index,
+        exact=exact,
+        semantic=max_similarity >= threshold,
+        embeddings=candidate_embeddings,
+    )
+
+async def score_candidates_async(
+    candidates: List[str],
+    history: List[Any],
+    history_matrix: Optional[np.ndarray] = None,
+    candidate_embeddings: Optional[np.ndarray] = None,
+    threshold: float = SEMANTIC_THRESHOLD,
+    within_batch: bool = True,
+) -> DedupResult:
+    """score_candidates with encoding done by EMBEDDING_SERVICE
+
+    Only the matrix product runs on the calling thread.
+    """
+    if history_matrix is None:
+        history_matrix = await build_history_matrix_async(history)
+    if candidate_embeddings is None:
+        candidate_embeddings = await encode_texts_async(list(candidates))
+    return score_candidates(
+        candidates,
+        history,
+        history_matrix,
+        candidate_embeddings,
+        threshold=threshold,
+        within_batch=within_batch,
+    )
 
 def exact_repeat(question: str, history: List[Any]) -> bool:
     """Check if question is an exact match"""
-    q = question.lower().strip()
-    for h in history:
-        h_text = h.get("question_text") if isinstance(h, dict) else h.question_text
-        if q == h_text.lower().strip():
-            return True
-    return False
-
-def semantic_repeat(question: str, history: List[Any]) -> bool:
-    """Check if question is semantically similar to history"""
+    q = _normalize_text(question)
+    return any(q == _normalize_text(_question_text(h)) for h in history)
+
+def semantic_repeat(
+    question: str,
+    history: List[Any],
+    history_matrix: Optional[np.ndarray] = None,
+    question_embedding: Optional[np.ndarray] = None,
+) -> bool:
+    """Check if question is semantically similar to history
+
+    Pass the precomputed `history_matrix` (see build_history_matrix) so only
+    the candidate needs encoding; `question_embedding` skips even that.
+    """
     if not history:
         return False
-    
-    # Extract question texts from history items
-    history_texts = []
-    for h in history:
-        if isinstance(h, dict):
-            history_texts.append(h.get("question_text", ""))
-        else:
-            history_texts.append(h.question_text)
-    
-    texts = history_texts + [question]
-    embeddings = embedding_model.encode(texts)
-
-    new_emb = embeddings[-1].reshape(1, -1)
-    hist_embs = embeddings[:-1]
-
-    similarity = cosine_similarity(new_emb, hist_embs)[0].max()
-    return similarity >= SEMANTIC_THRESHOLD
+
+    result = score_candidates(
+        [question],
+        history,
+        history_matrix=history_matrix,
+        candidate_embeddings=None if question_embedding is None else question_embedding.reshape(1, -1),
+        within_batch=False,
+    )
+    return bool(result.semantic[0])
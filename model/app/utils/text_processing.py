@@ -5,3 +5,18 @@ def clean_json_string(text: str) -> str:
     text = re.sub(r"```json", "", text, flags=re.IGNORECASE)
     text = re.sub(r"```", "", text)
     return text.strip()
+
+def clean_option_text(option: str) -> str:
+    """Remove 'Option A:', 'Option B:', etc. prefixes from option text"""
+    # Match patterns like "Option A: ", "Option B: ", "(A) ", "(a) ", "A. ", etc.
+    cleaned = re.sub(r'^(?:Option\s+[A-Z]:|[A-Z]\.|[A-Z]\)|\([A-Z]\))\s*', '', option, flags=re.IGNORECASE)
+    return cleaned.strip()
+
+def normalize_prompt(text: str) -> str:
+    """Canonical form of a free-text prompt for cache lookups
+
+    Lowercases, drops punctuation and collapses whitespace, so
+    "Learn Python basics!" and "learn  python basics" share a cache key.
+    """
+    text = re.sub(r"[^\w\s+#]", " ", text.lower())
+    return " ".join(text.split())
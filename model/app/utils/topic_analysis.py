@@ -0,0 +1,195 @@
+import re
+import numpy as np
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+from app.config import STATISTICS_TOPIC_THRESHOLD
+
+# Words that never make a useful topic label
+_STOPWORDS = set("""
+a an and are as at be by can code correct does do for from following how i in is it its
+of on or output the this to use used using what when which who why will with would you
+your not than that these those there their then into about best most should between
+statement true false example value values type types question questions
+""".split())
+
+_WORD = re.compile(r"[A-Za-z][A-Za-z0-9_+#\-]{2,}")
+
+
+def speed_profile(avg_time: float) -> str:
+    """Same speed buckets as the level summary"""
+    if avg_time <= 3:
+        return "Fast"
+    if avg_time <= 8:
+        return "Balanced"
+    return "Slow"
+
+
+def cluster_embeddings(embeddings: np.ndarray, threshold: float = STATISTICS_TOPIC_THRESHOLD) -> np.ndarray:
+    """Group unit-length embeddings into topics; returns a label per row.
+
+    Single pass in input order: each question joins the cluster whose
+    centroid it is most similar to if that similarity reaches `threshold`,
+    otherwise it starts a new cluster. Deterministic, so the same test
+    always yields the same breakdown.
+    """
+    n = embeddings.shape[0]
+    labels = np.zeros(n, dtype=np.int64)
+    if n == 0:
+        return labels
+
+    sums = np.zeros_like(embeddings)
+    centroids = np.zeros_like(embeddings)
+    k = 0
+    for i in range(n):
+        if k:
+            similarity = centroids[:k] @ embeddings[i]
+            best = int(similarity.argmax())
+            if similarity[best] >= threshold:
+                labels[i] = best
+                sums[best] += embeddings[i]
+                centroids[best] = sums[best] / np.linalg.norm(sums[best])
+                continue
+        labels[i] = k
+        sums[k] = embeddings[i]
+        centroids[k] = embeddings[i]
+        k += 1
+    return labels
+
+
+def _tokens(text: str) -> List[str]:
+    return [w for w in (m.lower() for m in _WORD.findall(text)) if w not in _STOPWORDS]
+
+
+def label_clusters(texts: List[str], labels: np.ndarray, exclude: str = "") -> List[str]:
+    """Name each cluster by its most distinctive words (term frequency in the
+    cluster weighted by inverse frequency across clusters)
+
+    Words of `exclude` (e.g. the domain and program names) are skipped
+    since every question mentions them.
+    """
+    k = int(labels.max()) + 1 if len(labels) else 0
+    skip = set(_tokens(exclude))
+    cluster_counts = [Counter() for _ in range(k)]
+    for text, label in zip(texts, labels):
+        cluster_counts[label].update(set(_tokens(text)) - skip)
+    cluster_freq = Counter(word for counts in cluster_counts for word in counts)
+
+    names = []
+    for c, counts in enumerate(cluster_counts):
+        ranked = sorted(
+            counts,
+            key=lambda w: (-counts[w] * np.log(1 + k / cluster_freq[w]), w),
+        )
+        words = ranked[:2]
+        name = " ".join(w.capitalize() for w in words) if words else f"Topic {c + 1}"
+        if name in names:
+            name = f"{name} ({c + 1})"
+        names.append(name)
+    return names
+
+
+def topic_breakdown(
+    labels: np.ndarray,
+    names: List[str],
+    is_correct: np.ndarray,
+    times: np.ndarray,
+) -> List[Dict[str, Any]]:
+    """Per-topic counts, accuracy and average time, largest topics first
+
+    Topics with no questions in `labels` are left out, so a learner's slice
+    of cohort-wide labels only lists the topics they saw.
+    """
+    k = len(names)
+    counts = np.bincount(labels, minlength=k)
+    correct = np.bincount(labels, weights=is_correct.astype(np.float64), minlength=k)
+    total_time = np.bincount(labels, weights=times, minlength=k)
+    accuracy = np.divide(correct * 100, counts, out=np.zeros(k), where=counts > 0)
+    avg_time = np.divide(total_time, counts, out=np.zeros(k), where=counts > 0)
+
+    order = sorted((c for c in range(k) if counts[c]), key=lambda c: (-counts[c], names[c]))
+    return [
+        {
+            "topic": names[c],
+            "question_count": int(counts[c]),
+            "correct_count": int(correct[c]),
+            "avg_time_seconds": round(float(avg_time[c]), 2),
+            "accuracy_percent": round(float(accuracy[c]), 2),
+        }
+        for c in order
+    ]
+
+
+def classify_topics(breakdown: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Split topics into strong and weak lists, most confident first
+
+    Strong: accuracy >= 75% or (>= 60% and Fast). Weak: accuracy < 50% or
+    (< 75% and Slow). With only one or two topics, neutral ones are still
+    placed on the side their accuracy leans to. Confidence grows with the
+    number of questions and the distance of accuracy from 50%.
+    """
+    strong, weak = [], []
+    for item in breakdown:
+        accuracy = item["accuracy_percent"]
+        speed = speed_profile(item["avg_time_seconds"])
+        count = item["question_count"]
+
+        if accuracy >= 75 or (accuracy >= 60 and speed == "Fast"):
+            side = strong
+        elif accuracy < 50 or (accuracy < 75 and speed == "Slow"):
+            side = weak
+        elif len(breakdown) <= 2 and accuracy != 50:
+            side = strong if accuracy > 50 else weak
+        else:
+            continue
+
+        support = count / (count + 2)
+        margin = abs(accuracy - 50) / 50
+        side.append({
+            "topic": item["topic"],
+            "confidence": round(min(1.0, support * (0.5 + 0.5 * margin)), 2),
+            "rationale": (
+                f"{item['correct_count']}/{count} correct ({accuracy:.0f}%), "
+                f"avg {item['avg_time_seconds']:.1f}s ({speed.lower()})"
+            ),
+        })
+
+    strong.sort(key=lambda t: -t["confidence"])
+    weak.sort(key=lambda t: -t["confidence"])
+    return strong, weak
+
+
+def topic_report(labels: np.ndarray, names: List[str], is_correct: np.ndarray, times: np.ndarray) -> Dict[str, Any]:
+    """Breakdown plus strong/weak topics, in the StatisticsApiResponse field names"""
+    breakdown = topic_breakdown(labels, names, is_correct, times)
+    strong, weak = classify_topics(breakdown)
+    return {"strong_topics": strong, "weak_topics": weak, "topic_breakdown": breakdown}
+
+
+def local_recommendations(summary: Dict[str, Any], weak: List[Dict[str, Any]], strong: List[Dict[str, Any]]) -> List[str]:
+    """Exactly 5 rule-based recommendations, used when the LLM is skipped or fails"""
+    accuracy = summary["accuracy_percent"]
+    speed = summary["speed_profile"]
+    recs = [f"Review {t['topic']}: {t['rationale']}." for t in weak[:2]]
+
+    if accuracy >= 90:
+        recs.append("Move on to advanced material and harder levels.")
+    elif accuracy < 50:
+        recs.append("Revisit the foundational concepts before retaking this level.")
+    if speed == "Fast" and accuracy < 70:
+        recs.append("Slow down and read each question and all options carefully.")
+    elif speed == "Slow" and accuracy >= 70:
+        recs.append("Practise timed quizzes to improve your pace.")
+    if strong:
+        recs.append(f"Build on your strength in {strong[0]['topic']} with more challenging questions.")
+
+    for fallback in (
+        "Practice regularly on challenging concepts.",
+        "Use active learning strategies such as explaining answers aloud.",
+        "Take timed practice tests.",
+        "Track your progress over time.",
+        "Seek help on difficult topics.",
+    ):
+        if len(recs) >= 5:
+            break
+        recs.append(fallback)
+    return recs[:5]
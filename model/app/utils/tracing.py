@@ -0,0 +1,179 @@
+import asyncio
+import contextvars
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Lightweight per-request stage timing.
+#
+# The middleware starts a Trace for each request; code on the request path
+# wraps its stages in `with span("load_history"):`. Finished spans are
+# summed per name into the Server-Timing response header, and can also be
+# appended to a local file as Chrome trace events (chrome://tracing,
+# Perfetto). With no trace active, span() only does a contextvar lookup.
+
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("trace", default=None)
+
+# Chrome trace "thread" ids: one per asyncio task, so concurrent attempts
+# get their own row and spans on a row nest properly
+_tids = itertools.count(1)
+
+_writer: Optional["TraceWriter"] = None
+
+
+class Trace:
+    """Spans recorded while handling one request"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.wall_start = time.time()
+        self.spans: List[Tuple[str, float, float, int, Dict[str, Any]]] = []
+        self.closed = False
+        self._task_tids: Dict[int, int] = {}
+        self.tid = self._tid()
+
+    def _tid(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = id(task) if task is not None else threading.get_ident()
+        tid = self._task_tids.get(key)
+        if tid is None:
+            tid = self._task_tids[key] = next(_tids)
+        return tid
+
+    def add(self, name: str, start: float, duration: float, args: Dict[str, Any]) -> None:
+        # Work that outlives the response (e.g. a cancelled hedge) is dropped
+        if not self.closed:
+            self.spans.append((name, start - self.start, duration, self._tid(), args))
+
+    def server_timing(self, total: Optional[float] = None) -> str:
+        """Server-Timing header value; repeated span names are summed"""
+        totals: Dict[str, List[float]] = {}
+        for name, _, duration, _, _ in self.spans:
+            entry = totals.setdefault(name, [0.0, 0])
+            entry[0] += duration
+            entry[1] += 1
+        parts = []
+        for name, (duration, count) in totals.items():
+            part = f"{name};dur={duration * 1000:.1f}"
+            if count > 1:
+                part += f';desc="{count} calls"'
+            parts.append(part)
+        if total is not None:
+            parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+    def events(self, name: str, duration: float, args: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Chrome trace "complete" events: the request itself plus every span"""
+        pid = os.getpid()
+        base = self.wall_start * 1e6
+        events = [{
+            "name": name, "cat": "request", "ph": "X", "pid": pid, "tid": self.tid,
+            "ts": round(base, 1), "dur": round(duration * 1e6, 1), "args": args,
+        }]
+        for span_name, offset, span_duration, tid, span_args in self.spans:
+            events.append({
+                "name": span_name, "cat": "stage", "ph": "X", "pid": pid, "tid": tid,
+                "ts": round(base + offset * 1e6, 1), "dur": round(span_duration * 1e6, 1), "args": span_args,
+            })
+        return events
+
+
+def start_trace() -> Trace:
+    """Begin collecting spans for the current request"""
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+
+def detach_trace() -> None:
+    """Stop attributing spans to the request that spawned this task
+
+    Background jobs (prefetch, bank refills) inherit the request's context;
+    they call this first so their stages do not show up in its timings.
+    """
+    _current_trace.set(None)
+
+
+@contextmanager
+def span(name: str, **args: Any) -> Iterator[Dict[str, Any]]:
+    """Time a block as one stage of the current request
+
+    Yields the span's args dict, so the block can attach details that are
+    only known at the end (e.g. which provider answered).
+    """
+    trace = _current_trace.get()
+    if trace is None or trace.closed:
+        yield args
+        return
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        trace.add(name, start, time.perf_counter() - start, args)
+
+
+class TraceWriter:
+    """Appends Chrome trace events to a file from a background thread
+
+    Uses the JSON array format, where the closing bracket is optional, so
+    the file stays loadable while the server is still writing to it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, events: List[Dict[str, Any]]) -> None:
+        self._queue.put(events)
+
+    def _run(self) -> None:
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, "a", encoding="utf-8") as f:
+            if new_file:
+                f.write("[\n")
+            while True:
+                events = self._queue.get()
+                if events is None:
+                    return
+                for event in events:
+                    f.write(json.dumps(event, default=str) + ",\n")
+                f.flush()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+
+def open_trace_file(path: str) -> None:
+    """Start writing request traces to `path` (empty disables; idempotent)"""
+    global _writer
+    if path and _writer is None:
+        _writer = TraceWriter(path)
+
+
+def trace_file_enabled() -> bool:
+    return _writer is not None
+
+
+def write_trace(trace: Trace, name: str, duration: float, **args: Any) -> None:
+    """Queue a finished request's spans for the trace file, if one is open"""
+    if _writer is not None:
+        _writer.write(trace.events(name, duration, args))
+
+
+def close_trace_file() -> None:
+    """Flush pending events and stop the writer thread (called on app shutdown)"""
+    global _writer
+    if _writer is not None:
+        _writer.close()
+        _writer = None
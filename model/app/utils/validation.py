@@ -1,6 +1,11 @@
 from app.models import QuizHistoryItem
+from app.utils.text_processing import clean_option_text
+from app.utils.json_stream import JSONFieldStream
+from app.utils.log import get_logger
 from typing import List
 
+log = get_logger("validation")
+
 def validate_mcq(question_obj):
     """Validate MCQ structure"""
     if not isinstance(question_obj, dict):
@@ -24,3 +29,113 @@ def validate_curriculum(data):
         if str(p.get("difficulty", "")).capitalize() not in valid_diff:
             return False
     return True
+
+QUIZ_REQUIRED_FIELDS = ["question_id", "question_text", "options", "correct_option_index", "hint", "explanation"]
+QUIZ_FIELDS = QUIZ_REQUIRED_FIELDS + ["code_context"]
+
+def validate_quiz_field(field, value):
+    """Validate a single quiz field, raising ValueError on problems
+
+    Shared by validate_quiz_question and the streaming validator, which
+    checks fields as soon as the model finishes writing them.
+    -1 is accepted for correct_option_index (it is auto-corrected later).
+    """
+    if field in ("question_id", "question_text", "hint", "explanation"):
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f"{field} must be a non-empty string")
+
+    elif field == "options":
+        # options validation (exactly 4, all strings)
+        if not isinstance(value, list) or len(value) != 4:
+            raise ValueError("options must be exactly 4 items")
+        if not all(isinstance(opt, str) for opt in value):
+            raise ValueError("all options must be strings")
+
+    elif field == "correct_option_index":
+        # correct_option_index validation (0-3, must be int)
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise ValueError(f"correct_option_index must be an integer, got {type(value).__name__}")
+        if value not in (-1, 0, 1, 2, 3):
+            raise ValueError(f"correct_option_index must be 0-3, got {value}")
+
+    elif field == "code_context":
+        # code_context validation (optional, can be string or null)
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"code_context must be string or null, got {type(value).__name__}")
+
+    else:
+        raise ValueError(f"Unknown field: {field}")
+
+def validate_quiz_question(parsed):
+    """Validate and normalize a generated quiz question (matches quiz_prompt.py schema)
+
+    Raises ValueError describing the first problem so the caller can feed it
+    back to the model on retry. Returns the cleaned question dict.
+    """
+    if not isinstance(parsed, dict):
+        raise ValueError("Response must be a JSON object")
+
+    # Required fields check
+    for field in QUIZ_REQUIRED_FIELDS:
+        if field not in parsed:
+            raise ValueError(f"Missing required field: {field}")
+    for field in parsed:
+        if field not in QUIZ_FIELDS:
+            raise ValueError(f"Unknown field: {field}")
+
+    for field in ("question_id", "question_text", "options"):
+        validate_quiz_field(field, parsed[field])
+
+    # CLEANING: Remove "Option A:", "Option B:" prefixes from options
+    parsed["options"] = [clean_option_text(opt) for opt in parsed["options"]]
+
+    validate_quiz_field("correct_option_index", parsed["correct_option_index"])
+
+    # HARDENING: If model returns -1, auto-correct to 0 (first option)
+    if parsed["correct_option_index"] == -1:
+        log.debug("Model returned -1 for correct_option_index, auto-correcting to 0")
+        parsed["correct_option_index"] = 0
+
+    for field in ("hint", "explanation", "code_context"):
+        validate_quiz_field(field, parsed.get(field))
+
+    return parsed
+
+class QuizStreamValidator:
+    """Validate a quiz completion while it streams from the provider
+
+    `feed` raises ValueError as soon as the output can no longer pass
+    validate_quiz_question: prose before the JSON object, malformed JSON, a
+    fifth option, an unknown field or a field with the wrong type. The caller should then
+    close the stream and retry with the error, without waiting for the
+    rest of the completion.
+    """
+
+    def __init__(self):
+        self.parser = JSONFieldStream()
+
+    def feed(self, chunk):
+        completed = self.parser.feed(chunk)
+        parser = self.parser
+
+        prefix = parser.prefix.strip()
+        if prefix and not _is_code_fence(prefix):
+            raise ValueError("Output must be only the JSON object, found text before it")
+        if parser.error:
+            raise ValueError(f"Malformed JSON: {parser.error}")
+        if parser.current_key == "options" and parser.array_items > 4:
+            raise ValueError("options must be exactly 4 items")
+
+        for field, value in completed:
+            validate_quiz_field(field, value)
+        if parser.done:
+            missing = [f for f in QUIZ_REQUIRED_FIELDS if f not in parser.fields]
+            if missing:
+                raise ValueError(f"Missing required field: {missing[0]}")
+        return completed
+
+def _is_code_fence(text):
+    """True for (a prefix of) a markdown ```json fence, which clean_json_string strips"""
+    fence = "```json"
+    lowered = text.lower()
+    return fence.startswith(lowered) or (lowered.startswith("```") and lowered[3:] in ("", "json"))
@@ -0,0 +1,79 @@
+import asyncio
+from typing import Any, Dict, Optional
+from app.config import get_mongo, WARMUP_RETRY_INTERVAL
+from app.db.mongo import ensure_session_history_indexes
+from app.utils.semantic import encode_texts_async
+from app.utils.log import get_logger
+
+log = get_logger("warmup")
+
+# Components that must be warm before /ready reports ready
+_ready: Dict[str, bool] = {"embedding_model": False, "mongo": False}
+_errors: Dict[str, str] = {}
+_warmup_task: Optional[asyncio.Task] = None
+
+
+async def _warm_embedding_model() -> None:
+    """Load the embedding model and run one encode so the first request is fast"""
+    while True:
+        try:
+            # Runs on the embedding service thread, which then owns the model
+            await encode_texts_async(["warm-up"])
+            _ready["embedding_model"] = True
+            _errors.pop("embedding_model", None)
+            log.info("Embedding model loaded")
+            return
+        except Exception as e:
+            _errors["embedding_model"] = str(e)
+            log.warning("Embedding model warm-up failed: %s", e)
+        await asyncio.sleep(WARMUP_RETRY_INTERVAL)
+
+
+async def _warm_mongo() -> None:
+    """Connect to Mongo and create the session history indexes"""
+    while True:
+        try:
+            await get_mongo().admin.command("ping")
+            await ensure_session_history_indexes()
+            _ready["mongo"] = True
+            _errors.pop("mongo", None)
+            log.info("MongoDB connected")
+            return
+        except Exception as e:
+            _errors["mongo"] = str(e)
+            log.warning("MongoDB warm-up failed: %s", e)
+        await asyncio.sleep(WARMUP_RETRY_INTERVAL)
+
+
+async def _warm_up() -> None:
+    await asyncio.gather(_warm_embedding_model(), _warm_mongo())
+    log.info("Warm-up complete")
+
+
+def start_warmup() -> None:
+    """Warm up the embedding model and Mongo in the background (called on app startup)"""
+    global _warmup_task
+    if _warmup_task is not None and not _warmup_task.done():
+        return
+    _warmup_task = asyncio.create_task(_warm_up())
+
+
+async def stop_warmup() -> None:
+    """Cancel an unfinished warm-up (called on app shutdown)"""
+    global _warmup_task
+    if _warmup_task is None:
+        return
+    _warmup_task.cancel()
+    await asyncio.gather(_warmup_task, return_exceptions=True)
+    _warmup_task = None
+
+
+def readiness() -> Dict[str, Any]:
+    """Readiness summary for the /ready endpoint"""
+    status = {
+        "ready": all(_ready.values()),
+        "components": dict(_ready),
+    }
+    if _errors:
+        status["errors"] = dict(_errors)
+    return status
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""Compare embedding backends: encode latency, RSS and dedup parity
+
+Runs each EMBEDDING_BACKEND in its own process so memory numbers are not
+shared, then checks that every backend makes the same duplicate / not
+duplicate decision as the torch backend at SEMANTIC_THRESHOLD.
+
+    python bench_embeddings.py                      # all backends
+    python bench_embeddings.py torch torch-int8     # a subset
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Questions in the style the quiz prompt produces, with rewordings so that
+# some pairs sit near the threshold.
+QUESTIONS = [
+    "What is the difference between a list and a tuple in Python?",
+    "How does a Python list differ from a tuple?",
+    "Which keyword is used to define a generator function in Python?",
+    "What does the yield statement do inside a Python function?",
+    "What is the purpose of the __init__ method in a Python class?",
+    "Why would you define __init__ in a class?",
+    "How do you handle exceptions in Python?",
+    "Which statement is used to catch an exception raised in a try block?",
+    "What is a decorator in Python?",
+    "How can a function be wrapped to extend its behaviour without modifying it?",
+    "What is the time complexity of looking up a key in a Python dictionary?",
+    "How fast is a dict lookup on average?",
+    "What does the Global Interpreter Lock prevent?",
+    "Why can't Python threads run bytecode in parallel on multiple cores?",
+    "What is the output of len('hello')?",
+    "Which SQL clause filters rows after grouping?",
+    "What is the difference between WHERE and HAVING in SQL?",
+    "In Java, what is the correct way to declare a String?",
+    "What is a closure in JavaScript?",
+    "How does garbage collection work in Java?",
+]
+
+LATENCY_BATCHES = (1, 8, 32)
+LATENCY_REPEATS = 20
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def run_backend(backend: str) -> dict:
+    """Load one backend in this process and measure it"""
+    os.environ["EMBEDDING_BACKEND"] = backend
+    from app.config import get_embedding_model
+    from app.utils.semantic import encode_texts
+
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    get_embedding_model()
+    load_s = time.perf_counter() - start
+
+    encode_texts(QUESTIONS[:4])  # warm-up
+    latency_ms = {}
+    for batch in LATENCY_BATCHES:
+        texts = (QUESTIONS * (batch // len(QUESTIONS) + 1))[:batch]
+        start = time.perf_counter()
+        for _ in range(LATENCY_REPEATS):
+            encode_texts(texts)
+        latency_ms[batch] = (time.perf_counter() - start) / LATENCY_REPEATS * 1000
+
+    matrix = encode_texts(QUESTIONS)
+    return {
+        "backend": backend,
+        "load_s": load_s,
+        "rss_mb": _rss_mb(),
+        "model_rss_mb": _rss_mb() - rss_before,
+        "latency_ms": latency_ms,
+        "similarity": (matrix @ matrix.T).tolist(),
+    }
+
+
+def main(backends):
+    from app.config import SEMANTIC_THRESHOLD
+    from app.utils.embeddings import EMBEDDING_BACKENDS
+
+    backends = backends or list(EMBEDDING_BACKENDS)
+    results = {}
+    for backend in backends:
+        proc = subprocess.run(
+            [sys.executable, __file__, "--worker", backend],
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            print(f"[{backend}] FAILED:\n{proc.stderr.strip()[-1000:]}")
+            continue
+        results[backend] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    print("=" * 80)
+    print(f"{'backend':<12}{'load s':>8}{'RSS MB':>9}{'model MB':>10}" + "".join(f"{f'b={b} ms':>11}" for b in LATENCY_BATCHES))
+    for backend, r in results.items():
+        print(
+            f"{backend:<12}{r['load_s']:>8.2f}{r['rss_mb']:>9.0f}{r['model_rss_mb']:>10.0f}"
+            + "".join(f"{r['latency_ms'][str(b)]:>11.2f}" for b in LATENCY_BATCHES)
+        )
+
+    reference = results.get("torch")
+    if reference is None:
+        print("\nParity skipped: the torch backend did not run")
+        return 0
+
+    print("=" * 80)
+    print(f"Dedup parity vs torch at SEMANTIC_THRESHOLD={SEMANTIC_THRESHOLD}")
+    n = len(QUESTIONS)
+    pairs = [(i, j) for i in range(n) for j in range(i + 1, n)]
+    failed = False
+    for backend, r in results.items():
+        if backend == "torch":
+            continue
+        flips = []
+        max_diff = 0.0
+        for i, j in pairs:
+            ref, sim = reference["similarity"][i][j], r["similarity"][i][j]
+            max_diff = max(max_diff, abs(ref - sim))
+            if (ref >= SEMANTIC_THRESHOLD) != (sim >= SEMANTIC_THRESHOLD):
+                flips.append((i, j, ref, sim))
+        status = "✓ unchanged" if not flips else f"❌ {len(flips)} decision(s) changed"
+        print(f"{backend:<12} max |Δcos| = {max_diff:.4f}  {status}")
+        for i, j, ref, sim in flips:
+            print(f"    {ref:.3f} -> {sim:.3f}: {QUESTIONS[i]!r} / {QUESTIONS[j]!r}")
+        failed = failed or bool(flips)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--worker":
+        print(json.dumps(run_backend(sys.argv[2])))
+    else:
+        sys.exit(main(sys.argv[1:]))
@@ -1,7 +1,27 @@
+import logging
+import os
+import time
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.routes import mcq, curriculum, quiz, statistics, next_level, topics
+from app.config import PREFETCH_CACHE, PREFETCH_EXECUTOR, RESPONSE_CACHE, LLM_ROUTER, GENERATION_STATS, LLM_STRUCTURED_OUTPUT
+from app.config import LOG_LEVEL, LOG_FORMAT, LOG_PAYLOAD_SAMPLE_RATE, LOG_PAYLOAD_CHARS, TRACE_SERVER_TIMING, TRACE_FILE
+from app.db.mongo import wait_for_pending_writes
+from app.utils.llm_client import close_clients
+from app.utils.question_bank import start_question_bank_workers, stop_question_bank_workers
+from app.utils.semantic import EMBEDDING_SERVICE
+from app.utils.warmup import start_warmup, stop_warmup, readiness
+from app.utils import metrics
+from app.utils.log import setup_logging, shutdown_logging, get_logger, bind_request
+from app.utils.tracing import start_trace, write_trace, open_trace_file, close_trace_file, trace_file_enabled
+
+# Queue-backed logging; set up before the app so startup messages are kept
+setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_PAYLOAD_SAMPLE_RATE, LOG_PAYLOAD_CHARS)
+access_log = get_logger("access")
+log = get_logger("main")
+open_trace_file(TRACE_FILE)
 
 # Initialize FastAPI app
 app = FastAPI(title="Adaptive Quiz Engine", version="1.0.0")
@@ -17,6 +37,60 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ==========================================
+# REQUEST METRICS, ACCESS LOG AND TRACING
+# ==========================================
+# Probes and scrapes log their access line at DEBUG only and are not traced
+QUIET_ROUTES = {"/health", "/ready", "/metrics"}
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Observe request latency for /metrics and write one access log line
+
+    Every log record of the request carries its request_id (taken from
+    X-Request-ID when the caller sends one) and, once a route binds it,
+    the session_id. Stage spans go to the Server-Timing header and the
+    trace file; for streaming responses they cover the time to headers.
+    """
+    context = bind_request(request.headers.get("x-request-id"))
+    trace = start_trace() if TRACE_SERVER_TIMING or trace_file_enabled() else None
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = context["request_id"]
+        if trace is not None and TRACE_SERVER_TIMING:
+            response.headers["Server-Timing"] = trace.server_timing(time.perf_counter() - start)
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        router = route.strip("/").split("/")[0] or "root"
+        metrics.HTTP_REQUEST_SECONDS.observe(elapsed, router, route, request.method, str(status))
+        if trace is not None:
+            trace.closed = True
+            if route not in QUIET_ROUTES:
+                write_trace(
+                    trace, f"{request.method} {route}", elapsed,
+                    request_id=context["request_id"], session_id=context["session_id"], status=status,
+                )
+        access_log.log(
+            logging.DEBUG if route in QUIET_ROUTES else logging.INFO,
+            "%s %s %d %.1fms", request.method, request.url.path, status, elapsed * 1000,
+            extra={"route": route},
+        )
+
+def _cache_samples():
+    """Cache counters for /metrics, read from the caches' own stats()"""
+    for name, cache in (("prefetch", PREFETCH_CACHE), ("response", RESPONSE_CACHE)):
+        stats = cache.stats()
+        yield "cache_hits_total", "counter", "Cache hits", {"cache": name}, stats["hits"]
+        yield "cache_misses_total", "counter", "Cache misses", {"cache": name}, stats["misses"]
+        yield "cache_entries", "gauge", "Entries currently cached", {"cache": name}, stats["size"]
+
+metrics.register_collector(_cache_samples)
+
 # ==========================================
 # INCLUDE ROUTERS
 # ==========================================
@@ -27,6 +101,36 @@ app.include_router(statistics.router)
 app.include_router(next_level.router)
 app.include_router(topics.router)
 
+# ==========================================
+# LIFECYCLE
+# ==========================================
+@app.on_event("startup")
+async def startup():
+    # LLM_PROVIDERS may be derived from USE_GROQ / GROQ_API_KEY; say what it became
+    log.info(
+        "LLM providers, most preferred first: %s (%s)",
+        ", ".join(LLM_ROUTER.providers),
+        "LLM_PROVIDERS" if os.getenv("LLM_PROVIDERS", "").strip() else "from USE_GROQ / GROQ_API_KEY",
+    )
+    # Load the embedding model and connect to Mongo without blocking the port bind
+    start_warmup()
+    # Keep question bank buckets above their low-water mark in the background
+    start_question_bank_workers()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await stop_warmup()
+    await PREFETCH_EXECUTOR.shutdown()
+    await stop_question_bank_workers()
+    # Release pooled keep-alive connections to Groq/Ollama
+    await close_clients()
+    EMBEDDING_SERVICE.close()
+    # Let background history writes land before the Mongo client goes away
+    await wait_for_pending_writes()
+    # Flush queued trace events and log records last
+    close_trace_file()
+    shutdown_logging()
+
 # ==========================================
 # HEALTH CHECK
 # ==========================================
@@ -34,6 +138,37 @@ app.include_router(topics.router)
 async def health():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 503 until the embedding model and Mongo are warmed up"""
+    status = readiness()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+@app.get("/cache_stats")
+async def cache_stats():
+    """Hit/miss counters for the in-process caches and background pools"""
+    return {
+        "response_cache": RESPONSE_CACHE.stats(),
+        "prefetch_cache": PREFETCH_CACHE.stats(),
+        "prefetch_executor": PREFETCH_EXECUTOR.stats(),
+        "embedding_service": EMBEDDING_SERVICE.stats(),
+    }
+
+@app.get("/llm_providers")
+async def llm_providers():
+    """LLM router state: per-backend latency, error rate and circuit state"""
+    return LLM_ROUTER.snapshot()
+
+@app.get("/generation_stats")
+async def generation_stats():
+    """LLM attempts per successful generation, by route"""
+    return {"structured_output": LLM_STRUCTURED_OUTPUT, "routes": GENERATION_STATS.stats()}
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus text exposition of latency histograms and counters"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # ==========================================
 # MAIN EXECUTION
 # ==========================================
@@ -0,0 +1,56 @@
+import hashlib
+
+import numpy as np
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import app.config as config
+
+EMBEDDING_DIM = 384
+
+
+class StubEmbeddingModel:
+    """Deterministic stand-in for the SentenceTransformer
+
+    Each text maps to a fixed random direction. "<text> ~<k>" is a
+    paraphrase: the direction of <text> plus a small perturbation seeded
+    by k, so paraphrases score high cosine similarity with their base.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM, noise: float = 0.35):
+        self.dim = dim
+        self.noise = noise
+
+    def _direction(self, text: str) -> np.ndarray:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        return np.random.default_rng(seed).standard_normal(self.dim)
+
+    def _vector(self, text: str) -> np.ndarray:
+        base, sep, variant = text.rpartition(" ~")
+        if not sep:
+            return self._direction(text)
+        return self._direction(base) + self.noise * self._direction(f"~{variant}")
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts, normalize_embeddings: bool = False):
+        vectors = np.vstack([self._vector(text) for text in texts])
+        if normalize_embeddings:
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors
+
+
+@pytest.fixture
+def stub_embedding_model(monkeypatch):
+    model = StubEmbeddingModel()
+    monkeypatch.setattr(config, "_embedding_model", model)
+    return model
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """In-memory Mongo client shared through app.config.get_mongo"""
+    client = AsyncMongoMockClient()
+    monkeypatch.setattr(config, "_mongo", client)
+    return client
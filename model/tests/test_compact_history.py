@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from app.utils.quiz_logic import compact_history, estimate_tokens
+
+
+def _history(count: int, length: int = 60):
+    # Zero-padded index first so every stem is distinct and sortable
+    return [{"question_text": f"Q{i:03d} " + "x" * (length - 5)} for i in range(count)]
+
+
+def test_estimate_tokens_is_about_four_chars_per_token():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("abcd" * 25) == 26
+
+
+def test_short_history_is_kept_whole():
+    history = _history(3)
+    stems = json.loads(compact_history(history, token_budget=1000))
+    assert stems == [h["question_text"] for h in history]
+
+
+@pytest.mark.parametrize("budget", [20, 50, 120, 400])
+def test_budget_respected_and_newest_kept(budget):
+    history = _history(40)
+    rendered = compact_history(history, token_budget=budget)
+    assert estimate_tokens(rendered) <= budget
+
+    stems = json.loads(rendered)
+    marker, kept = stems[0], stems[1:]
+    assert kept == [h["question_text"] for h in history[len(history) - len(kept):]]
+    assert marker == f"({len(history) - len(kept)} older questions omitted)"
+
+
+def test_omitted_count_is_exact():
+    history = _history(10)
+    per_stem = estimate_tokens(json.dumps(history[0]["question_text"]))
+    # Room for the brackets, the marker and exactly four stems
+    marker_cost = estimate_tokens(json.dumps("(6 older questions omitted)"))
+    stems = json.loads(compact_history(history, token_budget=2 + marker_cost + 4 * per_stem))
+    assert stems[0] == "(6 older questions omitted)"
+    assert stems[1:] == [h["question_text"] for h in history[6:]]
+
+
+def test_stems_truncated_and_whitespace_collapsed():
+    history = [{"question_text": "What  does\n    this print?\n" + "y" * 200}, {"question_text": "  "}]
+    stems = json.loads(compact_history(history, token_budget=1000, stem_chars=40))
+    assert stems == ["What does this print? " + "y" * 15 + "..."]
+    assert len(stems[0]) == 40
@@ -0,0 +1,76 @@
+import asyncio
+
+import numpy as np
+
+from app.config import SEMANTIC_THRESHOLD
+from app.utils.semantic import (
+    build_history_matrix,
+    exact_repeat,
+    score_candidates,
+    score_candidates_async,
+    semantic_repeat,
+)
+
+HISTORY = [{"question_text": "What is a Python list?"}, {"question_text": "How do you open a file?"}]
+CANDIDATES = [
+    "What is a Python list? ~1",      # paraphrase of history row 0
+    "What does yield do?",            # new
+    "What does yield do? ~2",         # paraphrase of the candidate before it
+    "  how do you OPEN a file?",      # exact repeat of history row 1 (normalized)
+    "What is a decorator?",           # distinct, kept
+]
+
+
+def _score(**kwargs):
+    return score_candidates(CANDIDATES, HISTORY, build_history_matrix(HISTORY), **kwargs)
+
+
+def test_history_and_within_batch_duplicates(stub_embedding_model):
+    result = _score()
+
+    assert result.exact.tolist() == [False, False, False, True, False]
+    assert result.semantic.tolist() == [True, False, True, False, False]
+    assert result.duplicate.tolist() == [True, False, True, True, False]
+    # Candidate 2 matches candidate 1, reported after the history rows
+    assert result.matched_index[0] == 0
+    assert result.matched_index[2] == len(HISTORY) + 1
+    assert result.embeddings.shape == (len(CANDIDATES), stub_embedding_model.dim)
+
+
+def test_only_the_later_of_two_batch_duplicates_is_flagged(stub_embedding_model):
+    result = score_candidates(["What does yield do?", "What does yield do? ~1", "what does YIELD do?"], [])
+    assert result.semantic.tolist() == [False, True, False]
+    assert result.exact.tolist() == [False, False, True]
+    assert result.matched_index[1] == 0
+    # The first of the pair has nothing before it to match
+    assert result.matched_index[0] == -1 and result.max_similarity[0] == 0.0
+
+
+def test_without_within_batch_candidates_are_independent(stub_embedding_model):
+    result = _score(within_batch=False)
+    assert result.duplicate.tolist() == [True, False, False, True, False]
+    assert (result.matched_index < len(HISTORY)).all()
+
+
+def test_scores_match_pairwise_helpers(stub_embedding_model):
+    matrix = build_history_matrix(HISTORY)
+    result = _score(within_batch=False)
+    for i, text in enumerate(CANDIDATES):
+        assert result.exact[i] == exact_repeat(text, HISTORY)
+        assert result.semantic[i] == semantic_repeat(text, HISTORY, history_matrix=matrix)
+    assert ((result.max_similarity >= SEMANTIC_THRESHOLD) == result.semantic).all()
+
+
+def test_empty_inputs(stub_embedding_model):
+    empty = score_candidates([], HISTORY)
+    assert empty.duplicate.shape == (0,)
+    no_history = score_candidates(["What is a decorator?"], [], within_batch=False)
+    assert no_history.duplicate.tolist() == [False]
+    assert no_history.matched_index.tolist() == [-1]
+
+
+def test_async_variant_matches(stub_embedding_model):
+    result = asyncio.run(score_candidates_async(CANDIDATES, HISTORY))
+    expected = _score()
+    np.testing.assert_array_equal(result.duplicate, expected.duplicate)
+    np.testing.assert_allclose(result.max_similarity, expected.max_similarity, atol=1e-6)
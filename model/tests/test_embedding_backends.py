@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.config import EMBEDDING_MODEL_NAME, EMBEDDING_ONNX_FILE, SEMANTIC_THRESHOLD
+from app.utils.embeddings import load_embedding_model
+
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("torch")
+
+# Rewordings that dedup must catch, and distinct questions on the same
+# subjects that it must let through
+PARAPHRASES = [
+    ("What is the difference between a list and a tuple in Python?", "How does a Python list differ from a tuple?"),
+    ("What is the purpose of the __init__ method in a Python class?", "What is the __init__ method of a Python class used for?"),
+    ("What is the time complexity of looking up a key in a Python dictionary?", "What is the time complexity of a key lookup in a Python dictionary?"),
+    ("What is the difference between WHERE and HAVING in SQL?", "How does the HAVING clause differ from WHERE in SQL?"),
+    ("How do you handle exceptions in Python?", "How are exceptions handled in Python?"),
+]
+DISTINCT = [
+    ("What is the difference between a list and a tuple in Python?", "Which keyword defines a generator function in Python?"),
+    ("What is a decorator in Python?", "What does the Global Interpreter Lock prevent?"),
+    ("What is the output of len('hello')?", "Which SQL clause filters rows after grouping?"),
+    ("In Java, what is the correct way to declare a String?", "What is a closure in JavaScript?"),
+    ("How does garbage collection work in Java?", "How do you handle exceptions in Python?"),
+]
+PAIRS = PARAPHRASES + DISTINCT
+
+
+def _model_available() -> bool:
+    """The parity check never downloads: it needs the model on disk already"""
+    if os.path.isdir(EMBEDDING_MODEL_NAME):
+        return True
+    from huggingface_hub import try_to_load_from_cache
+
+    repo_id = EMBEDDING_MODEL_NAME if "/" in EMBEDDING_MODEL_NAME else f"sentence-transformers/{EMBEDDING_MODEL_NAME}"
+    return isinstance(try_to_load_from_cache(repo_id, "config.json"), str)
+
+
+def _similarities(model) -> np.ndarray:
+    left = model.encode([a for a, _ in PAIRS], normalize_embeddings=True)
+    right = model.encode([b for _, b in PAIRS], normalize_embeddings=True)
+    return np.sum(np.asarray(left, dtype=np.float32) * np.asarray(right, dtype=np.float32), axis=1)
+
+
+@pytest.fixture(scope="module")
+def torch_similarities():
+    if not _model_available():
+        pytest.skip(f"{EMBEDDING_MODEL_NAME} is not in the local Hugging Face cache")
+    return _similarities(load_embedding_model("torch", EMBEDDING_MODEL_NAME))
+
+
+def test_torch_backend_separates_fixture_pairs(torch_similarities):
+    # Guards the fixture itself: every pair must sit on its intended side
+    duplicate = torch_similarities >= SEMANTIC_THRESHOLD
+    assert duplicate.tolist() == [True] * len(PARAPHRASES) + [False] * len(DISTINCT)
+
+
+@pytest.mark.parametrize("backend", ["torch-int8", "onnx"])
+def test_backend_matches_torch_dedup_decisions(backend, torch_similarities):
+    if backend == "onnx":
+        pytest.importorskip("optimum")
+        pytest.importorskip("onnxruntime")
+
+    similarities = _similarities(load_embedding_model(backend, EMBEDDING_MODEL_NAME, EMBEDDING_ONNX_FILE))
+
+    flips = [
+        (a, b, float(ref), float(sim))
+        for (a, b), ref, sim in zip(PAIRS, torch_similarities, similarities)
+        if (ref >= SEMANTIC_THRESHOLD) != (sim >= SEMANTIC_THRESHOLD)
+    ]
+    assert flips == []
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from app.utils.embeddings import EmbeddingBatcher
+
+
+class RecordingEncoder:
+    """encode_fn that returns one row per text: [index of the text, its length]"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+        self.threads = set()
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        self.threads.add(threading.get_ident())
+        if self.fail:
+            raise RuntimeError("model crashed")
+        return np.array([[int(text.split()[-1]), len(text)] for text in texts], dtype=np.float32).reshape(-1, 2)
+
+
+def _texts(caller, count):
+    return [f"caller {caller} text {caller * 100 + i}" for i in range(count)]
+
+
+def _run(batcher, sizes):
+    async def run():
+        try:
+            return await asyncio.gather(*(batcher.encode(_texts(c, n)) for c, n in enumerate(sizes)), return_exceptions=True)
+        finally:
+            batcher.close()
+
+    return asyncio.run(run())
+
+
+def test_concurrent_calls_share_one_model_call():
+    encoder = RecordingEncoder()
+    batcher = EmbeddingBatcher(encoder, max_wait_ms=20, max_batch=64)
+
+    results = _run(batcher, [1, 3, 2])
+
+    assert len(encoder.calls) == 1
+    assert encoder.calls[0] == _texts(0, 1) + _texts(1, 3) + _texts(2, 2)
+    # Model runs on the worker thread, not the event loop's
+    assert threading.get_ident() not in encoder.threads
+    for caller, (result, size) in enumerate(zip(results, [1, 3, 2])):
+        assert result[:, 0].tolist() == [caller * 100 + i for i in range(size)]
+    assert batcher.stats() == {"requests": 3, "batches": 1, "texts": 6, "avg_batch": 6.0}
+
+
+def test_batch_is_flushed_at_max_batch():
+    encoder = RecordingEncoder()
+    # The timer would never fire within the test; only the size limit flushes
+    batcher = EmbeddingBatcher(encoder, max_wait_ms=60_000, max_batch=4)
+
+    async def run():
+        try:
+            first = [asyncio.ensure_future(batcher.encode(_texts(c, 2))) for c in range(2)]
+            await asyncio.wait_for(asyncio.gather(*first), timeout=1)
+            assert len(encoder.calls) == 1 and len(encoder.calls[0]) == 4
+            # A single call larger than the batch is not split
+            big = await asyncio.wait_for(batcher.encode(_texts(5, 6)), timeout=1)
+            assert big.shape == (6, 2)
+        finally:
+            batcher.close()
+
+    asyncio.run(run())
+    assert [len(call) for call in encoder.calls] == [4, 6]
+
+
+def test_lone_call_is_flushed_by_the_timer():
+    encoder = RecordingEncoder()
+    batcher = EmbeddingBatcher(encoder, max_wait_ms=1, max_batch=64)
+    (result,) = _run(batcher, [2])
+    assert result[:, 0].tolist() == [0, 1]
+    assert len(encoder.calls) == 1
+
+
+def test_empty_call_skips_batching():
+    encoder = RecordingEncoder()
+    batcher = EmbeddingBatcher(encoder, max_wait_ms=60_000, max_batch=64)
+    (result,) = _run(batcher, [0])
+    assert result.shape == (0, 2)
+    assert batcher.stats()["batches"] == 0
+
+
+def test_model_error_reaches_every_waiting_caller():
+    encoder = RecordingEncoder(fail=True)
+    batcher = EmbeddingBatcher(encoder, max_wait_ms=5, max_batch=64)
+
+    async def run():
+        try:
+            calls = asyncio.gather(*(batcher.encode(_texts(c, 2)) for c in range(3)), return_exceptions=True)
+            return await asyncio.wait_for(calls, timeout=2)
+        finally:
+            batcher.close()
+
+    results = asyncio.run(run())
+    assert len(encoder.calls) == 1
+    assert all(isinstance(result, RuntimeError) and str(result) == "model crashed" for result in results)
+
+
+def test_batcher_recovers_after_a_failed_batch():
+    encoder = RecordingEncoder(fail=True)
+    batcher = EmbeddingBatcher(encoder, max_wait_ms=1, max_batch=64)
+
+    async def run():
+        try:
+            with pytest.raises(RuntimeError):
+                await batcher.encode(_texts(0, 1))
+            encoder.fail = False
+            return await asyncio.wait_for(batcher.encode(_texts(1, 1)), timeout=1)
+        finally:
+            batcher.close()
+
+    assert asyncio.run(run())[:, 0].tolist() == [100]
@@ -0,0 +1,80 @@
+import numpy as np
+
+from app.config import SEMANTIC_THRESHOLD
+from app.utils.semantic import (
+    build_history_matrix,
+    embedding_from_binary,
+    embedding_to_binary,
+    encode_texts,
+    score_candidates,
+    semantic_repeat,
+)
+
+# Cosine scores from float16-stored history may drift from float32 by this much
+COSINE_TOLERANCE = 2e-3
+
+HISTORY = [f"history question {i}" for i in range(40)]
+# Paraphrases of history items (near the threshold) and unrelated questions
+CANDIDATES = [f"history question {i} ~{k}" for i in range(0, 40, 3) for k in range(3)] + [
+    f"new question {i}" for i in range(20)
+]
+
+
+def _stored_history_matrix():
+    stored = [embedding_from_binary(embedding_to_binary(e)) for e in encode_texts(HISTORY)]
+    return build_history_matrix([{"question_text": q} for q in HISTORY], stored)
+
+
+def test_float16_roundtrip_size_and_dtype(stub_embedding_model):
+    embedding = encode_texts(["what is a tuple?"])[0]
+    data = embedding_to_binary(embedding)
+    assert len(data) == 2 * stub_embedding_model.dim
+    restored = embedding_from_binary(data)
+    assert restored.dtype == np.float32
+    np.testing.assert_allclose(restored, embedding, atol=1e-3)
+
+
+def test_float16_scores_match_float32(stub_embedding_model):
+    history = [{"question_text": q} for q in HISTORY]
+    float32_matrix = build_history_matrix(history)
+    float16_matrix = _stored_history_matrix()
+    candidate_embeddings = encode_texts(CANDIDATES)
+
+    exact = score_candidates(CANDIDATES, history, float32_matrix, candidate_embeddings, within_batch=False)
+    stored = score_candidates(CANDIDATES, history, float16_matrix, candidate_embeddings, within_batch=False)
+
+    np.testing.assert_allclose(stored.max_similarity, exact.max_similarity, atol=COSINE_TOLERANCE)
+    np.testing.assert_array_equal(stored.matched_index, exact.matched_index)
+
+    full32 = candidate_embeddings @ float32_matrix.T
+    full16 = candidate_embeddings @ float16_matrix.T
+    assert np.abs(full16 - full32).max() < COSINE_TOLERANCE
+
+
+def test_float16_dedup_verdicts_match_float32(stub_embedding_model):
+    history = [{"question_text": q} for q in HISTORY]
+    candidate_embeddings = encode_texts(CANDIDATES)
+    exact = score_candidates(CANDIDATES, history, build_history_matrix(history), candidate_embeddings, within_batch=False)
+    stored = score_candidates(CANDIDATES, history, _stored_history_matrix(), candidate_embeddings, within_batch=False)
+
+    # Verdicts may only differ for scores within the tolerance of the threshold
+    clear = np.abs(exact.max_similarity - SEMANTIC_THRESHOLD) > COSINE_TOLERANCE
+    np.testing.assert_array_equal(stored.semantic[clear], exact.semantic[clear])
+    # The fixture exercises both sides of the threshold
+    assert exact.semantic.any() and not exact.semantic.all()
+
+
+def test_stored_history_is_not_re_encoded(stub_embedding_model, monkeypatch):
+    history = [{"question_text": q} for q in HISTORY]
+    stored = [embedding_from_binary(embedding_to_binary(e)) for e in encode_texts(HISTORY)]
+
+    encoded = []
+    encode = stub_embedding_model.encode
+    monkeypatch.setattr(stub_embedding_model, "encode", lambda texts, **kw: encoded.extend(texts) or encode(texts, **kw))
+
+    matrix = build_history_matrix(history, stored)
+    assert encoded == []
+    # Every retry only pays for its own candidate
+    for attempt in range(3):
+        semantic_repeat(f"new question {attempt}", history, history_matrix=matrix)
+    assert encoded == ["new question 0", "new question 1", "new question 2"]
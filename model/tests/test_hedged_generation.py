@@ -0,0 +1,128 @@
+import asyncio
+import gc
+import json
+
+import pytest
+
+import app.routes.quiz as quiz
+from app.utils.generation_stats import GenerationStats
+from app.utils.semantic import build_history_matrix
+
+
+def _question(text):
+    return json.dumps({
+        "question_id": text,
+        "question_text": text,
+        "options": ["a", "b", "c", "d"],
+        "correct_option_index": 1,
+        "hint": "hint",
+        "explanation": "explanation",
+        "code_context": None,
+    })
+
+
+class ScriptedLLM:
+    """Stand-in for llm_client.generate: the n-th call sleeps, then answers or raises"""
+
+    def __init__(self, script):
+        self.script = script
+        self.calls = []
+        self.cancelled = []
+
+    async def __call__(self, prompt, temperature=None, tag="LLM", schema=None, **kwargs):
+        n = len(self.calls)
+        self.calls.append(temperature)
+        delay, outcome = self.script[n]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(n)
+            raise
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def stats(monkeypatch, stub_embedding_model):
+    monkeypatch.setattr(quiz, "QUIZ_STREAM_VALIDATION", False)
+    stats = GenerationStats()
+    monkeypatch.setattr(quiz, "GENERATION_STATS", stats)
+    return stats
+
+
+def _hedge(monkeypatch, attempts, budget):
+    monkeypatch.setattr(quiz, "QUIZ_HEDGE_ATTEMPTS", attempts)
+    monkeypatch.setattr(quiz, "QUIZ_HEDGE_BUDGET", budget)
+    monkeypatch.setattr(quiz, "MAX_RETRIES", budget)
+
+
+def _generate(llm, monkeypatch, history=()):
+    """Run generate_question, failing on any exception asyncio could not deliver"""
+    monkeypatch.setattr(quiz, "generate", llm)
+    history = [{"question_text": text} for text in history]
+    unretrieved = []
+
+    async def run():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: unretrieved.append(context))
+        try:
+            return await quiz.generate_question("prompt", history, build_history_matrix(history))
+        finally:
+            await asyncio.sleep(0.05)  # let any straggler finish while the handler is installed
+            gc.collect()
+
+    try:
+        return asyncio.run(run())
+    finally:
+        assert unretrieved == []
+
+
+def test_first_valid_attempt_wins_and_others_are_cancelled(monkeypatch, stats):
+    _hedge(monkeypatch, attempts=3, budget=5)
+    llm = ScriptedLLM([
+        (0.3, _question("slow")),
+        (0.01, _question("fast")),
+        (0.3, RuntimeError("would fail later")),
+    ])
+
+    parsed, attempts, embedding = _generate(llm, monkeypatch)
+
+    assert parsed["question_text"] == "fast"
+    assert attempts == 1 and embedding.shape == (384,)
+    assert sorted(llm.cancelled) == [0, 2]
+    assert stats.stats()["QUIZ"]["attempts"] == 1
+    assert stats.stats()["QUIZ"]["successes"] == 1
+
+
+def test_rejected_attempts_are_replaced_with_higher_temperature(monkeypatch, stats):
+    _hedge(monkeypatch, attempts=2, budget=4)
+    llm = ScriptedLLM([
+        (0.01, "not json"),
+        (0.5, _question("slowest")),
+        (0.02, _question("seen before")),  # exact repeat of history
+        (0.01, _question("new")),
+    ])
+
+    parsed, attempts, _ = _generate(llm, monkeypatch, history=["seen before"])
+
+    assert parsed["question_text"] == "new"
+    # Two rejections before the winner; the in-flight attempt is not counted
+    assert attempts == 3
+    assert llm.calls == pytest.approx([0.4, 0.4, 0.5, 0.6])
+    assert llm.cancelled == [1]
+    assert stats.stats()["QUIZ"]["attempts"] == 3
+
+
+@pytest.mark.parametrize("attempts", [1, 3])
+def test_exhausted_budget_fails_like_sequential_loop(monkeypatch, stats, attempts):
+    _hedge(monkeypatch, attempts=attempts, budget=4)
+    llm = ScriptedLLM([(0.01 * (n % 2), RuntimeError(f"provider down {n}")) for n in range(4)])
+
+    with pytest.raises(RuntimeError, match=r"^Failed after 4 .*provider down"):
+        _generate(llm, monkeypatch)
+
+    assert len(llm.calls) == 4 and llm.cancelled == []
+    assert stats.stats()["QUIZ"] == {
+        "requests": 1, "successes": 0, "failures": 1, "attempts": 4, "retried": 1,
+        "attempts_per_success": None, "retry_rate": 1.0,
+    }
@@ -0,0 +1,31 @@
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# Importing the app must not load the embedding stack; the model is loaded
+# by the startup warm-up instead (app/utils/warmup.py)
+MODEL_DIR = Path(__file__).resolve().parents[1]
+HEAVY_MODULES = ("torch", "sentence_transformers", "sklearn")
+IMPORT_TIME_LIMIT = 10.0
+
+
+def test_import_main_skips_heavy_modules():
+    code = (
+        "import json, sys, main; "
+        f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))"
+    )
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=MODEL_DIR,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    elapsed = time.perf_counter() - start
+
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == []
+    assert elapsed < IMPORT_TIME_LIMIT, f"import main took {elapsed:.1f}s"
@@ -0,0 +1,86 @@
+import json
+import random
+
+import pytest
+
+from app.utils.json_stream import JSONFieldStream
+
+QUESTION = {
+    "question_id": "q-1",
+    "question_text": 'What does print("a\\"b") output? Café \U0001F600',
+    "options": ["a\"b", "a\\\"b", ["nested", [1, 2]], "{not: an object}"],
+    "correct_option_index": 0,
+    "hint": "Escapes: \\n is a newline, \t a tab",
+    "code_context": None,
+    "explanation": "The backslash escapes the quote.",
+}
+
+# Model output: chatter before the object, \uXXXX escapes (including a
+# surrogate pair) and irregular whitespace between tokens
+DOCUMENT = "Sure, here it is:\n" + json.dumps(QUESTION, ensure_ascii=True, indent=1, separators=(" ,", " :  "))
+
+
+def _chunkings(text):
+    rng = random.Random(7)
+    yield "whole", [text]
+    yield "bytes", list(text)
+    for n in range(3):
+        chunks, i = [], 0
+        while i < len(text):
+            step = rng.randint(1, 12)
+            chunks.append(text[i:i + step])
+            i += step
+        yield f"random{n}", chunks
+
+
+def _feed_all(chunks):
+    stream = JSONFieldStream()
+    events = []
+    for chunk in chunks:
+        events.extend(stream.feed(chunk))
+    return stream, events
+
+
+@pytest.mark.parametrize("name,chunks", list(_chunkings(DOCUMENT)))
+def test_fields_are_identical_for_every_chunking(name, chunks):
+    stream, events = _feed_all(chunks)
+
+    assert stream.error is None and stream.done
+    assert stream.prefix == "Sure, here it is:\n"
+    assert events == list(QUESTION.items())
+    assert stream.fields == QUESTION
+
+
+def test_array_items_counts_started_elements():
+    stream = JSONFieldStream()
+    stream.feed('{"options": ["a", ["b", "c"], ')
+    assert stream.current_key == "options" and stream.array_items == 2
+    stream.feed('"d"')
+    assert stream.array_items == 3
+    assert stream.feed("]}") == [("options", ["a", ["b", "c"], "d"])]
+
+
+def test_scalars_before_closing_brace():
+    _, events = _feed_all(['{"a": null,"b":-1.5e3, "c" : true', "}"])
+    assert events == [("a", None), ("b", -1500.0), ("c", True)]
+
+
+@pytest.mark.parametrize("cut", [len(DOCUMENT) // 3, len(DOCUMENT) // 2, DOCUMENT.index("null") + 4, len(DOCUMENT) - 4])
+def test_truncated_document_emits_only_complete_fields(cut):
+    truncated = DOCUMENT[:cut]
+    expected = None
+    for _, chunks in _chunkings(truncated):
+        stream, events = _feed_all(chunks)
+        assert stream.error is None and not stream.done
+        assert all(QUESTION[key] == value for key, value in events)
+        if expected is None:
+            expected = events
+        assert events == expected
+    assert len(expected) < len(QUESTION)
+
+
+@pytest.mark.parametrize("text", ['{"a" 1}', '{"a": 1 "b": 2}', "{a: 1}", '{"a": tru}'])
+def test_malformed_documents_set_error(text):
+    for _, chunks in _chunkings(text):
+        stream, _ = _feed_all(chunks)
+        assert stream.error is not None
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+import app.utils.llm_client as llm_client
+from app.utils import provider_router
+from app.utils.provider_router import ProviderRouter
+
+MODEL_DIR = Path(__file__).resolve().parents[1]
+
+
+def make_router(providers=("ollama", "groq"), failures=3, cooldown=30.0):
+    return ProviderRouter(list(providers), window=10, failure_threshold=failures, cooldown=cooldown, error_penalty=4)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Only the router's clock; asyncio keeps the real one
+    fake = FakeClock()
+    monkeypatch.setattr(provider_router.time, "monotonic", fake)
+    return fake
+
+
+# =========================
+# SCORING AND CIRCUIT STATE
+# =========================
+
+def test_unmeasured_fallback_ranks_after_preferred():
+    router = make_router()
+    assert router.order() == ["ollama", "groq"]
+    router.record("ollama", True, 2.0)
+    assert router.order() == ["ollama", "groq"]
+
+
+def test_faster_backend_ranks_first_and_errors_penalize():
+    router = make_router()
+    router.record("ollama", True, 1.6)
+    router.record("groq", True, 0.5)
+    assert router.order() == ["groq", "ollama"]
+
+    # 0.5s * (1 + 4 * 1/2) = 1.5s still beats 1.6s; 0.5s * (1 + 4 * 2/3) does not
+    router.record("groq", False, error="HTTP 500")
+    assert router.order() == ["groq", "ollama"]
+    router.record("groq", False, error="HTTP 500")
+    assert router.order() == ["ollama", "groq"]
+
+
+def test_circuit_opens_after_consecutive_failures(clock):
+    router = make_router(failures=3)
+    for _ in range(2):
+        router.record("ollama", False, error="timeout")
+    assert router.health["ollama"].state() == "closed"
+    router.record("ollama", False, error="timeout")
+    assert router.health["ollama"].state() == "open"
+    assert router.health["ollama"].circuit_opens == 1
+    # Open backends are still tried, last
+    assert router.order() == ["groq", "ollama"]
+
+
+def test_half_open_allows_one_trial_then_closes(clock):
+    router = make_router(failures=1, cooldown=30)
+    router.record("ollama", False, error="timeout")
+    clock.now += 31
+    health = router.health["ollama"]
+    assert health.state() == "half_open" and health.available()
+
+    router.begin("ollama")
+    assert not health.available()
+    assert router.order()[-1] == "ollama"
+
+    router.record("ollama", True, 0.2)
+    assert health.state() == "closed" and health.available()
+
+
+def test_failed_half_open_trial_reopens(clock):
+    router = make_router(failures=3, cooldown=30)
+    for _ in range(3):
+        router.record("ollama", False, error="timeout")
+    clock.now += 31
+    router.begin("ollama")
+    router.record("ollama", False, error="timeout")
+    assert router.health["ollama"].state() == "open"
+    # Reopening an open circuit is not a new opening
+    assert router.health["ollama"].circuit_opens == 1
+    clock.now += 29
+    assert router.health["ollama"].state() == "open"
+
+
+def test_cancelled_trial_frees_half_open_slot(clock):
+    router = make_router(failures=1)
+    router.record("ollama", False, error="timeout")
+    clock.now += 31
+    router.begin("ollama")
+    router.cancel("ollama")
+    assert router.health["ollama"].available()
+
+
+# =========================
+# FAILOVER THROUGH llm_client
+# =========================
+
+class Backend:
+    """httpx.MockTransport stand-in for one provider"""
+
+    def __init__(self, name, fail=False):
+        self.name = name
+        self.fail = fail
+        self.calls = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        if self.fail:
+            return httpx.Response(503, text="unavailable")
+        body = json.loads(request.content)
+        text = json.dumps({"answer": self.name})
+        if self.name == "groq":
+            if body.get("stream"):
+                chunk = json.dumps({"choices": [{"delta": {"content": text}}]})
+                return httpx.Response(200, content=f"data: {chunk}\n\ndata: [DONE]\n\n".encode())
+            return httpx.Response(200, json={"choices": [{"message": {"content": text}}]})
+        if body.get("stream"):
+            lines = json.dumps({"response": text, "done": False}) + "\n" + json.dumps({"response": "", "done": True}) + "\n"
+            return httpx.Response(200, content=lines.encode())
+        return httpx.Response(200, json={"response": text})
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    router = make_router(failures=2)
+    monkeypatch.setattr(llm_client, "LLM_ROUTER", router)
+    servers = {"ollama": Backend("ollama"), "groq": Backend("groq")}
+    clients = {name: httpx.AsyncClient(transport=httpx.MockTransport(server)) for name, server in servers.items()}
+    monkeypatch.setattr(llm_client, "_clients", clients)
+    return router, servers
+
+
+def test_generate_fails_over_to_next_provider(backends):
+    router, servers = backends
+    servers["ollama"].fail = True
+
+    text = asyncio.run(llm_client.generate("prompt", 0.5))
+
+    assert json.loads(text) == {"answer": "groq"}
+    assert servers["ollama"].calls == 1 and servers["groq"].calls == 1
+    assert router.failovers == 1
+    assert router.health["ollama"].failures == 1
+    assert router.health["groq"].calls == 1
+
+
+def test_open_circuit_routes_around_failing_provider(backends):
+    router, servers = backends
+    servers["ollama"].fail = True
+
+    async def run():
+        for _ in range(3):
+            await llm_client.generate("prompt", 0.5)
+
+    asyncio.run(run())
+    # Two failures open the circuit; the third call goes straight to groq
+    assert servers["ollama"].calls == 2
+    assert servers["groq"].calls == 3
+    assert router.snapshot()["providers"]["ollama"]["state"] == "open"
+    assert llm_client.get_provider_name() == "groq"
+
+
+def test_generate_raises_when_every_provider_fails(backends):
+    router, servers = backends
+    servers["ollama"].fail = servers["groq"].fail = True
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(llm_client.generate("prompt", 0.5))
+    assert router.failovers == 1
+
+
+def test_stream_generate_fails_over_before_first_chunk(backends):
+    router, servers = backends
+    servers["ollama"].fail = True
+
+    async def run():
+        return "".join([chunk async for chunk in llm_client.stream_generate("prompt", 0.5)])
+
+    assert json.loads(asyncio.run(run())) == {"answer": "groq"}
+    assert router.failovers == 1
+
+
+# =========================
+# CONFIG
+# =========================
+
+def test_unknown_provider_name_is_rejected_at_config_load():
+    env = dict(os.environ, LLM_PROVIDERS="ollama,gpt")
+    result = subprocess.run(
+        [sys.executable, "-c", "import app.config"],
+        cwd=MODEL_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert result.returncode != 0
+    assert "Unknown LLM_PROVIDERS entries ['gpt']" in result.stderr
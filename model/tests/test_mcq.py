@@ -0,0 +1,137 @@
+import asyncio
+import json
+import re
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+
+import app.routes.mcq as mcq
+from app.config import MCQ_MAX_QUESTIONS
+
+
+def _mcq(text):
+    return {
+        "question": text,
+        "options": ["a", "b", "c", "d"],
+        "correct_answer": "a",
+        "hint": "hint",
+        "explanation": "explanation",
+    }
+
+
+class ChunkedLLM:
+    """Stand-in for generate: answers each chunk from `script(round, part, n)`"""
+
+    def __init__(self, script):
+        self.script = script
+        self.prompts = []
+
+    async def __call__(self, prompt, temperature=None, **kwargs):
+        self.prompts.append(prompt)
+        n = int(re.search(r"Generate (\d+) unique", prompt).group(1))
+        batch = re.search(r"batch (\d+) of", prompt)
+        part = int(batch.group(1)) if batch else 1
+        retry = "DO NOT REPEAT" in prompt
+        questions = self.script(retry, part, n)
+        if isinstance(questions, Exception):
+            raise questions
+        return json.dumps({"mcqs": [_mcq(text) for text in questions]})
+
+
+def _post(monkeypatch, llm, n, retries=0, chunk_size=5):
+    monkeypatch.setattr(mcq, "generate", llm)
+    monkeypatch.setattr(mcq, "MCQ_CHUNK_RETRIES", retries)
+    monkeypatch.setattr(mcq, "MCQ_CHUNK_SIZE", chunk_size)
+    app = FastAPI()
+    app.include_router(mcq.router)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.post("/mcq/generate_mcq", json={"topic": "Python", "subtopic": "lists", "difficulty": "easy", "n": n})
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("value,expected", [(1, 1), ("7", 7), (MCQ_MAX_QUESTIONS, MCQ_MAX_QUESTIONS)])
+def test_question_count_accepts_integers_in_range(value, expected):
+    assert mcq.parse_question_count(value) == expected
+
+
+@pytest.mark.parametrize("value", [0, -3, MCQ_MAX_QUESTIONS + 1, 2.5, 3.0, True, "many", None, [5]])
+def test_question_count_rejects_everything_else(value):
+    with pytest.raises(HTTPException) as error:
+        mcq.parse_question_count(value)
+    assert error.value.status_code == 422
+
+
+def test_invalid_count_is_rejected_before_any_generation(monkeypatch):
+    llm = ChunkedLLM(lambda retry, part, n: [])
+    response = _post(monkeypatch, llm, MCQ_MAX_QUESTIONS + 1)
+    assert response.status_code == 422
+    assert llm.prompts == []
+
+
+def test_failed_chunk_is_reported(monkeypatch, stub_embedding_model):
+    def script(retry, part, n):
+        if part == 2:
+            return RuntimeError("provider timeout")
+        return [f"chunk {part} question {i}" for i in range(n)]
+
+    response = _post(monkeypatch, ChunkedLLM(script), 12)
+
+    body = response.json()
+    assert response.status_code == 200
+    # Chunks of 5, 5 and 2; the middle one failed
+    assert [q["question"] for q in body["data"]] == [f"chunk 1 question {i}" for i in range(5)] + ["chunk 3 question 0", "chunk 3 question 1"]
+    assert (body["requested"], body["generated"], body["partial"], body["failed_chunks"]) == (12, 7, True, 1)
+
+
+def test_shortfall_from_failed_chunk_is_regenerated(monkeypatch, stub_embedding_model):
+    def script(retry, part, n):
+        if retry:
+            return [f"retry question {i}" for i in range(n)]
+        if part == 2:
+            return RuntimeError("provider timeout")
+        return [f"chunk {part} question {i}" for i in range(n)]
+
+    llm = ChunkedLLM(script)
+    body = _post(monkeypatch, llm, 10, retries=1).json()
+
+    assert (body["generated"], body["partial"], body["failed_chunks"]) == (10, False, 1)
+    assert len(llm.prompts) == 3
+    # The retry round is told what was already accepted
+    assert "chunk 1 question 4" in llm.prompts[-1]
+
+
+def test_duplicates_across_chunks_are_removed(monkeypatch, stub_embedding_model):
+    def script(retry, part, n):
+        if part == 1:
+            return ["What is a list?", "What is a tuple?", "What is a set?"]
+        # An exact repeat (modulo case/whitespace), a paraphrase and a new question
+        return ["what is a LIST? ", "What is a tuple? ~1", "What is a dict?"]
+
+    body = _post(monkeypatch, ChunkedLLM(script), 6, chunk_size=3).json()
+
+    assert [q["question"] for q in body["data"]] == ["What is a list?", "What is a tuple?", "What is a set?", "What is a dict?"]
+    assert (body["generated"], body["partial"], body["semantic_dedup"]) == (4, True, True)
+
+
+def test_encode_failure_falls_back_to_exact_dedup(monkeypatch, stub_embedding_model):
+    async def broken_scoring(*args, **kwargs):
+        raise RuntimeError("embedding model unavailable")
+
+    monkeypatch.setattr(mcq, "score_candidates_async", broken_scoring)
+
+    def script(retry, part, n):
+        if part == 1:
+            return ["What is a list?", "What is a tuple?", "What is a tuple?"]
+        return ["what is a LIST? ", "What is a tuple? ~1", "What is a dict?"]
+
+    response = _post(monkeypatch, ChunkedLLM(script), 6, chunk_size=3)
+
+    body = response.json()
+    assert response.status_code == 200
+    # Exact repeats are still dropped; the paraphrase gets through
+    assert [q["question"] for q in body["data"]] == ["What is a list?", "What is a tuple?", "What is a tuple? ~1", "What is a dict?"]
+    assert (body["partial"], body["semantic_dedup"], body["failed_chunks"]) == (True, False, 0)
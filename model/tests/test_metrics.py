@@ -0,0 +1,130 @@
+import asyncio
+import re
+from collections import defaultdict
+
+import httpx
+import pytest
+
+from app.utils import metrics
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r'\\(.)', lambda m: "\n" if m.group(1) == "n" else m.group(1), value)
+
+
+def parse(text: str):
+    """Text exposition -> (help, type, samples); samples keep file order"""
+    helps, types, samples = {}, {}, []
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            name, _, doc = line[7:].partition(" ")
+            helps[name] = doc
+        elif line.startswith("# TYPE "):
+            name, _, kind = line[7:].partition(" ")
+            types[name] = kind
+        elif line:
+            match = SAMPLE.match(line)
+            assert match, f"bad sample line: {line!r}"
+            name, labels, value = match.groups()
+            pairs = LABEL.findall(labels or "")
+            # Every label must have been consumed by the regex
+            assert (labels or "{}") == "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+            samples.append((name, {k: _unescape(v) for k, v in pairs}, float(value)))
+    return helps, types, samples
+
+
+def check_histograms(types, samples):
+    """Cumulative buckets ending at +Inf, equal to _count, for every series"""
+    checked = 0
+    for family in (name for name, kind in types.items() if kind == "histogram"):
+        buckets, counts, sums = defaultdict(list), {}, {}
+        for name, labels, value in samples:
+            series = tuple(sorted((k, v) for k, v in labels.items() if k != "le"))
+            if name == f"{family}_bucket":
+                buckets[series].append((float(labels["le"]), value))
+            elif name == f"{family}_count":
+                counts[series] = value
+            elif name == f"{family}_sum":
+                sums[series] = value
+        assert buckets.keys() == counts.keys() == sums.keys()
+        for series, rows in buckets.items():
+            bounds = [bound for bound, _ in rows]
+            values = [value for _, value in rows]
+            assert bounds == sorted(bounds) and bounds[-1] == float("inf")
+            assert values == sorted(values)
+            assert values[-1] == counts[series]
+            assert sums[series] >= 0
+            checked += 1
+    return checked
+
+
+def test_scrape_after_request():
+    import main
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            assert (await client.get("/health")).status_code == 200
+            return await client.get("/metrics")
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    helps, types, samples = parse(response.text)
+
+    # Every family with samples is declared, HELP before TYPE before samples
+    for name, _, _ in samples:
+        family = re.sub(r"_(bucket|sum|count)$", "", name) if name not in types else name
+        assert family in types and family in helps
+    assert types["http_request_duration_seconds"] == "histogram"
+    assert types["cache_hits_total"] == "counter"
+    assert check_histograms(types, samples) >= 1
+
+    health = [
+        value for name, labels, value in samples
+        if name == "http_request_duration_seconds_count" and labels["route"] == "/health"
+    ]
+    assert health and health[0] >= 1
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(metrics, "_registry", [])
+    monkeypatch.setattr(metrics, "_collectors", [])
+
+
+def test_histogram_count_sum_and_buckets(registry):
+    histogram = metrics.Histogram("demo_seconds", "Demo latency", ("route",), buckets=(0.1, 1.0, 0.5))
+    observed = [0.05, 0.1, 0.3, 0.7, 2.0, 9.5]
+    for value in observed:
+        histogram.observe(value, "/a")
+
+    helps, types, samples = parse(metrics.render())
+    assert helps == {"demo_seconds": "Demo latency"} and types == {"demo_seconds": "histogram"}
+    assert check_histograms(types, samples) == 1
+    by_name = {(name, labels.get("le")): value for name, labels, value in samples}
+    assert [by_name[("demo_seconds_bucket", le)] for le in ("0.1", "0.5", "1", "+Inf")] == [2, 3, 4, 6]
+    assert by_name[("demo_seconds_count", None)] == len(observed)
+    assert by_name[("demo_seconds_sum", None)] == pytest.approx(sum(observed))
+
+
+def test_label_values_are_escaped(registry):
+    counter = metrics.Counter("demo_total", "Demo counter", ("path",))
+    nasty = 'C:\\temp\n"quoted"'
+    counter.inc(nasty, amount=2)
+    metrics.register_collector(lambda: [("demo_items", "gauge", "Demo gauge", {"name": nasty}, 1.5)])
+
+    text = metrics.render()
+    assert 'demo_total{path="C:\\\\temp\\n\\"quoted\\""} 2' in text
+    # One sample per line: the newline in the value must not break the line
+    _, types, samples = parse(text)
+    assert types == {"demo_total": "counter", "demo_items": "gauge"}
+    assert samples == [("demo_total", {"path": nasty}, 2.0), ("demo_items", {"name": nasty}, 1.5)]
+
+
+def test_wrong_label_count_rejected(registry):
+    counter = metrics.Counter("demo_total", "Demo counter", ("route", "kind"))
+    with pytest.raises(ValueError):
+        counter.inc("/a")
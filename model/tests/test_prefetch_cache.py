@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+import app.routes.quiz as quiz
+from app.models import QuizRequest
+from app.utils.cache import PrefetchCache
+from app.utils.semantic import build_history_matrix, encode_texts
+
+PARAMS = ("python", "basics", 2)
+
+
+@pytest.mark.parametrize("params", [("java", "basics", 2), ("python", "advanced", 2), ("python", "basics", 3)])
+def test_entry_for_other_parameters_is_stale(params):
+    cache = PrefetchCache(max_size=10, ttl_seconds=60)
+    cache.put("s1", PARAMS, "q1")
+    cache.put("s1", PARAMS, "q2")
+
+    assert cache.take("s1", params) is None
+    # The whole queue is dropped, not kept for a later match
+    assert cache.take("s1", PARAMS) is None
+    assert cache.stats()["stale"] == 1
+
+
+def test_entries_are_served_in_order_for_matching_parameters():
+    cache = PrefetchCache(max_size=10, ttl_seconds=60)
+    cache.put("s1", PARAMS, "q1")
+    cache.put("s1", PARAMS, "q2")
+    assert cache.queued("s1", PARAMS) == 2
+    assert [cache.take("s1", PARAMS), cache.take("s1", PARAMS), cache.take("s1", PARAMS)] == ["q1", "q2", None]
+    # A put for new parameters replaces the old queue
+    cache.put("s1", PARAMS, "q3")
+    cache.put("s1", ("python", "basics", 3), "q4")
+    assert cache.queued("s1", PARAMS) == 0
+    assert cache.stats()["stale"] == 0
+
+
+def test_prefetched_question_is_rechecked_against_current_history(stub_embedding_model):
+    history = [{"question_text": f"question {i}"} for i in range(3)]
+    context = quiz.QuizContext(history, build_history_matrix(history), 2)
+
+    def usable(text, correct=1):
+        parsed = {"question_id": text, "question_text": text, "correct_option_index": correct}
+        return quiz.prefetched_question_usable(parsed, encode_texts([text])[0], context)
+
+    assert usable("a new question")
+    assert not usable("Question 1 ")
+    assert not usable("question 2 ~1")
+    assert not usable("a new question", correct=5)
+
+
+def test_prefetch_params_follow_the_adjusted_level():
+    req = QuizRequest(domain_name="python", program_name="basics", level=1)
+    context = quiz.QuizContext([], np.zeros((0, 384), dtype=np.float32), 3)
+    assert quiz.prefetch_params(req, context) == ("python", "basics", 3)
+    assert quiz.request_params(req) == ("python", "basics", 1)
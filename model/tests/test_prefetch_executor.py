@@ -0,0 +1,109 @@
+import asyncio
+
+import httpx
+
+from app.utils.prefetch import PrefetchExecutor
+
+PARAMS = ("python", "basics", 2)
+
+
+def test_second_submit_for_same_session_is_skipped():
+    async def run():
+        executor = PrefetchExecutor(max_workers=2, max_pending=10)
+        release = asyncio.Event()
+        runs = []
+
+        async def job():
+            runs.append(1)
+            await release.wait()
+
+        assert executor.submit("s1", PARAMS, job)
+        assert not executor.submit("s1", PARAMS, job)
+        release.set()
+        await asyncio.sleep(0.01)
+        return executor.stats(), runs
+
+    stats, runs = asyncio.run(run())
+    assert runs == [1]
+    assert (stats["submitted"], stats["skipped"], stats["completed"], stats["running"]) == (1, 1, 1, 0)
+
+
+def test_submit_with_new_parameters_cancels_the_old_job():
+    async def run():
+        executor = PrefetchExecutor(max_workers=2, max_pending=10)
+        assert executor.submit("s1", PARAMS, lambda: asyncio.sleep(10))
+        assert executor.submit("s1", ("python", "basics", 3), lambda: asyncio.sleep(0))
+        await asyncio.sleep(0.01)
+        return executor.stats()
+
+    stats = asyncio.run(run())
+    assert (stats["submitted"], stats["cancelled"], stats["completed"]) == (2, 1, 1)
+
+
+def test_jobs_beyond_max_pending_are_dropped():
+    async def run():
+        executor = PrefetchExecutor(max_workers=1, max_pending=2)
+        results = [executor.submit(f"s{i}", PARAMS, lambda: asyncio.sleep(0.01)) for i in range(4)]
+        await asyncio.sleep(0.05)
+        # Capacity frees up once jobs finish
+        results.append(executor.submit("s9", PARAMS, lambda: asyncio.sleep(0)))
+        await asyncio.sleep(0.01)
+        await executor.shutdown()
+        return results, executor.stats()
+
+    results, stats = asyncio.run(run())
+    assert results == [True, True, False, False, True]
+    assert (stats["submitted"], stats["dropped"], stats["completed"]) == (3, 2, 3)
+
+
+def test_failed_job_is_counted():
+    async def run():
+        executor = PrefetchExecutor(max_workers=1, max_pending=2)
+
+        async def job():
+            raise RuntimeError("LLM down")
+
+        executor.submit("s1", PARAMS, job)
+        await asyncio.sleep(0.01)
+        return executor.stats()
+
+    assert asyncio.run(run())["failed"] == 1
+
+
+def test_cancel_and_wait_show_in_cache_stats(monkeypatch):
+    import main
+
+    executor = PrefetchExecutor(max_workers=1, max_pending=10)
+    monkeypatch.setattr(main, "PREFETCH_EXECUTOR", executor)
+
+    async def run():
+        finished = []
+
+        async def job(name, delay):
+            await asyncio.sleep(delay)
+            finished.append(name)
+
+        # s1 occupies the only worker; s2 is queued behind it
+        executor.submit("s1", PARAMS, lambda: job("s1", 0.05))
+        executor.submit("s2", PARAMS, lambda: job("s2", 0))
+        executor.submit("s3", PARAMS, lambda: job("s3", 10))
+        await asyncio.sleep(0)
+
+        # Same parameters: not cancelled; other parameters: cancelled
+        assert not executor.cancel("s1", PARAMS)
+        assert executor.cancel("s3", ("python", "basics", 3))
+        # A queued job is cancelled instead of waited for, a running one is waited for
+        assert not await executor.wait("s2", PARAMS)
+        assert await executor.wait("s1", PARAMS)
+        assert finished == ["s1"]
+        assert not await executor.wait("s1", PARAMS)
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            response = await client.get("/cache_stats")
+        return response.json()["prefetch_executor"]
+
+    stats = asyncio.run(run())
+    assert stats["awaited"] == 1
+    assert stats["cancelled"] == 2
+    assert stats["completed"] == 1
+    assert stats["running"] == 0
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+import app.utils.question_bank as question_bank
+from app.config import DB_NAME, QUESTION_BANK_COLLECTION
+from app.db.mongo import add_bank_questions
+from app.utils.cache import TTLCache
+from app.utils.semantic import build_history_matrix, encode_texts
+
+BUCKET = ("python", "basics", 2)
+
+
+@pytest.fixture(autouse=True)
+def fresh_bucket_state(monkeypatch):
+    monkeypatch.setattr(question_bank, "QUESTION_BANK_ENABLED", True)
+    monkeypatch.setattr(question_bank, "QUESTION_BANK_MIN_REQUESTS", 2)
+    monkeypatch.setattr(question_bank, "_demand", TTLCache(8, 3600))
+    monkeypatch.setattr(question_bank, "_recently_checked", TTLCache(2, 30))
+
+
+@pytest.fixture
+def scheduled(monkeypatch):
+    """Record refill checks instead of starting them"""
+    calls = []
+    monkeypatch.setattr(question_bank, "schedule_refill", lambda *key, force=False: calls.append(key))
+    return calls
+
+
+def _bank_question(i):
+    return {
+        "question_id": f"q{i}",
+        "question_text": f"bank question {i}",
+        "options": ["a", "b", "c", "d"],
+        "correct_option_index": i % 4,
+        "hint": "",
+        "explanation": "",
+    }
+
+
+async def _stock(count):
+    questions = [_bank_question(i) for i in range(count)]
+    await add_bank_questions(*BUCKET, questions, list(encode_texts([q["question_text"] for q in questions])))
+
+
+async def _serve():
+    return await question_bank.serve_from_bank(*BUCKET, [], build_history_matrix([]))
+
+
+async def _served_counts(mongo):
+    docs = await mongo[DB_NAME][QUESTION_BANK_COLLECTION].find().to_list(None)
+    return {doc["question_id"]: doc["served_count"] for doc in docs}
+
+
+def test_question_only_counts_as_served_when_marked(mongo, stub_embedding_model, scheduled):
+    async def run():
+        await _stock(2)
+
+        question, _ = await _serve()
+        assert question["bank_id"] is not None
+        # Picked (e.g. by a prefetch) but not shown yet
+        assert await _served_counts(mongo) == {"q0": 0, "q1": 0}
+
+        await question_bank.mark_served(question)
+        assert "bank_id" not in question
+        assert await _served_counts(mongo) == {"q0": 1, "q1": 0}
+
+        # Generated questions have no bank_id and are ignored
+        await question_bank.mark_served(_bank_question(9))
+        assert await _served_counts(mongo) == {"q0": 1, "q1": 0}
+
+    asyncio.run(run())
+
+
+def test_refill_waits_for_repeat_demand(mongo, stub_embedding_model, scheduled):
+    async def run():
+        assert await _serve() is None
+        assert scheduled == []
+        assert await _serve() is None
+        assert scheduled == [BUCKET]
+
+    asyncio.run(run())
+
+
+def test_refill_checks_are_throttled_and_bounded(monkeypatch):
+    started = []
+
+    async def refill(*key):
+        started.append(key)
+
+    monkeypatch.setattr(question_bank, "_refill_bucket", refill)
+
+    async def run():
+        for key in [BUCKET, BUCKET, ("python", "basics", 3), ("go", "basics", 1)]:
+            question_bank.schedule_refill(*key)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert started == [BUCKET, ("python", "basics", 3), ("go", "basics", 1)]
+    assert len(question_bank._recently_checked) == 2
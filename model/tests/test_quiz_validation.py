@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import pytest
+
+import app.routes.quiz as quiz
+from app.utils.validation import QuizStreamValidator, validate_quiz_question
+
+QUESTION = {
+    "question_id": "Q-Py-001",
+    "question_text": "Which keyword defines a generator function?",
+    "options": ["yield", "return", "async", "lambda"],
+    "correct_option_index": 0,
+    "hint": "It pauses the function.",
+    "explanation": "A function containing yield is a generator.",
+    "code_context": None,
+}
+
+
+def _document(**changes):
+    question = {key: value for key, value in dict(QUESTION, **changes).items() if value is not ...}
+    return json.dumps(question, indent=2)
+
+
+def _abort_position(text):
+    """Feed one character at a time; return (index, error) of the abort, or (None, None)"""
+    validator = QuizStreamValidator()
+    for i, c in enumerate(text):
+        try:
+            validator.feed(c)
+        except ValueError as e:
+            return i, str(e)
+    return None, None
+
+
+@pytest.mark.parametrize(
+    "changes,abort_after,message",
+    [
+        # Aborted as the fifth option starts, before the array is closed
+        ({"options": ["a", "b", "c", "d", "e"]}, '"d",\n    "', "exactly 4 items"),
+        ({"options": ["a", "b", "c"]}, '"c"\n  ]', "exactly 4 items"),
+        ({"correct_option_index": 7}, '"correct_option_index": 7,', "must be 0-3"),
+        ({"correct_option_index": "0"}, '"correct_option_index": "0"', "must be an integer"),
+        ({"question_text": "  "}, '"question_text": "  "', "question_text must be a non-empty string"),
+        ({"difficulty": "easy"}, '"difficulty": "easy"', "Unknown field: difficulty"),
+        ({"explanation": ...}, "null\n}", "Missing required field: explanation"),
+    ],
+)
+def test_stream_aborts_on_first_invalid_field(changes, abort_after, message):
+    text = _document(**changes)
+    index, error = _abort_position(text)
+
+    assert error is not None and message in error
+    # The abort happens on the character that makes the field invalid
+    assert index == text.index(abort_after) + len(abort_after) - 1
+    # and validate_quiz_question rejects the finished document too
+    with pytest.raises(ValueError):
+        validate_quiz_question(json.loads(text))
+
+
+def test_valid_stream_matches_validate_quiz_question():
+    text = _document()
+    validator = QuizStreamValidator()
+    completed = []
+    for c in text:
+        completed.extend(validator.feed(c))
+
+    assert validator.parser.done
+    assert dict(completed) == validate_quiz_question(json.loads(text)) == QUESTION
+
+
+def test_stream_attempt_closes_provider_stream_on_abort(monkeypatch):
+    text = _document(options=["a", "b", "c", "d", "e"])
+    chunks = [text[i:i + 8] for i in range(0, len(text), 8)]
+    pulled = []
+    closed = []
+
+    async def fake_stream_generate(prompt, temperature, tag="LLM", schema=None):
+        try:
+            for chunk in chunks:
+                pulled.append(chunk)
+                yield chunk
+        finally:
+            closed.append(True)
+
+    monkeypatch.setattr(quiz, "stream_generate", fake_stream_generate)
+
+    with pytest.raises(ValueError, match="exactly 4 items"):
+        asyncio.run(quiz.stream_attempt("prompt", 0.4, 1))
+
+    assert closed == [True]
+    # Nothing after the fifth option was requested from the provider
+    assert len(pulled) < len(chunks)
+    assert '"hint"' not in "".join(pulled)
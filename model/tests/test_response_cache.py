@@ -0,0 +1,140 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+import app.utils.response_cache as response_cache
+from app.utils.cache import SemanticCache
+
+
+def _unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(time, "monotonic", fake)
+    return fake
+
+
+def test_similar_prompt_hits_above_threshold():
+    cache = SemanticCache(max_size=10, ttl_seconds=60, threshold=0.9)
+    cache.put(("topics", "a"), _unit(1, 0, 0), "python topics")
+    cache.put(("topics", "b"), _unit(0, 1, 0), "sql topics")
+
+    value, similarity = cache.get_similar("topics", _unit(1, 0.2, 0))
+    assert value == "python topics" and similarity == pytest.approx(0.98, abs=0.01)
+    assert cache.stats()["hits"] == 0 and cache.semantic_hits == 1
+
+
+def test_prompt_below_threshold_misses():
+    cache = SemanticCache(max_size=10, ttl_seconds=60, threshold=0.9)
+    cache.put(("topics", "a"), _unit(1, 0, 0), "python topics")
+
+    value, similarity = cache.get_similar("topics", _unit(1, 1, 0))
+    assert value is None and similarity == pytest.approx(0.707, abs=0.01)
+    # Other namespaces never match
+    assert cache.get_similar("curriculum", _unit(1, 0, 0)) == (None, 0.0)
+    assert cache.stats()["misses"] == 2
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = SemanticCache(max_size=10, ttl_seconds=60, threshold=0.9)
+    cache.put(("topics", "a"), _unit(1, 0, 0), "python topics")
+
+    clock.now += 59
+    assert cache.get_exact(("topics", "a")) == "python topics"
+    clock.now += 2
+    assert cache.get_exact(("topics", "a")) is None
+    assert cache.get_similar("topics", _unit(1, 0, 0))[0] is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticCache(max_size=2, ttl_seconds=60, threshold=0.9)
+    cache.put(("topics", "a"), _unit(1, 0, 0), "a")
+    cache.put(("topics", "b"), _unit(0, 1, 0), "b")
+    # A semantic hit counts as a use, so "b" is now the oldest
+    assert cache.get_similar("topics", _unit(1, 0, 0))[0] == "a"
+    cache.put(("topics", "c"), _unit(0, 0, 1), "c")
+
+    assert cache.get_exact(("topics", "b")) is None
+    assert cache.get_exact(("topics", "a")) == "a"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lookup_and_store_roundtrip(monkeypatch, stub_embedding_model):
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE", SemanticCache(10, 60, 0.9))
+
+    async def run():
+        miss = await response_cache.lookup_response("topics", "Python basics for beginners")
+        assert miss.value is None
+        response_cache.store_response(miss, {"topics": ["variables"]})
+
+        hit = await response_cache.lookup_response("topics", "  python BASICS for beginners ")
+        assert hit.value == {"topics": ["variables"]}
+        # Callers get a copy they may modify
+        hit.value["topics"].append("loops")
+        again = await response_cache.lookup_response("topics", "Python basics for beginners")
+        assert again.value == {"topics": ["variables"]}
+
+    asyncio.run(run())
+
+
+def test_encode_failure_is_a_cache_miss(monkeypatch):
+    cache = SemanticCache(10, 60, 0.9)
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE", cache)
+
+    async def broken_encode(texts):
+        raise RuntimeError("embedding model unavailable")
+
+    monkeypatch.setattr(response_cache, "encode_texts_async", broken_encode)
+
+    async def run():
+        lookup = await response_cache.lookup_response("topics", "Python basics")
+        assert lookup.value is None
+        response_cache.store_response(lookup, {"topics": []})
+
+    asyncio.run(run())
+    assert len(cache) == 0
+
+
+def test_topics_route_generates_when_the_cache_cannot_embed(monkeypatch):
+    import httpx
+    from fastapi import FastAPI
+    from app.routes import topics
+
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE", SemanticCache(10, 60, 0.9))
+
+    async def broken_encode(texts):
+        raise RuntimeError("embedding model unavailable")
+
+    async def fake_generate(prompt, temperature=None, **kwargs):
+        return '{"main_topic": "Python", "topics": []}'
+
+    monkeypatch.setattr(response_cache, "encode_texts_async", broken_encode)
+    monkeypatch.setattr(topics, "generate", fake_generate)
+    app = FastAPI()
+    app.include_router(topics.router)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.post("/topics/generate_topics", json={"prompt": "Python basics"})
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    assert response.json() == {"status": "success", "data": {"main_topic": "Python", "topics": []}}
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+
+import numpy as np
+import pytest
+
+import app.db.mongo as mongo_db
+from app.config import COLLECTION, DB_NAME, SESSION_HISTORY_COLLECTION
+from app.utils.semantic import embedding_from_binary, embedding_to_binary, encode_texts
+
+BUCKET_SIZE = 3
+
+
+@pytest.fixture(autouse=True)
+def small_buckets(monkeypatch):
+    monkeypatch.setattr(mongo_db, "SESSION_HISTORY_BUCKET_SIZE", BUCKET_SIZE)
+
+
+def _db(client):
+    return client[DB_NAME]
+
+
+def _questions(start, count):
+    return [{"question_text": f"question {i}", "options": ["a", "b", "c", "d"], "correct_option_index": i % 4}
+            for i in range(start, start + count)]
+
+
+async def _save(session_id, start, count):
+    questions = _questions(start, count)
+    await mongo_db.save_questions(session_id, questions, list(encode_texts([q["question_text"] for q in questions])))
+
+
+def test_legacy_history_is_migrated_into_buckets(mongo, stub_embedding_model):
+    legacy = [{"question_text": f"question {i}", "options": ["a", "b", "c", "d"]} for i in range(7)]
+
+    async def run():
+        await _db(mongo)[COLLECTION].insert_one({"session_id": "s1", "history": legacy})
+
+        history = await mongo_db.load_session_history("s1")
+        assert [item["question_text"] for item in history] == [f"question {i}" for i in range(7)]
+
+        session = await _db(mongo)[COLLECTION].find_one({"session_id": "s1"})
+        assert "history" not in session
+        assert session["history_count"] == 7
+        buckets = await _db(mongo)[SESSION_HISTORY_COLLECTION].find({"session_id": "s1"}).sort("bucket", 1).to_list(None)
+        assert [(doc["bucket"], doc["count"]) for doc in buckets] == [(0, 3), (1, 3), (2, 1)]
+
+        # Migrated once; new questions continue the sequence in the partial bucket
+        await _save("s1", 7, 1)
+        history = await mongo_db.load_session_history("s1")
+        assert [item["question_text"] for item in history] == [f"question {i}" for i in range(8)]
+        bucket = await _db(mongo)[SESSION_HISTORY_COLLECTION].find_one({"session_id": "s1", "bucket": 2})
+        assert bucket["count"] == 2
+
+        # Legacy items have no stored embedding
+        _, embeddings = await mongo_db.load_session_history_with_embeddings("s1")
+        assert embeddings[:7] == [None] * 7
+        assert embeddings[7] is not None
+
+    asyncio.run(run())
+
+
+def test_concurrent_reads_migrate_legacy_history_once(mongo, stub_embedding_model):
+    legacy = [{"question_text": f"question {i}"} for i in range(5)]
+
+    async def run():
+        await _db(mongo)[COLLECTION].insert_one({"session_id": "s1", "history": legacy})
+        await asyncio.gather(*(mongo_db.load_session_history("s1") for _ in range(3)))
+        session = await _db(mongo)[COLLECTION].find_one({"session_id": "s1"})
+        assert session["history_count"] == 5
+        history = await mongo_db.load_session_history("s1")
+        assert [item["question_text"] for item in history] == [f"question {i}" for i in range(5)]
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("last_n", [0, 1, 2, 3, 4, 5, 7, 10, 25])
+def test_window_reads_across_bucket_boundaries(mongo, stub_embedding_model, last_n):
+    async def run():
+        # Uneven writes so items of one save straddle bucket boundaries
+        start = 0
+        for count in (2, 4, 1, 3):
+            await _save("s1", start, count)
+            start += count
+
+        history = await mongo_db.load_session_history("s1", last_n=last_n, fields=["question_text"])
+        expected = [f"question {i}" for i in range(10)][-last_n:] if last_n else []
+        assert [item["question_text"] for item in history] == expected
+        assert all(set(item) == {"question_text"} for item in history)
+
+        history, embeddings = await mongo_db.load_session_history_with_embeddings("s1", last_n=last_n)
+        assert len(embeddings) == len(history) == len(expected)
+        for item, embedding in zip(history, embeddings):
+            stored = embedding_from_binary(embedding_to_binary(encode_texts([item["question_text"]])[0]))
+            np.testing.assert_array_equal(embedding, stored)
+
+    asyncio.run(run())
+
+
+def test_save_questions_encodes_missing_embeddings(mongo, stub_embedding_model):
+    async def run():
+        await mongo_db.save_question("s1", "question 0", options=["a", "b", "c", "d"], correct_option_index=1)
+        history, embeddings = await mongo_db.load_session_history_with_embeddings("s1")
+        assert history == [{"question_text": "question 0", "options": ["a", "b", "c", "d"], "correct_option_index": 1}]
+        np.testing.assert_allclose(embeddings[0], encode_texts(["question 0"])[0], atol=1e-3)
+
+    asyncio.run(run())
+
+
+def test_reads_wait_for_background_writes(mongo, stub_embedding_model):
+    async def slow_save():
+        await asyncio.sleep(0.05)
+        await _save("s1", 0, 2)
+
+    async def run():
+        mongo_db.write_in_background("s1", slow_save())
+        history = await mongo_db.load_session_history("s1")
+        assert [item["question_text"] for item in history] == ["question 0", "question 1"]
+        assert "s1" not in mongo_db._pending_writes
+
+    asyncio.run(run())
+
+
+def test_failed_background_write_is_logged_and_released(mongo, stub_embedding_model, caplog):
+    async def failing_save():
+        await asyncio.sleep(0)
+        raise RuntimeError("write refused")
+
+    logger = logging.getLogger("app.mongo")
+    logger.addHandler(caplog.handler)
+    try:
+        async def run():
+            await _save("s1", 0, 1)
+            task = mongo_db.write_in_background("s1", failing_save())
+            # Readers are not failed by the broken write and still see earlier items
+            history = await mongo_db.load_session_history("s1")
+            assert [item["question_text"] for item in history] == ["question 0"]
+            assert task.done() and isinstance(task.exception(), RuntimeError)
+            assert "s1" not in mongo_db._pending_writes
+            await mongo_db.wait_for_pending_writes()
+
+        with caplog.at_level(logging.ERROR, logger="app.mongo"):
+            asyncio.run(run())
+    finally:
+        logger.removeHandler(caplog.handler)
+
+    assert any("write refused" in record.getMessage() for record in caplog.records)
+
+
+def test_quiz_context_dedups_against_whole_session(mongo, stub_embedding_model, monkeypatch):
+    from app.models import QuizRequest
+    from app.routes import quiz
+    from app.utils.semantic import semantic_repeat
+
+    # More history than the prompt window, spread over several buckets
+    monkeypatch.setattr(quiz, "SESSION_HISTORY_WINDOW", 2)
+
+    async def run():
+        await _save("s1", 0, 8)
+        req = QuizRequest(domain_name="python", program_name="basics", level=1)
+        return await quiz.load_quiz_context(req, "s1")
+
+    context = asyncio.run(run())
+
+    assert [h["question_text"] for h in context.combined_history] == [f"question {i}" for i in range(8)]
+    assert all(set(h) == {"question_text"} for h in context.combined_history)
+    assert context.history_matrix.shape[0] == 8
+    # The oldest question is still caught, though the prompt only shows the window
+    assert semantic_repeat("question 0 ~1", context.combined_history, history_matrix=context.history_matrix)
+    prompt = quiz.build_quiz_prompt("python", "basics", 1, context.combined_history)
+    assert "question 7" in prompt and "question 0" not in prompt
@@ -0,0 +1,172 @@
+import asyncio
+import json
+
+import httpx
+import numpy as np
+import pytest
+from fastapi import FastAPI, HTTPException
+from starlette.requests import Request
+
+import app.routes.statistics as statistics
+from app.utils.level_stats import PERCENTILES, group_stats
+
+
+def _test_data(seed: int, count: int = 4) -> dict:
+    rng = np.random.default_rng(seed)
+    return {
+        "domain_name": "Programming",
+        "program_name": "Python",
+        "level": {
+            "level_id": f"L{seed}",
+            "level_name": "Basics",
+            "difficulty_score": 1,
+            "questions": [
+                {
+                    "question_id": f"{seed}-{i}",
+                    "question_text": f"What does snippet {i} print?",
+                    "options": ["1", "2", "3", "4"],
+                    "correct_option_index": 0,
+                    "user_answer_index": int(rng.integers(0, 2)),
+                    "is_correct": bool(rng.integers(0, 2)),
+                    "time_taken_seconds": round(float(rng.uniform(1, 15)), 2),
+                }
+                for i in range(count)
+            ],
+        },
+    }
+
+
+ITEMS = [_test_data(seed) for seed in range(3)]
+NDJSON = b"".join(json.dumps(item).encode() + b"\n" for item in ITEMS)
+
+
+def _request(chunks, content_type="application/x-ndjson") -> Request:
+    messages = [{"type": "http.request", "body": c, "more_body": True} for c in chunks]
+    messages.append({"type": "http.request", "body": b"", "more_body": False})
+
+    async def receive():
+        return messages.pop(0)
+
+    scope = {"type": "http", "method": "POST", "headers": [(b"content-type", content_type.encode())]}
+    return Request(scope, receive)
+
+
+def _read(chunks, **kwargs):
+    return asyncio.run(statistics.read_batch_items(_request(chunks, **kwargs)))
+
+
+@pytest.mark.parametrize("size", [1, 7, 64, len(NDJSON)])
+def test_ndjson_lines_split_across_chunks(size):
+    chunks = [NDJSON[i:i + size] for i in range(0, len(NDJSON), size)]
+    indexes, items, errors = _read(chunks)
+    assert indexes == [0, 1, 2]
+    assert [t.model_dump() for t in items] == ITEMS
+    assert errors == []
+
+
+def test_ndjson_trailing_line_without_newline():
+    body = NDJSON.rstrip(b"\n")
+    indexes, items, _ = _read([body[:100], body[100:]])
+    assert indexes == [0, 1, 2]
+    assert items[-1].level.level_id == "L2"
+
+
+def test_ndjson_invalid_line_becomes_item_error():
+    lines = NDJSON.split(b"\n")
+    body = b"\n".join([lines[0], b"{not json", b"", b'{"domain_name": "x"}', lines[1]])
+    indexes, items, errors = _read([body])
+    # Blank lines are skipped without taking an index
+    assert indexes == [0, 3]
+    assert [e.index for e in errors] == [1, 2]
+    assert [t.level.level_id for t in items] == ["L0", "L1"]
+
+
+def test_too_many_items_is_413(monkeypatch):
+    monkeypatch.setattr(statistics, "STATISTICS_BATCH_MAX_ITEMS", 2)
+    assert len(_read([NDJSON.split(b"\n", 2)[0] + b"\n"] * 2)[1]) == 2
+    with pytest.raises(HTTPException) as excinfo:
+        _read([NDJSON])
+    assert excinfo.value.status_code == 413
+
+    with pytest.raises(HTTPException) as excinfo:
+        _read([json.dumps(ITEMS).encode()], content_type="application/json")
+    assert excinfo.value.status_code == 413
+
+
+def test_json_body_must_be_an_array():
+    for body in (b"{not json", json.dumps(ITEMS[0]).encode()):
+        with pytest.raises(HTTPException) as excinfo:
+            _read([body], content_type="application/json")
+        assert excinfo.value.status_code == 400
+
+
+def _post(content, content_type):
+    app = FastAPI()
+    app.include_router(statistics.router)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.post(
+                "/statistics/analyze_batch",
+                params={"topics": "false"},
+                content=content,
+                headers={"content-type": content_type},
+            )
+
+    return asyncio.run(run())
+
+
+def _chunked(body: bytes, size: int):
+    async def stream():
+        for i in range(0, len(body), size):
+            yield body[i:i + size]
+
+    return stream()
+
+
+def test_endpoint_json_array_and_ndjson_agree():
+    from_json = _post(json.dumps(ITEMS), "application/json")
+    # 50-byte chunks split every line at least once
+    from_ndjson = _post(_chunked(NDJSON, 50), "application/x-ndjson")
+    assert from_json.status_code == from_ndjson.status_code == 200
+    assert from_json.json() == from_ndjson.json()
+    assert [learner["index"] for learner in from_json.json()["learners"]] == [0, 1, 2]
+
+
+def test_endpoint_cohort_percentiles_match_numpy():
+    body = _post(_chunked(NDJSON, 50), "application/x-ndjson").json()
+    cohort = body["cohort"]
+    questions = [q for item in ITEMS for q in item["level"]["questions"]]
+    times = np.array([q["time_taken_seconds"] for q in questions])
+    accuracy = np.array([np.mean([q["is_correct"] for q in item["level"]["questions"]]) * 100 for item in ITEMS])
+    avg_time = np.array([np.mean([q["time_taken_seconds"] for q in item["level"]["questions"]]) for item in ITEMS])
+
+    def expected(values):
+        return {f"p{q}": pytest.approx(round(float(v), 2)) for q, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+    assert cohort["time_percentiles"] == expected(times)
+    assert cohort["accuracy_percentiles"] == expected(accuracy)
+    assert cohort["avg_time_percentiles"] == expected(avg_time)
+    for item, learner in zip(ITEMS, body["learners"]):
+        learner_times = np.percentile([q["time_taken_seconds"] for q in item["level"]["questions"]], PERCENTILES)
+        # Interpolated separately from np.percentile, so allow for the rounding step
+        assert list(learner["time_percentiles"].values()) == pytest.approx(learner_times.tolist(), abs=0.005 + 1e-9)
+
+
+def test_group_time_percentiles_match_numpy():
+    rng = np.random.default_rng(0)
+    counts = np.array([1, 2, 5, 0, 13])
+    group = np.repeat(np.arange(len(counts)), counts)
+    times = rng.uniform(0, 30, size=group.size)
+    stats = group_stats(group, len(counts), np.ones(group.size, dtype=bool), times)
+    for g, count in enumerate(counts):
+        expected = np.percentile(times[group == g], PERCENTILES) if count else np.zeros(len(PERCENTILES))
+        np.testing.assert_allclose(stats["time_percentiles"][g], expected, rtol=1e-12)
+
+
+def test_endpoint_reports_invalid_items():
+    body = NDJSON + b'{"domain_name": "x"}\n'
+    response = _post(body, "application/x-ndjson")
+    assert response.status_code == 200
+    assert [e["index"] for e in response.json()["errors"]] == [3]
+    assert _post(b"{bad}\n", "application/x-ndjson").status_code == 400
@@ -0,0 +1,104 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import app.utils.llm_client as llm_client
+from app.models import QuizQuestionOutput
+from app.utils.provider_router import ProviderRouter
+
+OLD_OLLAMA_ERROR = {"error": "json: cannot unmarshal object into Go struct field GenerateRequest.format of type string"}
+
+
+class Ollama:
+    """MockTransport Ollama that may only understand format "json" (< 0.5)"""
+
+    def __init__(self, schema_support):
+        self.schema_support = schema_support
+        self.formats = []
+
+    def __call__(self, request):
+        body = json.loads(request.content)
+        self.formats.append("schema" if isinstance(body["format"], dict) else body["format"])
+        if isinstance(body["format"], dict) and not self.schema_support:
+            return httpx.Response(400, json=OLD_OLLAMA_ERROR)
+        text = '{"ok": true}'
+        if body["stream"]:
+            lines = [json.dumps({"response": text, "done": False}), json.dumps({"response": "", "done": True})]
+            return httpx.Response(200, content="\n".join(lines).encode())
+        return httpx.Response(200, json={"response": text})
+
+
+@pytest.fixture
+def ollama(monkeypatch):
+    def install(schema_support):
+        server = Ollama(schema_support)
+        monkeypatch.setattr(llm_client, "LLM_ROUTER", ProviderRouter(["ollama"], 10, 3, 30.0, 4))
+        monkeypatch.setattr(llm_client, "_clients", {"ollama": httpx.AsyncClient(transport=httpx.MockTransport(server))})
+        monkeypatch.setattr(llm_client, "LLM_STRUCTURED_OUTPUT", True)
+        monkeypatch.setattr(llm_client, "_ollama_schema_format", True)
+        return server
+
+    return install
+
+
+def _generate(n=1):
+    async def run():
+        return [await llm_client.generate("prompt", 0.5, schema=QuizQuestionOutput) for _ in range(n)]
+
+    return asyncio.run(run())
+
+
+def _stream():
+    async def run():
+        return "".join([chunk async for chunk in llm_client.stream_generate("prompt", 0.5, schema=QuizQuestionOutput)])
+
+    return asyncio.run(run())
+
+
+def test_output_schema_is_inlined_without_titles():
+    schema = llm_client.output_schema(QuizQuestionOutput)
+    assert "$defs" not in json.dumps(schema) and "title" not in schema
+    assert schema["properties"]["options"]["minItems"] == 4
+
+
+def test_current_ollama_gets_the_schema(ollama):
+    server = ollama(schema_support=True)
+    assert _generate(2) == ['{"ok": true}'] * 2
+    assert server.formats == ["schema", "schema"]
+
+
+def test_old_ollama_falls_back_to_json_format(ollama):
+    server = ollama(schema_support=False)
+    assert _generate(2) == ['{"ok": true}'] * 2
+    # Retried once with "json", then "json" straight away
+    assert server.formats == ["schema", "json", "json"]
+    assert llm_client.LLM_ROUTER.failovers == 0
+
+
+def test_old_ollama_falls_back_when_streaming(ollama):
+    server = ollama(schema_support=False)
+    assert _stream() == '{"ok": true}'
+    assert _stream() == '{"ok": true}'
+    assert server.formats == ["schema", "json", "json"]
+
+
+def test_schema_can_be_disabled_by_config(ollama, monkeypatch):
+    server = ollama(schema_support=True)
+    monkeypatch.setattr(llm_client, "_ollama_schema_format", False)
+    _generate()
+    assert server.formats == ["json"]
+
+
+def test_other_client_errors_are_not_retried(ollama, monkeypatch):
+    server = ollama(schema_support=True)
+    monkeypatch.setattr(llm_client, "_clients", {
+        "ollama": httpx.AsyncClient(transport=httpx.MockTransport(
+            lambda request: server.formats.append("schema") or httpx.Response(404, json={"error": "model 'phi3' not found"})
+        )),
+    })
+    with pytest.raises(httpx.HTTPStatusError):
+        _generate()
+    assert server.formats == ["schema"]
+    assert llm_client._ollama_schema_format
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from app.utils.semantic import encode_texts
+from app.utils.topic_analysis import (
+    cluster_embeddings,
+    label_clusters,
+    local_recommendations,
+)
+
+EXCLUDE = "Programming Python"
+BASES = [
+    "In Python programming, what do list comprehension filters return?",
+    "In Python programming, how does a decorator wrap a function?",
+    "In Python programming, when is a generator exhausted?",
+]
+# "<text> ~k" is a stub paraphrase, so each base forms its own group
+TEXTS = [f"{base} ~{k}" for k in range(3) for base in BASES]
+
+
+def test_separable_groups_form_one_cluster_each(stub_embedding_model):
+    labels = cluster_embeddings(encode_texts(TEXTS))
+    assert len(set(labels.tolist())) == len(BASES)
+    # Deterministic, numbered in order of first appearance
+    assert labels.tolist() == [0, 1, 2] * 3
+
+
+def test_labels_skip_domain_and_program_words(stub_embedding_model):
+    labels = cluster_embeddings(encode_texts(TEXTS))
+    names = label_clusters(TEXTS, labels, exclude=EXCLUDE)
+    assert names == ["Comprehension Filters", "Decorator Function", "Exhausted Generator"]
+    for name in names:
+        assert not {"python", "programming"} & set(name.lower().split())
+
+
+def test_single_question_is_one_cluster(stub_embedding_model):
+    labels = cluster_embeddings(encode_texts(BASES[:1]))
+    assert labels.tolist() == [0]
+    assert label_clusters(BASES[:1], labels, exclude=EXCLUDE) == ["Comprehension Filters"]
+
+
+def test_empty_and_wordless_inputs():
+    assert cluster_embeddings(np.zeros((0, 8), dtype=np.float32)).shape == (0,)
+    assert label_clusters([], np.zeros(0, dtype=np.int64)) == []
+    assert label_clusters(["Python?", "Python!"], np.array([0, 1]), exclude=EXCLUDE) == ["Topic 1", "Topic 2"]
+
+
+def _topic(name):
+    return {"topic": name, "confidence": 0.8, "rationale": "3/4 correct (75%), avg 2.0s (fast)"}
+
+
+@pytest.mark.parametrize("accuracy", [0, 45, 70, 95])
+@pytest.mark.parametrize("speed", ["Fast", "Balanced", "Slow"])
+@pytest.mark.parametrize("weak,strong", [
+    ([], []),
+    ([_topic("Generators")], []),
+    ([_topic("Generators"), _topic("Decorators"), _topic("Slicing")], [_topic("Lists")]),
+])
+def test_local_recommendations_always_five(accuracy, speed, weak, strong):
+    recs = local_recommendations({"accuracy_percent": accuracy, "speed_profile": speed}, weak, strong)
+    assert len(recs) == 5
+    assert all(isinstance(r, str) and r for r in recs)
+    assert len(set(recs)) == 5
+    for topic in weak[:2]:
+        assert any(topic["topic"] in r for r in recs)